@@ -2,14 +2,19 @@
 Sistema de Logs de Auditoria para o projeto Beepy
 Registra todas as ações importantes do sistema para compliance e segurança
 """
+import atexit
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional, List
 from functools import wraps
 from flask import request, g
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from utils.jwt_context import current_identity
+from audit_store import AuditStore
 from enum import Enum
 import hashlib
 import uuid
@@ -17,18 +22,189 @@ import uuid
 # Configurar logger específico para auditoria
 audit_logger = logging.getLogger('audit')
 audit_logger.setLevel(logging.INFO)
-
-# Handler para arquivo de auditoria
-audit_handler = logging.FileHandler('logs/audit.log')
-audit_handler.setLevel(logging.INFO)
+# Eventos vão só para o pipeline de auditoria, não para os handlers do root
+audit_logger.propagate = False
 
 # Formatter para logs de auditoria
 audit_formatter = logging.Formatter(
     '%(asctime)s - AUDIT - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S UTC'
 )
-audit_handler.setFormatter(audit_formatter)
-audit_logger.addHandler(audit_handler)
+
+# Pipeline assíncrono: a requisição só enfileira; uma thread grava em lotes
+AUDIT_LOG_DIR = os.environ.get('AUDIT_LOG_DIR', 'logs')
+AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_BATCH_SIZE = 256
+AUDIT_MAX_BYTES = 10 * 1024 * 1024
+AUDIT_BACKUP_COUNT = 10
+# Com a fila cheia, eventos graves esperam até este tempo; os demais são descartados
+AUDIT_BLOCK_SECONDS = 0.05
+BLOCKING_SEVERITIES = ('high', 'critical')
+
+class AuditQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira eventos em fila limitada, descartando os menos graves quando cheia"""
+    
+    def __init__(self, audit_queue: queue.Queue, block_timeout: float = AUDIT_BLOCK_SECONDS):
+        super().__init__(audit_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A mensagem já é o JSON final: formatação fica para a thread de escrita
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if getattr(record, 'audit_severity', None) in BLOCKING_SEVERITIES:
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Grava um lote de registros com um único flush e rotaciona por tamanho entre lotes"""
+    
+    def write_batch(self, records: List[logging.LogRecord]):
+        lines = ''.join(self.format(record) + self.terminator for record in records)
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(lines)
+            self.stream.flush()
+            if self.maxBytes > 0 and self.stream.tell() >= self.maxBytes:
+                self.doRollover()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+class AuditStoreHandler(logging.Handler):
+    """Grava os lotes de eventos no AuditStore (consultas e resumos)"""
+    
+    def __init__(self, store: AuditStore):
+        super().__init__()
+        self.store = store
+    
+    def emit(self, record: logging.LogRecord):
+        self.write_batch([record])
+    
+    def write_batch(self, records: List[logging.LogRecord]):
+        try:
+            self.store.append_many([json.loads(record.getMessage()) for record in records])
+        except Exception:
+            self.handleError(records[-1])
+    
+    def close(self):
+        self.store.close()
+        super().close()
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """QueueListener que entrega aos handlers o que estiver na fila, até batch_size registros"""
+    
+    def __init__(self, audit_queue: queue.Queue, *handlers, batch_size: int = AUDIT_BATCH_SIZE):
+        super().__init__(audit_queue, *handlers)
+        self.batch_size = batch_size
+    
+    def enqueue_sentinel(self):
+        # A fila é limitada: espera espaço em vez de perder o sinal de parada
+        self.queue.put(self._sentinel)
+    
+    def _monitor(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not self._sentinel:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not self._sentinel]
+            if records:
+                for handler in self.handlers:
+                    handler.write_batch(records)
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is self._sentinel:
+                break
+
+class AuditPipeline:
+    """Fila, handler e listener de auditoria de um processo"""
+    
+    def __init__(self, log_dir: str = AUDIT_LOG_DIR, queue_size: int = AUDIT_QUEUE_SIZE,
+                 batch_size: int = AUDIT_BATCH_SIZE, max_bytes: int = AUDIT_MAX_BYTES,
+                 backup_count: int = AUDIT_BACKUP_COUNT, block_timeout: float = AUDIT_BLOCK_SECONDS):
+        os.makedirs(log_dir, exist_ok=True)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = AuditQueueHandler(self.queue, block_timeout)
+        self.file_handler = BatchedRotatingFileHandler(
+            os.path.join(log_dir, 'audit.log'), maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True
+        )
+        self.file_handler.setFormatter(audit_formatter)
+        self.store_handler = AuditStoreHandler(get_audit_store(os.path.join(log_dir, 'audit_store')))
+        self.listener = BatchingQueueListener(self.queue, self.file_handler, self.store_handler,
+                                              batch_size=batch_size)
+        self.pid = os.getpid()
+    
+    def start(self):
+        self.listener.start()
+        audit_logger.addHandler(self.handler)
+    
+    def stop(self):
+        """Grava o que está na fila e fecha o arquivo"""
+        audit_logger.removeHandler(self.handler)
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.file_handler.close()
+        self.store_handler.close()
+    
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self.queue.qsize(), 'dropped': self.handler.dropped}
+
+_stores: Dict[str, AuditStore] = {}
+
+def get_audit_store(directory: str = None) -> AuditStore:
+    """Store de auditoria do diretório (um por processo, compartilhado por escrita e consultas)"""
+    directory = directory or os.path.join(AUDIT_LOG_DIR, 'audit_store')
+    store = _stores.get(directory)
+    if store is None:
+        store = _stores.setdefault(directory, AuditStore(directory))
+    return store
+
+_pipeline: Optional[AuditPipeline] = None
+_pipeline_lock = threading.Lock()
+
+def get_audit_pipeline() -> AuditPipeline:
+    """Pipeline do processo atual (criado no primeiro evento; refeito no filho após fork)"""
+    global _pipeline, _pipeline_lock
+    pipeline = _pipeline
+    if pipeline is not None and pipeline.pid == os.getpid():
+        return pipeline
+    if pipeline is not None:
+        # Herdado do pai: a thread de escrita não existe neste processo
+        audit_logger.removeHandler(pipeline.handler)
+        _pipeline, _pipeline_lock = None, threading.Lock()
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = AuditPipeline()
+            _pipeline.start()
+        return _pipeline
+
+def stop_audit_pipeline():
+    """Grava os eventos pendentes do processo atual (chamado na saída do processo)"""
+    global _pipeline
+    pipeline = _pipeline
+    if pipeline is not None and pipeline.pid == os.getpid():
+        pipeline.stop()
+        _pipeline = None
+
+atexit.register(stop_audit_pipeline)
 
 class AuditEventType(Enum):
     """Tipos de eventos de auditoria"""
@@ -89,19 +265,15 @@ class AuditLogger:
     
     def _get_user_context(self) -> Dict[str, Any]:
         """Obtém contexto do usuário atual"""
-        try:
-            verify_jwt_in_request(optional=True)
-            user_email = get_jwt_identity()
-            
-            if user_email:
-                return {
-                    'user_email': user_email,
-                    'user_id': getattr(g, 'current_user_id', None),
-                    'user_role': getattr(g, 'current_user_role', None),
-                    'authenticated': True
-                }
-        except:
-            pass
+        # Token já verificado no before_request (utils/jwt_context.py)
+        user_email = current_identity()
+        if user_email:
+            return {
+                'user_email': user_email,
+                'user_id': getattr(g, 'current_user_id', None),
+                'user_role': getattr(g, 'current_user_role', None),
+                'authenticated': True
+            }
         
         return {
             'user_email': None,
@@ -128,9 +300,16 @@ class AuditLogger:
     
     def _calculate_checksum(self, data: Dict[str, Any]) -> str:
         """Calcula checksum dos dados para integridade"""
-        data_str = json.dumps(data, sort_keys=True, default=str)
+        data_str = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
         return hashlib.sha256(data_str.encode()).hexdigest()[:16]
     
+    def _serialize(self, data: Dict[str, Any]) -> str:
+        """JSON do evento com o checksum, serializando uma única vez"""
+        # Mesmo texto de _calculate_checksum: o checksum é verificável removendo a chave
+        data_str = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+        checksum = hashlib.sha256(data_str.encode()).hexdigest()[:16]
+        return f'{data_str[:-1]}, "checksum": "{checksum}"}}'
+    
     def log_event(
         self,
         event_type: AuditEventType,
@@ -188,11 +367,9 @@ class AuditLogger:
         if additional_data:
             event_data['additional_data'] = additional_data
         
-        # Calcular checksum para integridade
-        event_data['checksum'] = self._calculate_checksum(event_data)
-        
-        # Log do evento
-        audit_logger.info(json.dumps(event_data, default=str, ensure_ascii=False))
+        # Log do evento (checksum para integridade); a gravação em disco é feita em outra thread
+        get_audit_pipeline()
+        audit_logger.info(self._serialize(event_data), extra={'audit_severity': severity.value})
         
         # Log adicional para eventos críticos
         if severity == AuditSeverity.CRITICAL:
@@ -454,30 +631,8 @@ def get_audit_summary(start_date: datetime = None, end_date: datetime = None) ->
     Returns:
         Dicionário com resumo dos logs
     """
-    # Esta função seria implementada para ler e analisar os logs reais
-    # Por simplicidade, retornamos dados mock
-    return {
-        'total_events': 1500,
-        'events_by_type': {
-            'login_success': 450,
-            'indication_created': 200,
-            'user_updated': 150,
-            'commission_paid': 80,
-            'login_failure': 25
-        },
-        'events_by_severity': {
-            'low': 800,
-            'medium': 600,
-            'high': 90,
-            'critical': 10
-        },
-        'top_users': [
-            {'email': 'admin@beepy.com', 'event_count': 300},
-            {'email': 'embaixadora@teste.com', 'event_count': 250}
-        ],
-        'security_events': 35,
-        'failed_operations': 45
-    }
+    # Dias inteiros vêm dos contadores de cada segmento; só as pontas do período leem eventos
+    return get_audit_store().summary(start_date, end_date)
 
 def search_audit_logs(
     event_type: str = None,
@@ -501,27 +656,29 @@ def search_audit_logs(
     Returns:
         Lista de eventos de auditoria
     """
-    # Esta função seria implementada para buscar nos logs reais
-    # Por simplicidade, retornamos dados mock
+    events = get_audit_store().search(
+        event_type=event_type, user_email=user_email, start_date=start_date,
+        end_date=end_date, severity=severity, limit=limit
+    )
     return [
         {
-            'event_id': 'evt_123',
-            'timestamp': '2024-01-15T10:30:00Z',
-            'event_type': 'user_created',
-            'description': 'Usuário criado - ID: user_456',
-            'severity': 'medium',
-            'user_email': 'admin@beepy.com',
-            'success': True
+            'event_id': event.get('event_id'),
+            'timestamp': event.get('timestamp'),
+            'event_type': event.get('event_type'),
+            'description': event.get('description'),
+            'severity': event.get('severity'),
+            'user_email': (event.get('user_context') or {}).get('user_email'),
+            'success': event.get('success'),
+            'resource': event.get('resource')
         }
+        for event in events
     ]
 
 # Função para configurar diretório de logs
 def setup_audit_logging():
     """Configura sistema de logging de auditoria"""
-    # Criar diretório de logs se não existir
-    os.makedirs('logs', exist_ok=True)
-    
-    # Configurar rotação de logs (implementar se necessário)
+    # Cria o diretório de logs e inicia a thread de escrita (com rotação por tamanho)
+    get_audit_pipeline()
     logging.info("Sistema de auditoria configurado")
 
 # Middleware para logging automático de requisições
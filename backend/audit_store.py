@@ -0,0 +1,282 @@
+"""
+Armazenamento consultável dos eventos de auditoria
+
+Os eventos são gravados só por inserção em segmentos SQLite
+(audit-000001.sqlite3, audit-000002.sqlite3, ...): quando o segmento atual
+chega a segment_max_events, o próximo é criado. Cada segmento tem índices em
+timestamp, event_type, user_email e severity e uma tabela de contadores por
+dia, atualizada na mesma transação dos eventos. Buscas consultam os segmentos
+do mais novo para o mais antigo, pulando os que estão fora do período; resumos
+somam os contadores dos dias inteiros e só consultam eventos nas pontas do
+período.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SEGMENT_MAX_EVENTS = 200000
+SECONDS_PER_DAY = 86400
+
+# Tipos do grupo "Segurança" de AuditEventType
+SECURITY_EVENT_TYPES = ('unauthorized_access', 'rate_limit_exceeded', 'suspicious_activity')
+
+SEGMENT_PATTERN = re.compile(r'^audit-(\d{6})\.sqlite3$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT,
+    ts REAL NOT NULL,
+    event_type TEXT,
+    severity TEXT,
+    user_email TEXT,
+    success INTEGER,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS events_user_ts ON events (user_email, ts);
+CREATE INDEX IF NOT EXISTS events_severity_ts ON events (severity, ts);
+CREATE TABLE IF NOT EXISTS counters (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, kind, key)
+);
+"""
+
+
+def to_epoch(value: Any) -> Optional[float]:
+    """datetime (sem fuso = UTC), string ISO ou número para segundos desde a época"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def day_of(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _event_row(event: Dict[str, Any]) -> Tuple:
+    user_email = (event.get('user_context') or {}).get('user_email')
+    return (
+        event.get('event_id'),
+        to_epoch(event.get('timestamp')) or datetime.now(timezone.utc).timestamp(),
+        event.get('event_type'),
+        event.get('severity'),
+        user_email,
+        1 if event.get('success', True) else 0,
+        json.dumps(event, default=str, ensure_ascii=False)
+    )
+
+
+def _row_counters(row: Tuple) -> Iterable[Tuple[str, str, str]]:
+    """(dia, tipo de contador, chave) somados por um evento"""
+    _, ts, event_type, severity, user_email, success, _ = row
+    day = day_of(ts)
+    yield day, 'type', event_type or ''
+    yield day, 'severity', severity or ''
+    if user_email:
+        yield day, 'user', user_email
+    if not success:
+        yield day, 'failed', ''
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class AuditStore:
+    """Segmentos SQLite de eventos de auditoria em um diretório"""
+
+    def __init__(self, directory: str, segment_max_events: int = SEGMENT_MAX_EVENTS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_max_events = segment_max_events
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_segment: Optional[int] = None
+        self._writer_count = 0
+        self._lock = threading.Lock()
+        # Período (ts mínimo, máximo) dos segmentos já fechados
+        self._closed_ranges: Dict[int, Tuple[Optional[float], Optional[float]]] = {}
+
+    # Segmentos
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f'audit-{number:06d}.sqlite3')
+
+    def segments(self) -> List[int]:
+        """Números dos segmentos existentes, em ordem crescente"""
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _open_writer(self) -> sqlite3.Connection:
+        # Outro processo pode ter criado um segmento mais novo: sempre escreve no último
+        segments = self.segments()
+        number = segments[-1] if segments else 1
+        if self._writer is not None and self._writer_segment == number \
+                and self._writer_count < self.segment_max_events:
+            return self._writer
+        if self._writer is not None:
+            self._writer.close()
+
+        conn = _connect(self._path(number))
+        conn.executescript(SCHEMA)
+        count = conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+        if count >= self.segment_max_events:
+            conn.close()
+            number += 1
+            conn = _connect(self._path(number))
+            conn.executescript(SCHEMA)
+            count = 0
+        self._writer, self._writer_segment, self._writer_count = conn, number, count
+        return conn
+
+    def _segment_range(self, conn: sqlite3.Connection, number: int,
+                       latest: int) -> Tuple[Optional[float], Optional[float]]:
+        if number in self._closed_ranges:
+            return self._closed_ranges[number]
+        result = conn.execute('SELECT MIN(ts), MAX(ts) FROM events').fetchone()
+        if number < latest:
+            self._closed_ranges[number] = result
+        return result
+
+    def _read_segments(self, start: Optional[float], end: Optional[float]):
+        """Conexões de leitura dos segmentos com eventos no período, do mais novo ao mais antigo"""
+        segments = self.segments()
+        for number in reversed(segments):
+            conn = sqlite3.connect(f'file:{self._path(number)}?mode=ro', uri=True, timeout=10)
+            try:
+                low, high = self._segment_range(conn, number, segments[-1])
+                if low is None or (end is not None and low > end) or (start is not None and high < start):
+                    continue
+                yield conn
+            finally:
+                conn.close()
+
+    # Escrita
+
+    def append_many(self, events: List[Dict[str, Any]]) -> None:
+        """Grava eventos e atualiza os contadores em uma transação"""
+        if not events:
+            return
+        rows = [_event_row(event) for event in events]
+        counters = Counter(key for row in rows for key in _row_counters(row))
+        with self._lock:
+            conn = self._open_writer()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO events (event_id, ts, event_type, severity, user_email, success, body) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.executemany(
+                    'INSERT INTO counters (day, kind, key, count) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (day, kind, key) DO UPDATE SET count = count + excluded.count',
+                    [(day, kind, key, count) for (day, kind, key), count in counters.items()])
+            self._writer_count += len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    # Leitura
+
+    def search(self, event_type: str = None, user_email: str = None, start_date: Any = None,
+               end_date: Any = None, severity: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Eventos mais recentes que atendem aos filtros (todos opcionais)"""
+        start, end = to_epoch(start_date), to_epoch(end_date)
+        clauses, params = [], []
+        for column, value in (('event_type', event_type), ('user_email', user_email), ('severity', severity)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('ts <= ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        results: List[Dict[str, Any]] = []
+        for conn in self._read_segments(start, end):
+            remaining = limit - len(results)
+            if remaining <= 0:
+                break
+            rows = conn.execute(
+                f'SELECT body FROM events {where} ORDER BY ts DESC, seq DESC LIMIT ?', params + [remaining])
+            results.extend(json.loads(body) for body, in rows)
+        return results
+
+    def summary(self, start_date: Any = None, end_date: Any = None, top_users: int = 10) -> Dict[str, Any]:
+        """Totais por tipo, severidade e usuário no período"""
+        start, end = to_epoch(start_date), to_epoch(end_date)
+        # Dias inteiros no período vêm dos contadores: [first_day, last_day_exclusive)
+        first_day = None if start is None else -(-start // SECONDS_PER_DAY) * SECONDS_PER_DAY
+        last_day = None if end is None else (end // SECONDS_PER_DAY) * SECONDS_PER_DAY
+        # Pontas que não cobrem um dia inteiro vêm dos eventos
+        partial: List[Tuple[str, List[float]]] = []
+        if first_day is not None and last_day is not None and first_day > last_day:
+            partial.append(('ts >= ? AND ts <= ?', [start, end]))
+        else:
+            if start is not None and start < first_day:
+                partial.append(('ts >= ? AND ts < ?', [start, first_day]))
+            if end is not None:
+                partial.append(('ts >= ? AND ts <= ?', [last_day, end]))
+
+        totals: Dict[str, Counter] = {'type': Counter(), 'severity': Counter(), 'user': Counter(), 'failed': Counter()}
+        for conn in self._read_segments(start, end):
+            if first_day is None or last_day is None or first_day < last_day:
+                day_clauses, day_params = [], []
+                if first_day is not None:
+                    day_clauses.append('day >= ?')
+                    day_params.append(day_of(first_day))
+                if last_day is not None:
+                    day_clauses.append('day < ?')
+                    day_params.append(day_of(last_day))
+                where = f"WHERE {' AND '.join(day_clauses)}" if day_clauses else ''
+                for kind, key, count in conn.execute(
+                        f'SELECT kind, key, SUM(count) FROM counters {where} GROUP BY kind, key', day_params):
+                    totals[kind][key] += count
+
+            for condition, params in partial:
+                rows = conn.execute(
+                    f'SELECT event_type, severity, user_email, success, COUNT(*) FROM events '
+                    f'WHERE {condition} GROUP BY event_type, severity, user_email, success', params)
+                for event_type, severity, user_email, success, count in rows:
+                    totals['type'][event_type or ''] += count
+                    totals['severity'][severity or ''] += count
+                    if user_email:
+                        totals['user'][user_email] += count
+                    if not success:
+                        totals['failed'][''] += count
+
+        return {
+            'total_events': sum(totals['type'].values()),
+            'events_by_type': dict(totals['type']),
+            'events_by_severity': dict(totals['severity']),
+            'top_users': [{'email': email, 'event_count': count}
+                          for email, count in totals['user'].most_common(top_users)],
+            'security_events': sum(totals['type'][event_type] for event_type in SECURITY_EVENT_TYPES),
+            'failed_operations': totals['failed']['']
+        }
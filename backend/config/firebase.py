@@ -1,64 +1,178 @@
 """
 Configuração e inicialização do Firebase Firestore
+
+Um único cliente Firestore por processo, compartilhado por main.py, serviços,
+DatabaseManager e scripts (get_client). O canal gRPC só é aberto na primeira
+chamada e é descartado no processo filho após um fork: com gunicorn o cliente
+é criado e aquecido no hook post_fork (gunicorn.conf.py), nunca no master.
 """
-import os
 import json
-import tempfile
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
 from google.cloud import firestore
-from typing import Optional
+from google.cloud.firestore_v1.services.firestore import client as firestore_client
+from google.cloud.firestore_v1.services.firestore.transports import grpc as firestore_grpc_transport
 
+from utils.metrics import InstrumentedFirestoreAPI
 
-class FirebaseConfig:
-    """Classe para gerenciar a configuração e conexão com Firebase"""
-    
-    def __init__(self):
-        self._db: Optional[firestore.Client] = None
-        self._initialize_firebase()
-    
-    def _initialize_firebase(self) -> None:
-        """Inicializa a conexão com Firebase Firestore"""
+# Arquivos de credenciais locais usados quando o ambiente não configura nenhum
+LOCAL_CREDENTIAL_FILES = [
+    "projeto-beepy-firebase-adminsdk-fbsvc-72fd5c9b0e.json",
+    "projeto-beepy-firebase-adminsdk-fbsvc-45c41daaaf.json",
+]
+
+# Coleção e documento lidos no aquecimento (inexistente: custo de uma leitura)
+WARM_UP_DOCUMENT = ("_warmup", "ping")
+
+
+def channel_options() -> List[Tuple[str, Any]]:
+    """
+    Opções do canal gRPC
+
+    Keepalive mantém a conexão viva entre requisições (proxies e NAT derrubam
+    conexões ociosas); sem limite de tamanho de mensagem, como o padrão da
+    biblioteca. O limite de streams concorrentes é do servidor (100 por
+    conexão), acima das threads de um worker gthread.
+    """
+    return [
+        ("grpc.keepalive_time_ms", int(os.environ.get("FIRESTORE_KEEPALIVE_MS", 30000))),
+        ("grpc.keepalive_timeout_ms", 10000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.max_send_message_length", -1),
+        ("grpc.max_receive_message_length", -1),
+    ]
+
+
+class TunedClient(firestore.Client):
+    """Cliente Firestore com as opções de canal de channel_options() e chamadas instrumentadas"""
+
+    @property
+    def _firestore_api(self):
+        if self._firestore_api_internal is None and self._emulator_host is None:
+            transport_class = firestore_grpc_transport.FirestoreGrpcTransport
+            channel = transport_class.create_channel(
+                self._target, credentials=self._credentials, options=channel_options()
+            )
+            self._transport = transport_class(host=self._target, channel=channel)
+            self._firestore_api_internal = firestore_client.FirestoreClient(
+                transport=self._transport, client_options=self._client_options
+            )
+            firestore_client._client_info = self._client_info
+        api = super()._firestore_api
+        if not isinstance(api, InstrumentedFirestoreAPI):
+            # Leituras, escritas e consultas contadas por requisição (utils/metrics.py)
+            api = self._firestore_api_internal = InstrumentedFirestoreAPI(api)
+        return api
+
+    def drop_channel(self) -> None:
+        """Esquece o canal herdado; o próximo uso abre um novo neste processo"""
+        self._firestore_api_internal = None
+        self._transport = None
+
+
+def load_credentials() -> Tuple[Optional[Any], Optional[str]]:
+    """
+    Credenciais e projeto a partir do ambiente
+
+    GOOGLE_APPLICATION_CREDENTIALS pode conter o JSON da conta de serviço (lido
+    em memória, sem arquivo temporário) ou o caminho do arquivo.
+
+    Returns:
+        (credenciais, projeto); (None, None) para usar o padrão do ambiente
+    """
+    creds = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "")
+    if creds.strip().startswith("{"):
         try:
-            # Verificar se as credenciais estão configuradas via variável de ambiente
-            creds = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-            
-            if creds:
-                # Se for uma string JSON, criar arquivo temporário
-                if isinstance(creds, str) and creds.startswith("{"):
-                    try:
-                        # Validar se é JSON válido
-                        json.loads(creds)
-                        
-                        # Criar arquivo temporário
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                            f.write(creds)
-                            temp_file = f.name
-                        
-                        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file
-                        print("✅ Credenciais Firebase configuradas via variável de ambiente JSON")
-                    except json.JSONDecodeError:
-                        raise ValueError("GOOGLE_APPLICATION_CREDENTIALS não é um JSON válido")
-                else:
-                    print("✅ Credenciais Firebase configuradas via arquivo")
-            
-            # Inicializar cliente Firestore
-            self._db = firestore.Client()
-            print("✅ Firebase Firestore conectado com sucesso!")
-            
-        except Exception as e:
-            print(f"❌ Erro ao conectar Firebase: {e}")
-            self._db = None
-            raise
-    
+            info: Dict[str, Any] = json.loads(creds)
+        except json.JSONDecodeError:
+            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS não é um JSON válido")
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_info(info), info.get("project_id")
+
+    if not creds:
+        for path in LOCAL_CREDENTIAL_FILES:
+            if os.path.exists(path):
+                from google.oauth2 import service_account
+                with open(path) as f:
+                    info = json.load(f)
+                return service_account.Credentials.from_service_account_info(info), info.get("project_id")
+
+    return None, None
+
+
+_client: Optional[TunedClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Optional[firestore.Client]:
+    """
+    Cliente Firestore compartilhado do processo (criado na primeira chamada)
+
+    Returns:
+        Cliente ou None se não foi possível conectar
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            try:
+                credentials, project = load_credentials()
+                _client = TunedClient(project=project, credentials=credentials)
+                print("Firebase conectado com sucesso!")
+            except Exception as e:
+                print(f"Erro ao conectar Firebase: {e}")
+                return None
+    return _client
+
+
+def reset_after_fork() -> None:
+    """Descarta o canal gRPC herdado do processo pai (mantém o mesmo objeto cliente)"""
+    global _client_lock
+    _client_lock = threading.Lock()
+    if _client is not None:
+        _client.drop_channel()
+
+
+def warm_up(client: Optional[firestore.Client] = None) -> bool:
+    """
+    Abre o canal e autentica antes da primeira requisição
+
+    Returns:
+        True se a leitura de aquecimento respondeu
+    """
+    client = client or get_client()
+    if client is None:
+        return False
+    try:
+        collection, document = WARM_UP_DOCUMENT
+        client.collection(collection).document(document).get(timeout=10)
+        return True
+    except Exception as e:
+        print(f"Aquecimento do Firestore falhou: {e}")
+        return False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+class FirebaseConfig:
+    """Acesso ao cliente compartilhado (mantido para os módulos que usam firebase_config)"""
+
     @property
     def db(self) -> Optional[firestore.Client]:
         """Retorna o cliente Firestore"""
-        return self._db
-    
+        return get_client()
+
     def is_connected(self) -> bool:
         """Verifica se a conexão com Firebase está ativa"""
-        return self._db is not None
+        return get_client() is not None
 
 
 # Instância global do Firebase
 firebase_config = FirebaseConfig()
-
@@ -1,11 +1,10 @@
-import os
-import json
-import tempfile
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
-from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
+from config.firebase import get_client
 from models import UserModel, IndicationModel, CommissionModel, validate_model_data
+from services.pagination import fetch_page, page_items
+from services.repository import get_repository
 
 class DatabaseManager:
     """Gerenciador centralizado do banco de dados Firestore"""
@@ -15,40 +14,8 @@ class DatabaseManager:
         self._initialize_firestore()
     
     def _initialize_firestore(self):
-        """Inicializa a conexão com o Firestore"""
-        try:
-            # Tentar usar credenciais do ambiente primeiro
-            if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
-                creds = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-                if isinstance(creds, str) and creds.startswith("{"):
-                    # Se for string JSON, criar arquivo temporário
-                    try:
-                        json.loads(creds)
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                            f.write(creds)
-                            temp_file = f.name
-                        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file
-                        print("Credenciais Firebase configuradas via variável de ambiente")
-                    except json.JSONDecodeError:
-                        print("Erro: GOOGLE_APPLICATION_CREDENTIALS não é um JSON válido")
-
-            self.db = firestore.Client()
-            print("Firebase conectado com sucesso!")
-            
-        except Exception as e:
-            print(f"Erro ao conectar Firebase: {e}")
-            # Tentar usar arquivo local como fallback
-            try:
-                local_creds_path = "projeto-beepy-firebase-adminsdk-fbsvc-45c41daaaf.json"
-                if os.path.exists(local_creds_path):
-                    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = local_creds_path
-                    self.db = firestore.Client()
-                    print("Firebase conectado com arquivo local!")
-                else:
-                    print("Arquivo de credenciais local não encontrado")
-            except Exception as e:
-                print(f"Erro no fallback Firebase: {e}")
-                self.db = None
+        """Usa o cliente Firestore compartilhado do processo"""
+        self.db = get_client()
     
     def is_connected(self) -> bool:
         """Verifica se a conexão com o banco está ativa"""
@@ -95,12 +62,11 @@ class DatabaseManager:
             return False, "Erro de conexão com banco de dados", None
         
         try:
-            doc_ref = self.db.collection(collection).document(document_id)
-            doc = doc_ref.get()
+            # Mapa de identidade da requisição: no máximo uma leitura por documento
+            data = get_repository(self.db).get(collection, document_id)
             
-            if doc.exists:
-                data = doc.to_dict()
-                data['id'] = doc.id
+            if data is not None:
+                data['id'] = document_id
                 return True, "Documento encontrado", data
             else:
                 return False, "Documento não encontrado", None
@@ -111,9 +77,11 @@ class DatabaseManager:
             return False, error_msg, None
     
     def get_collection(self, collection: str, filters: List[Tuple[str, str, Any]] = None, 
-                      order_by: str = None, limit: int = None) -> Tuple[bool, str, List[Dict[str, Any]]]:
+                      order_by: str = None, limit: int = None,
+                      fields: List[str] = None) -> Tuple[bool, str, List[Dict[str, Any]]]:
         """
         Busca documentos de uma coleção com filtros opcionais
+        fields: projeção (select) com os únicos campos a baixar; o "id" vem sempre
         Retorna: (sucesso, mensagem, lista_de_dados)
         """
         if not self.is_connected():
@@ -135,6 +103,10 @@ class DatabaseManager:
             if limit:
                 query = query.limit(limit)
             
+            # Aplicar projeção
+            if fields:
+                query = query.select(fields)
+            
             # Executar query
             docs = query.stream()
             results = []
@@ -151,6 +123,39 @@ class DatabaseManager:
             print(error_msg)
             return False, error_msg, []
     
+    def get_collection_page(self, collection: str, filters: List[Tuple[str, str, Any]] = None,
+                            order_by: str = None, limit: int = 50, cursor: str = None,
+                            descending: bool = False, fields: List[str] = None) -> Tuple[bool, str, Dict[str, Any]]:
+        """
+        Busca uma página de documentos de uma coleção
+        fields: projeção (select) opcional, como em get_collection
+        Retorna: (sucesso, mensagem, {"items": lista_de_dados, "next_cursor": id_ou_None})
+        """
+        if not self.is_connected():
+            return False, "Erro de conexão com banco de dados", {"items": [], "next_cursor": None}
+        
+        try:
+            collection_ref = self.db.collection(collection)
+            query = collection_ref
+            
+            # Aplicar filtros
+            if filters:
+                for field, operator, value in filters:
+                    query = query.where(field_path=field, op_string=operator, value=value)
+            
+            if fields:
+                query = query.select(fields)
+            
+            docs, next_cursor = fetch_page(collection_ref, query, limit, cursor, order_by, descending)
+            results = page_items(docs)
+            
+            return True, f"Encontrados {len(results)} documentos", {"items": results, "next_cursor": next_cursor}
+            
+        except Exception as e:
+            error_msg = f"Erro ao buscar página da coleção: {str(e)}"
+            print(error_msg)
+            return False, error_msg, {"items": [], "next_cursor": None}
+    
     def update_document(self, collection: str, document_id: str, 
                        update_data: Dict[str, Any], model_class=None) -> Tuple[bool, str]:
         """
@@ -179,6 +184,7 @@ class DatabaseManager:
             # Atualizar documento
             doc_ref = self.db.collection(collection).document(document_id)
             doc_ref.update(update_data)
+            get_repository(self.db).forget(collection, document_id)
             
             print(f"Documento {document_id} atualizado na coleção '{collection}'")
             return True, "Documento atualizado com sucesso"
@@ -199,6 +205,7 @@ class DatabaseManager:
         try:
             doc_ref = self.db.collection(collection).document(document_id)
             doc_ref.delete()
+            get_repository(self.db).forget(collection, document_id)
             
             print(f"Documento {document_id} excluído da coleção '{collection}'")
             return True, "Documento excluído com sucesso"
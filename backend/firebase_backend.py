@@ -5,8 +5,7 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
+from config.firebase import get_client
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -16,15 +15,8 @@ SECRET_KEY = "dev-secret-key-change-in-production"
 JWT_SECRET_KEY = "jwt-secret-key-change-in-production"
 
 # Inicializar Firebase
-try:
-    cred_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS', 'firebase_credentials.json')
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("Firebase conectado com sucesso!")
-except Exception as e:
-    print(f"Erro ao conectar Firebase: {e}")
-    db = None
+# Cliente Firestore compartilhado do processo (ver config/firebase.py)
+db = get_client()
 
 # Inicializar Flask
 app = Flask(__name__)
@@ -0,0 +1,29 @@
+"""
+Configuração do gunicorn
+
+O app não é pré-carregado no master: cada worker importa main.py depois do
+fork, e o hook post_fork cria e aquece o cliente Firestore compartilhado antes
+disso. Nenhum canal gRPC ou thread (agendador, outbox) nasce no master.
+
+Cada stream SSE aberto (/changes/stream) ocupa uma das threads do worker até
+a aba fechar; CHANGE_FEED_MAX_STREAMS (padrão 4) limita esses streams por
+worker para que a API REST continue com threads livres. Para mais abas
+simultâneas, aumente WEB_CONCURRENCY (cada worker tem seu próprio limite) ou
+GUNICORN_THREADS junto com o limite.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = False
+
+
+def post_fork(server, worker):
+    from config.firebase import get_client, reset_after_fork, warm_up
+
+    reset_after_fork()
+    if os.environ.get("FIRESTORE_WARM_UP", "true").lower() != "false" and warm_up(get_client()):
+        server.log.info(f"Worker {worker.pid}: Firestore aquecido")
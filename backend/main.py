@@ -4,11 +4,36 @@ import bcrypt
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity
 from routes.users_firestore import users_bp
+from realtime_notifications import create_change_feed_routes
+from scheduler import (
+    Scheduler, FirestoreLease, create_scheduler_routes, register_maintenance_jobs, scheduler_mode
+)
 from google.cloud import firestore
-from utils import serialize_firestore_data, safe_jsonify
+from config.firebase import get_client
+from utils import safe_jsonify
+from utils.json_provider import FirestoreJSONProvider
+from utils.metrics import init_metrics
+from utils.jwt_context import init_jwt_context, jwt_required
+from utils.cache import get_cached_user, invalidate_user
+from utils.streaming import wants_ndjson, ndjson_response, doc_to_item
 from models.commission_installments import CommissionInstallment
+from services.batch_fetch import GET_ALL_CHUNK_SIZE, collect_ids, fetch_documents
+from services.repository import FirestoreBackend, get_repository, init_repository
+from services.outbox import Outbox, FirestoreOutboxStore, InMemoryOutboxStore
+from services.commission_sync import register_outbox_tasks
+from services.deletion_log import record_deletion
+from services.pagination import fetch_page, parse_page_args
+from services.indication_filters import parse_indication_filters, apply_indication_filters
+from services.dashboard_aggregation import (
+    build_admin_dashboard, build_ambassador_dashboard, ADMIN_USER_FIELDS, ADMIN_INDICATION_FIELDS,
+    ADMIN_COMMISSION_FIELDS, AMBASSADOR_INDICATION_FIELDS, AMBASSADOR_COMMISSION_FIELDS
+)
+from services.dashboard_counters import (
+    DashboardCounters, indication_deltas, commission_deltas, commission_update_deltas, installment_deltas,
+    user_deltas, diff
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,50 +42,15 @@ load_dotenv()
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production")
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "jwt-secret-key-change-in-production")
 
-db = None
-
-# Inicializar Firebase
-try:
-    # Tentar usar credenciais do ambiente primeiro
-    if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"):
-        # Se for string JSON, criar arquivo temporário
-        creds = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-        if isinstance(creds, str) and creds.startswith("{"):
-            import tempfile
-            import json as json_module
-
-            # Validar se é JSON válido
-            try:
-                json_module.loads(creds)
-                # Criar arquivo temporário
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                    f.write(creds)
-                    temp_file = f.name
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file
-                print("Credenciais Firebase configuradas via variável de ambiente")
-            except json_module.JSONDecodeError:
-                print("Erro: GOOGLE_APPLICATION_CREDENTIALS não é um JSON válido")
-
-    db = firestore.Client()
-    print("Firebase conectado com sucesso!")
-except Exception as e:
-    print(f"Erro ao conectar Firebase: {e}")
-    # Tentar usar arquivo local como fallback
-    try:
-        local_creds_path = "projeto-beepy-firebase-adminsdk-fbsvc-72fd5c9b0e.json"
-        if os.path.exists(local_creds_path):
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = local_creds_path
-            db = firestore.Client()
-            print("Firebase conectado com arquivo local!")
-        else:
-            print("Arquivo de credenciais local não encontrado")
-    except Exception as e:
-        print(f"Erro no fallback Firebase: {e}")
-        db = None
+# Cliente Firestore compartilhado do processo (ver config/firebase.py)
+db = get_client()
 
 # Inicializar Flask
 app = Flask(__name__)
 
+# Codificador JSON que trata datetime e tipos do Firestore na própria serialização
+app.json = FirestoreJSONProvider(app)
+
 # Configurações do Flask
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
@@ -69,16 +59,44 @@ app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
 # Inicializar JWT
 jwt = JWTManager(app)
 
+# Token verificado uma vez por requisição; rotas, rate limiting e auditoria leem de flask.g
+init_jwt_context(app)
+
+# Latência, leituras/escritas do Firestore por rota (Server-Timing e /metrics)
+init_metrics(app)
+
 # Configurar CORS para lidar com credenciais
 CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}})
 
 # Registrar blueprints
 app.register_blueprint(users_bp, url_prefix='/users')
 
-# Inicializar modelo de parcelas de comissão
+# Leituras por ID passam pelo mapa de identidade da requisição
+if db:
+    init_repository(app, FirestoreBackend(db))
+
+# Feed de alterações em tempo real (SSE)
+create_change_feed_routes(app, db)
+
+# Inicializar contadores dos dashboards e modelo de parcelas de comissão
+dashboard_counters = None
 commission_installments = None
 if db:
-    commission_installments = CommissionInstallment(db)
+    dashboard_counters = DashboardCounters(db)
+    commission_installments = CommissionInstallment(db, counters=dashboard_counters)
+
+# Efeitos colaterais das escritas (sincronização de comissões) fora da thread da requisição
+outbox = Outbox(FirestoreOutboxStore(db) if db else InMemoryOutboxStore(),
+                max_workers=int(os.environ.get("OUTBOX_WORKERS", 4)))
+register_outbox_tasks(outbox, db, dashboard_counters)
+
+# Agendador de manutenção (varredura de atraso, reconciliação de contadores, limpeza de caches)
+scheduler = Scheduler(FirestoreLease(db) if db else None)
+if scheduler_mode() != "off":
+    register_maintenance_jobs(scheduler, commission_installments, dashboard_counters, outbox=outbox,
+                              shared=scheduler_mode() == "embedded")
+    scheduler.start()
+create_scheduler_routes(app, db, scheduler)
 
 
 # Rotas de autenticação
@@ -201,15 +219,13 @@ def verify_token():
         if not db:
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
         response_data = {
             "user": {
-                "id": user_doc.id,
+                "id": user_data["id"],
                 "email": user_data["email"],
                 "role": user_data["role"],
                 "name": user_data.get("name", "")
@@ -235,28 +251,35 @@ def get_ambassador_indications():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
+        limit, cursor = parse_page_args(request.args)
 
         # Retorna apenas indicações da embaixadora logada
         indications_ref = db.collection("indications").where(field_path="ambassadorId", op_string="==",
                                                              value=current_user_id)
 
-        docs = indications_ref.stream()
+        next_cursor = None
+        if limit:
+            docs, next_cursor = fetch_page(db.collection("indications"), indications_ref, limit, cursor)
+        else:
+            docs = indications_ref.stream()
         indications = []
 
         for doc in docs:
             indication_data = doc.to_dict()
             indication_data["id"] = doc.id
-            indication_data = serialize_firestore_data(indication_data)
             indications.append(indication_data)
 
-        return safe_jsonify({"indications": indications}, 200)
+        response_data = {"indications": indications}
+        if limit:
+            response_data["next_cursor"] = next_cursor
+        return safe_jsonify(response_data, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
         print(f"Erro ao buscar indicações da embaixadora: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
@@ -273,32 +296,45 @@ def get_indications():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
+        limit, cursor = parse_page_args(request.args)
+        filters = parse_indication_filters(request.args)
 
-        # Se for admin, retorna todas as indicações
-        if user_data["role"] == "admin":
-            indications_ref = db.collection("indications")
-        else:
-            # Se for embaixadora, retorna apenas suas indicações
-            indications_ref = db.collection("indications").where(field_path="ambassadorId", op_string="==",
-                                                                 value=current_user_id)
+        # Admin vê todas as indicações; embaixadora apenas as suas (ambassadorId é ignorado)
+        scoped_ambassador = None if user_data["role"] == "admin" else current_user_id
+        indications_ref, sort_field, descending = apply_indication_filters(
+            db.collection("indications"), filters, ambassador_id=scoped_ambassador
+        )
 
-        docs = indications_ref.stream()
+        next_cursor = None
+        if limit and not wants_ndjson():
+            docs, next_cursor = fetch_page(db.collection("indications"), indications_ref, limit, cursor,
+                                           order_by=sort_field, descending=descending)
+        else:
+            if sort_field:
+                direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+                indications_ref = indications_ref.order_by(sort_field, direction=direction)
+            if wants_ndjson():
+                # Exportação: envia cada documento assim que chega, sem paginação
+                return ndjson_response(indications_ref.stream(), doc_to_item)
+            docs = indications_ref.stream()
         indications = []
 
         for doc in docs:
             indication_data = doc.to_dict()
             indication_data["id"] = doc.id
-            indication_data = serialize_firestore_data(indication_data)
             indications.append(indication_data)
 
+        # Sem limit a resposta continua sendo a lista completa
+        if limit:
+            return safe_jsonify({"items": indications, "next_cursor": next_cursor}, 200)
         return safe_jsonify(indications, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
         print(f"Erro ao buscar indicações: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
@@ -328,6 +364,14 @@ def create_indication():
         if not client_name or not client_email or not client_phone:
             return safe_jsonify({"error": "Nome, email e telefone do cliente são obrigatórios"}, 400)
 
+        # Buscar embaixadora antes de gravar para que nome e contadores entrem no mesmo batch
+        ambassador_data = get_cached_user(db, current_user_id)
+        if not ambassador_data:
+            print(f"Erro: Embaixador com ID {current_user_id} não encontrado ao criar indicação.")
+            return safe_jsonify({"error": "Embaixador não encontrado"}, 404)
+
+        ambassador_name = ambassador_data.get("name", "Embaixador")
+
         # Criar nova indicação
         indication_data = {
             "client_name": client_name,
@@ -342,34 +386,32 @@ def create_indication():
             "converted": False
         }
 
-        doc_ref = db.collection("indications").add(indication_data)
-        indication_data["id"] = doc_ref[1].id
-        indication_data = serialize_firestore_data(indication_data)
+        doc_ref = db.collection("indications").document()
+        batch = db.batch()
+        batch.set(doc_ref, indication_data)
+        dashboard_counters.apply(batch, indication_deltas(indication_data))
+        dashboard_counters.set_ambassador_profile(batch, current_user_id, ambassador_data,
+                                                  last_indication_at=indication_data["createdAt"])
 
-        # Criar parcelas de comissão automaticamente
-        user_doc = db.collection("users").document(current_user_id).get()
-        if not user_doc.exists:
-            print(f"Erro: Embaixador com ID {current_user_id} não encontrado ao criar indicação.")
-            return safe_jsonify({"error": "Embaixador não encontrado"}, 404)
-
-        ambassador_name = user_doc.to_dict().get("name", "Embaixador")
-
-        # Usar o modelo de parcelas para criar as 3 parcelas automaticamente
+        # As 3 parcelas entram no mesmo batch: indicação e cronograma são gravados juntos ou nada é gravado
+        installment_ids = []
         if commission_installments:
-            try:
-                installment_ids = commission_installments.create_installments_for_indication(
-                    indication_id=indication_data["id"],
-                    ambassador_id=current_user_id,
-                    ambassador_name=ambassador_name,
-                    client_name=client_name
-                )
-                print(f"Parcelas criadas para indicação {indication_data['id']}: {installment_ids}")
-            except Exception as e:
-                print(f"Erro ao criar parcelas: {str(e)}")
-                # Continuar mesmo se houver erro na criação das parcelas
+            installment_ids = commission_installments.add_installments_to_batch(
+                batch,
+                indication_id=doc_ref.id,
+                ambassador_id=current_user_id,
+                ambassador_name=ambassador_name,
+                client_name=client_name
+            )
         else:
             print("Modelo de parcelas não inicializado")
 
+        batch.commit()
+
+        indication_data["id"] = doc_ref.id
+        if installment_ids:
+            print(f"Parcelas criadas para indicação {indication_data['id']}: {installment_ids}")
+
         return safe_jsonify(indication_data, 201)
     except Exception as e:
         print(f"Erro ao criar indicação: {str(e)}")
@@ -407,7 +449,22 @@ def update_indication(indication_id):
                 print(f"Mapeando {frontend_field} -> {firestore_field}: {data[frontend_field]}")
 
         print(f"Dados para atualização no Firestore: {update_data}")
-        db.collection("indications").document(indication_id).update(update_data)
+        indication_ref = db.collection("indications").document(indication_id)
+
+        # Origem, segmento e conversão entram nos contadores: gravar a diferença junto
+        if any(field in update_data for field in ("origin", "segment", "converted")):
+            old_data = get_repository(db).get("indications", indication_id)
+            if old_data is None:
+                return safe_jsonify({"error": "Indicação não encontrada"}, 404)
+
+            batch = db.batch()
+            batch.update(indication_ref, update_data)
+            dashboard_counters.apply(batch, diff(indication_deltas(old_data),
+                                                 indication_deltas({**old_data, **update_data})))
+            batch.commit()
+        else:
+            indication_ref.update(update_data)
+        get_repository(db).forget("indications", indication_id)
         print(f"Indicação {indication_id} atualizada com sucesso")
         return safe_jsonify({"message": "Indicação atualizada com sucesso"}, 200)
 
@@ -432,71 +489,32 @@ def update_indication_status(indication_id):
         if new_status not in ["agendado", "aprovado", "não aprovado"]:
             return safe_jsonify({"error": "Status inválido. Use 'agendado', 'aprovado' ou 'não aprovado'"}, 400)
 
-        # Buscar a indicação para obter dados do embaixador
-        indication_doc = db.collection("indications").document(indication_id).get()
-        if not indication_doc.exists:
+        # Indicação atual: base da diferença nos contadores
+        repository = get_repository(db)
+        indication_data = repository.get("indications", indication_id)
+        if indication_data is None:
             return safe_jsonify({"error": "Indicação não encontrada"}, 404)
 
-        indication_data = indication_doc.to_dict()
-
         update_data = {"status": new_status, "updatedAt": datetime.now()}
-        db.collection("indications").document(indication_id).update(update_data)
-
-        # Se a indicação foi aprovada, criar ou atualizar comissão
-        if new_status == "aprovado":
-            # Buscar dados da embaixadora
-            ambassador_id = indication_data.get("ambassadorId")
-            ambassador_name = "Embaixadora não encontrada"
-
-            if ambassador_id:
-                ambassador_doc = db.collection("users").document(ambassador_id).get()
-                if ambassador_doc.exists:
-                    ambassador_data = ambassador_doc.to_dict()
-                    ambassador_name = ambassador_data.get("name", "Nome não informado")
-
-            # Verificar se já existe uma comissão para esta indicação
-            existing_commission_query = db.collection("commissions").where(
-                field_path="indicationId", op_string="==", value=indication_id
-            ).limit(1)
-            existing_commissions = list(existing_commission_query.stream())
-
-            if existing_commissions:
-                # Atualizar comissão existente
-                commission_doc = existing_commissions[0]
-                commission_update_data = {
-                    "status": "pendente",
-                    "ambassadorName": ambassador_name,
-                    "clientName": indication_data.get("client_name", "Cliente não informado"),
-                    "updatedAt": datetime.now()
-                }
-                db.collection("commissions").document(commission_doc.id).update(commission_update_data)
-                print(f"Comissão atualizada para indicação aprovada: {indication_id}")
-            else:
-                # Criar nova comissão
-                commission_data = {
-                    "ambassadorId": indication_data.get("ambassadorId"),
-                    "ambassadorName": ambassador_name,
-                    "indicationId": indication_id,
-                    "clientName": indication_data.get("client_name", "Cliente não informado"),
-                    "value": data.get("commissionValue", 500.0),  # Valor padrão ou vindo do request
-                    "status": "pendente",
-                    "createdAt": datetime.now(),
-                    "updatedAt": datetime.now()
-                }
 
-                doc_ref = db.collection("commissions").add(commission_data)
-                print(f"Nova comissão criada para indicação aprovada: {indication_id} -> {doc_ref[1].id}")
-
-        elif new_status == "não aprovado":
-            # Se rejeitada, remover comissão se existir
-            existing_commission_query = db.collection("commissions").where(
-                field_path="indicationId", op_string="==", value=indication_id
-            )
-            existing_commissions = list(existing_commission_query.stream())
-
-            for commission_doc in existing_commissions:
-                db.collection("commissions").document(commission_doc.id).delete()
-                print(f"Comissão removida para indicação rejeitada: {indication_id}")
+        # Status, contadores e a entrada do outbox são gravados em um único batch;
+        # a comissão é criada/removida em segundo plano (services.commission_sync)
+        batch = db.batch()
+        batch.update(db.collection("indications").document(indication_id), update_data)
+        dashboard_counters.apply(batch, diff(indication_deltas(indication_data),
+                                             indication_deltas({**indication_data, **update_data})))
+
+        outbox_entry = None
+        if new_status in ("aprovado", "não aprovado"):
+            payload = {"indication_id": indication_id, "status": new_status}
+            if data.get("commissionValue") is not None:
+                payload["commission_value"] = data["commissionValue"]
+            outbox_entry = outbox.enqueue(batch, "sync_commission", payload)
+
+        batch.commit()
+        repository.forget("indications", indication_id)
+        if outbox_entry:
+            outbox.dispatch(outbox_entry)
 
         return safe_jsonify({"message": "Status da indicação atualizado com sucesso"}, 200)
 
@@ -515,7 +533,17 @@ def delete_indication(indication_id):
         if not db:
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
-        db.collection("indications").document(indication_id).delete()
+        repository = get_repository(db)
+        indication_data = repository.get("indications", indication_id)
+        if indication_data is None:
+            return safe_jsonify({"error": "Indicação não encontrada"}, 404)
+
+        batch = db.batch()
+        batch.delete(db.collection("indications").document(indication_id))
+        record_deletion(batch, db, "indications", indication_id, indication_data.get("ambassadorId"))
+        dashboard_counters.apply(batch, diff(indication_deltas(indication_data), indication_deltas(None)))
+        batch.commit()
+        repository.forget("indications", indication_id)
         return safe_jsonify({"message": "Indicação excluída com sucesso"}, 200)
     except Exception as e:
         print(f"Erro ao excluir indicação: {str(e)}")
@@ -534,17 +562,20 @@ def get_users():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
+        limit, cursor = parse_page_args(request.args)
+
         users_ref = db.collection("users")
-        docs = users_ref.stream()
+        next_cursor = None
+        if limit:
+            docs, next_cursor = fetch_page(users_ref, limit=limit, cursor=cursor)
+        else:
+            docs = users_ref.stream()
         users = []
 
         for doc in docs:
@@ -552,11 +583,14 @@ def get_users():
             user_data["id"] = doc.id
             # Remover senha se existir
             user_data.pop("password", None)  # Remove password se existir, senão ignora
-            user_data = serialize_firestore_data(user_data)
             users.append(user_data)
 
+        if limit:
+            return safe_jsonify({"items": users, "next_cursor": next_cursor}, 200)
         return safe_jsonify(users, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
         print(f"Erro ao buscar usuários: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
@@ -573,12 +607,9 @@ def create_user():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
@@ -623,13 +654,18 @@ def create_user():
             "phone": data.get("phone", ""),
             "active": True,
             "createdAt": datetime.now(),
+            "updatedAt": datetime.now(),
             "lastActiveAt": datetime.now()
         }
 
-        doc_ref = db.collection("users").add(new_user_data)
-        new_user_data["id"] = doc_ref[1].id
+        doc_ref = db.collection("users").document()
+        batch = db.batch()
+        batch.set(doc_ref, new_user_data)
+        dashboard_counters.apply(batch, user_deltas(new_user_data))
+        dashboard_counters.set_ambassador_profile(batch, doc_ref.id, new_user_data)
+        batch.commit()
+        new_user_data["id"] = doc_ref.id
         del new_user_data["password"]
-        new_user_data = serialize_firestore_data(new_user_data)
 
         print(f"Usuário criado com sucesso: {email}")
         return safe_jsonify(new_user_data, 201)
@@ -640,6 +676,51 @@ def create_user():
 
 
 # Rotas de comissões
+def _add_commission_details(rows):
+    """Completa as comissões com dados da embaixadora e da indicação (busca em lote)"""
+    users_map = fetch_documents(db, "users", collect_ids(rows, "ambassadorId"),
+                                field_paths=["name", "email"])
+    indications_map = fetch_documents(db, "indications", collect_ids(rows, "indicationId"),
+                                      field_paths=["status", "client_name", "email"])
+
+    for commission_data in rows:
+        # Adicionar dados do embaixador
+        ambassador_id = commission_data.get("ambassadorId")
+        if ambassador_id and ambassador_id in users_map:
+            ambassador_data = users_map[ambassador_id]
+            commission_data["ambassadorName"] = ambassador_data.get("name", "Nome não disponível")
+            commission_data["ambassadorEmail"] = ambassador_data.get("email", "Email não disponível")
+        else:
+            commission_data["ambassadorName"] = "Embaixador não encontrado"
+            commission_data["ambassadorEmail"] = "Email não disponível"
+
+        # Adicionar dados da indicação se existir
+        indication_id = commission_data.get("indicationId")
+        if indication_id:
+            if indication_id in indications_map:
+                indication_data = indications_map[indication_id]
+                commission_data["indicationStatus"] = indication_data.get("status", "pendente")
+                commission_data["clientName"] = indication_data.get("client_name", "Cliente não disponível")
+                commission_data["clientEmail"] = indication_data.get("email", "Email não disponível")
+            else:
+                commission_data["indicationStatus"] = "indicação não encontrada"
+                commission_data["clientName"] = commission_data.get("clientName", "Cliente não disponível")
+
+    return rows
+
+
+def _iter_commissions_with_details(docs):
+    """Percorre as comissões em lotes de GET_ALL_CHUNK_SIZE, completando cada lote antes de enviá-lo"""
+    chunk = []
+    for doc in docs:
+        chunk.append(doc_to_item(doc))
+        if len(chunk) >= GET_ALL_CHUNK_SIZE:
+            yield from _add_commission_details(chunk)
+            chunk = []
+    if chunk:
+        yield from _add_commission_details(chunk)
+
+
 @app.route("/commissions", methods=["GET", "OPTIONS"])
 @jwt_required()
 def get_commissions():
@@ -651,12 +732,11 @@ def get_commissions():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
+        limit, cursor = parse_page_args(request.args)
 
         if user_data["role"] == "admin":
             commissions_ref = db.collection("commissions")
@@ -664,52 +744,24 @@ def get_commissions():
             commissions_ref = db.collection("commissions").where(field_path="ambassadorId", op_string="==",
                                                                  value=current_user_id)
 
-        docs = commissions_ref.stream()
-        commissions = []
+        if wants_ndjson():
+            # Exportação: resolve os joins a cada lote de documentos e envia em seguida
+            return ndjson_response(_iter_commissions_with_details(commissions_ref.stream()))
 
-        # Buscar todos os usuários para mapear embaixadores
-        users_ref = db.collection("users")
-        all_users = list(users_ref.stream())
-        users_map = {}
-        for user_doc in all_users:
-            users_map[user_doc.id] = user_doc.to_dict()
+        next_cursor = None
+        if limit:
+            docs, next_cursor = fetch_page(db.collection("commissions"), commissions_ref, limit, cursor)
+        else:
+            docs = commissions_ref.stream()
 
-        for doc in docs:
-            commission_data = doc.to_dict()
-            commission_data["id"] = doc.id
-
-            # Adicionar dados do embaixador
-            ambassador_id = commission_data.get("ambassadorId")
-            if ambassador_id and ambassador_id in users_map:
-                ambassador_data = users_map[ambassador_id]
-                commission_data["ambassadorName"] = ambassador_data.get("name", "Nome não disponível")
-                commission_data["ambassadorEmail"] = ambassador_data.get("email", "Email não disponível")
-            else:
-                commission_data["ambassadorName"] = "Embaixador não encontrado"
-                commission_data["ambassadorEmail"] = "Email não disponível"
-
-            # Adicionar dados da indicação se existir
-            indication_id = commission_data.get("indicationId")
-            if indication_id:
-                try:
-                    indication_doc = db.collection("indications").document(indication_id).get()
-                    if indication_doc.exists:
-                        indication_data = indication_doc.to_dict()
-                        commission_data["indicationStatus"] = indication_data.get("status", "pendente")
-                        commission_data["clientName"] = indication_data.get("client_name", "Cliente não disponível")
-                        commission_data["clientEmail"] = indication_data.get("email", "Email não disponível")
-                    else:
-                        commission_data["indicationStatus"] = "indicação não encontrada"
-                        commission_data["clientName"] = commission_data.get("clientName", "Cliente não disponível")
-                except Exception as e:
-                    print(f"Erro ao buscar indicação {indication_id}: {e}")
-                    commission_data["indicationStatus"] = "erro ao buscar"
-
-            commission_data = serialize_firestore_data(commission_data)
-            commissions.append(commission_data)
+        commissions = _add_commission_details([doc_to_item(doc) for doc in docs])
 
+        if limit:
+            return safe_jsonify({"items": commissions, "next_cursor": next_cursor}, 200)
         return safe_jsonify(commissions, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
         print(f"Erro ao buscar comissões: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
@@ -736,9 +788,12 @@ def create_commission():
             "updatedAt": datetime.now()
         }
 
-        doc_ref = db.collection("commissions").add(commission_data)
-        commission_data["id"] = doc_ref[1].id
-        commission_data = serialize_firestore_data(commission_data)
+        doc_ref = db.collection("commissions").document()
+        batch = db.batch()
+        batch.set(doc_ref, commission_data)
+        dashboard_counters.apply(batch, commission_deltas(commission_data))
+        batch.commit()
+        commission_data["id"] = doc_ref.id
 
         return safe_jsonify(commission_data, 201)
 
@@ -759,210 +814,21 @@ def get_admin_dashboard():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
-        dashboard_data = {}
-
-        # Estatísticas básicas
-        users_count = len(list(db.collection("users").stream()))
-        indications_count = len(list(db.collection("indications").stream()))
-        commissions_count = len(list(db.collection("commissions").stream()))
-
-        # Calcular comissões do mês
-        from datetime import timezone
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-
-        commissions_ref = db.collection("commissions")
-        all_commissions = list(commissions_ref.stream())
-
-        monthly_commissions = 0
-        for commission_doc in all_commissions:
-            commission_data = commission_doc.to_dict()
-            created_at = commission_data.get("createdAt")
-            if created_at:
-                # Converter para datetime naive se for offset-aware
-                if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                    created_at = created_at.replace(tzinfo=None)
-                if created_at.month == current_month and created_at.year == current_year:
-                    monthly_commissions += commission_data.get("value", 0)
-
-        # Dados para gráficos
-        # 1. Indicações mês a mês (últimos 6 meses)
-        indications_monthly = []
-        all_indications = list(db.collection("indications").stream())
-
-        # Contar indicações por status
-        approved_indications = 0
-        pending_indications = 0
-        rejected_indications = 0
-
-        for indication_doc in all_indications:
-            indication_data = indication_doc.to_dict()
-            status = indication_data.get("status", "pendente")
-            if status == "aprovado":
-                approved_indications += 1
-            elif status == "não aprovado":
-                rejected_indications += 1
-            else:
-                pending_indications += 1
-
-        for i in range(6):
-            month_date = datetime.now() - timedelta(days=30 * i)
-            month_count = 0
-            month_approved = 0
-            for indication_doc in all_indications:
-                indication_data = indication_doc.to_dict()
-                created_at = indication_data.get("createdAt")
-                if created_at:
-                    # Converter para datetime naive se for offset-aware
-                    if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                        created_at = created_at.replace(tzinfo=None)
-                    if created_at.month == month_date.month and created_at.year == month_date.year:
-                        month_count += 1
-                        if indication_data.get("status") == "aprovado":
-                            month_approved += 1
-            indications_monthly.append({
-                "month": month_date.strftime("%b"),
-                "count": month_count,
-                "approved": month_approved
-            })
-
-        # 2. Leads por origem
-        origins_data = {}
-        for indication_doc in all_indications:
-            indication_data = indication_doc.to_dict()
-            origin = indication_data.get("origin", "website")
-            origins_data[origin] = origins_data.get(origin, 0) + 1
-
-        leads_origin = [{"name": k, "value": v} for k, v in origins_data.items()]
-
-        # 3. Conversão por segmento
-        segment_data = {}
-        for indication_doc in all_indications:
-            indication_data = indication_doc.to_dict()
-            segment = indication_data.get("segment", "geral")
-            status = indication_data.get("status", "pendente")
-
-            if segment not in segment_data:
-                segment_data[segment] = {"total": 0, "converted": 0}
-
-            segment_data[segment]["total"] += 1
-            if status == "aprovado":
-                segment_data[segment]["converted"] += 1
-
-        conversion_by_segment = []
-        for segment, data in segment_data.items():
-            conversion_rate = (data["converted"] / data["total"] * 100) if data["total"] > 0 else 0
-            conversion_by_segment.append({
-                "segment": segment,
-                "total": data["total"],
-                "converted": data["converted"],
-                "rate": conversion_rate
-            })
-
-        # 4. Vendas mês a mês (comissões como proxy)
-        sales_monthly = []
-        for i in range(6):
-            month_date = datetime.now() - timedelta(days=30 * i)
-            month_sales = 0
-            for commission_doc in all_commissions:
-                commission_data = commission_doc.to_dict()
-                created_at = commission_data.get("createdAt")
-                if created_at:
-                    # Converter para datetime naive se for offset-aware
-                    if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                        created_at = created_at.replace(tzinfo=None)
-                    if created_at.month == month_date.month and created_at.year == month_date.year:
-                        month_sales += commission_data.get("value", 0)
-            sales_monthly.append({
-                "month": month_date.strftime("%b"),
-                "value": month_sales
-            })
-
-        # 5. Top embaixadoras por volume de indicação
-        all_users = list(db.collection("users").stream())
-        ambassador_stats = {}
-
-        for user_doc in all_users:
-            user_data = user_doc.to_dict()
-            if user_data.get("role") == "embaixadora":
-                user_id = user_doc.id
-                user_name = user_data.get("name", "Sem nome")
-
-                # Contar indicações desta embaixadora
-                user_indications = 0
-                for indication_doc in all_indications:
-                    indication_data = indication_doc.to_dict()
-                    if indication_data.get("ambassadorId") == user_id:
-                        user_indications += 1
-
-                if user_indications > 0:
-                    ambassador_stats[user_name] = user_indications
-
-        # Ordenar por volume e pegar top 5
-        top_ambassadors = sorted(ambassador_stats.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_ambassadors_data = [{"name": name, "indications": count} for name, count in top_ambassadors]
-
-        # 6. Embaixadoras ativas (últimos 60 dias)
-        sixty_days_ago = datetime.now() - timedelta(days=60)
-        active_ambassadors = 0
-        total_ambassadors = 0
-
-        for user_doc in all_users:
-            user_data = user_doc.to_dict()
-            if user_data.get("role") == "embaixadora":
-                total_ambassadors += 1
-
-                # Verificar se tem indicações nos últimos 60 dias
-                has_recent_activity = False
-                for indication_doc in all_indications:
-                    indication_data = indication_doc.to_dict()
-                    if indication_data.get("ambassadorId") == user_doc.id:
-                        created_at = indication_data.get("createdAt")
-                        if created_at:
-                            # Converter para datetime naive se for offset-aware
-                            if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                                created_at = created_at.replace(tzinfo=None)
-                            if created_at >= sixty_days_ago:
-                                has_recent_activity = True
-                                break
-
-                if has_recent_activity:
-                    active_ambassadors += 1
-
-        indications_for_conversion = approved_indications + pending_indications
-        active_percentage = (active_ambassadors / total_ambassadors * 100) if total_ambassadors > 0 else 0
-
-        dashboard_data["stats"] = {
-            "totalUsers": users_count,
-            "totalIndications": indications_count,
-            "totalCommissions": commissions_count,
-            "monthlyCommissions": monthly_commissions,
-            "activeAmbassadors": active_ambassadors,
-            "activePercentage": round(active_percentage, 2),
-            "approvedIndications": approved_indications,
-            "pendingIndications": pending_indications,
-            "rejectedIndications": rejected_indications,
-            "approvalRate": round(
-                (approved_indications / indications_for_conversion * 100) if indications_for_conversion > 0 else 0, 2)
-        }
-        dashboard_data["charts"] = {
-            "indicationsMonthly": list(reversed(indications_monthly)),
-            "leadsOrigin": leads_origin,
-            "conversionBySegment": conversion_by_segment,
-            "salesMonthly": list(reversed(sales_monthly)),
-            "topAmbassadors": top_ambassadors_data
-        }
+        # Contadores pré-agregados; sem eles (antes do rebuild) volta à leitura completa
+        dashboard_data = dashboard_counters.get_admin_dashboard()
+        if dashboard_data is None:
+            dashboard_data = build_admin_dashboard(
+                users=db.collection("users").select(ADMIN_USER_FIELDS).stream(),
+                indications=db.collection("indications").select(ADMIN_INDICATION_FIELDS).stream(),
+                commissions=db.collection("commissions").select(ADMIN_COMMISSION_FIELDS).stream()
+            )
 
-        dashboard_data = serialize_firestore_data(dashboard_data)
         return safe_jsonify(dashboard_data, 200)
 
     except Exception as e:
@@ -981,171 +847,67 @@ def get_ambassador_dashboard():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "embaixadora":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
-        dashboard_data = {}
+        # Contadores pré-agregados; sem eles (antes do rebuild) volta à leitura das coleções
+        dashboard_data = dashboard_counters.get_ambassador_dashboard(current_user_id)
+        if dashboard_data is None:
+            dashboard_data = build_ambassador_dashboard(
+                indications=db.collection("indications").where(
+                    field_path="ambassadorId", op_string="==", value=current_user_id
+                ).select(AMBASSADOR_INDICATION_FIELDS).stream(),
+                commissions=db.collection("commissions").where(
+                    field_path="ambassadorId", op_string="==", value=current_user_id
+                ).select(AMBASSADOR_COMMISSION_FIELDS).stream()
+            )
 
-        # Indicações da embaixadora
-        indications_ref = db.collection("indications").where(field_path="ambassadorId", op_string="==",
-                                                             value=current_user_id)
-        indications = list(indications_ref.stream())
+        return safe_jsonify(dashboard_data, 200)
 
-        total_indications_count = len(indications)
+    except Exception as e:
+        print(f"Erro no dashboard embaixadora: {str(e)}")
+        return safe_jsonify({"error": str(e)}, 500)
 
-        # Contar por status
-        approved_indications = 0
-        pending_indications = 0
-        rejected_indications = 0
 
-        for doc in indications:
-            indication_data = doc.to_dict()
-            status = indication_data.get("status", "agendado")
-            if status == "aprovado":
-                approved_indications += 1
-            elif status == "não aprovado":
-                rejected_indications += 1
-            else:
-                pending_indications += 1
+@app.route("/dashboard/monthly", methods=["GET", "OPTIONS"])
+@jwt_required()
+def get_monthly_rollups():
+    """Série mensal dos rollups (indicações, comissões e parcelas) para os gráficos"""
+    if request.method == "OPTIONS":
+        return "", 200
+
+    try:
+        if not db:
+            return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
-        total_indications = len(indications)
+        current_user_id = get_jwt_identity()
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
+            return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        # Comissões da embaixadora
-        commissions_ref = db.collection("commissions").where(field_path="ambassadorId", op_string="==",
-                                                             value=current_user_id)
-        commissions = list(commissions_ref.stream())
-
-        total_commissions = sum(doc.to_dict().get("value", 0) for doc in commissions)
-
-        # Comissões do mês atual
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        monthly_commission = 0
-
-        for commission_doc in commissions:
-            commission_data = commission_doc.to_dict()
-            created_at = commission_data.get("createdAt")
-            if created_at:
-                # Converter para datetime naive se for offset-aware
-                if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                    created_at = created_at.replace(tzinfo=None)
-                if created_at.month == current_month and created_at.year == current_year:
-                    monthly_commission += commission_data.get("value", 0)
-
-        # Dados para gráficos
-        # 1. Indicações mês a mês (últimos 12 meses)
-        monthly_indications = []
-        for i in range(12):
-            month_date = datetime.now() - timedelta(days=30 * i)
-            month_count = 0
-            for indication_doc in indications:
-                indication_data = indication_doc.to_dict()
-                created_at = indication_data.get("createdAt")
-                if created_at:
-                    # Converter para datetime naive se for offset-aware
-                    if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                        created_at = created_at.replace(tzinfo=None)
-                    if created_at.month == month_date.month and created_at.year == month_date.year:
-                        month_count += 1
-            monthly_indications.append({
-                "month": month_date.strftime("%b/%Y"),
-                "count": month_count
-            })
-
-        # 2. Comissões mês a mês (últimos 12 meses)
-        monthly_commissions = []
-        for i in range(12):
-            month_date = datetime.now() - timedelta(days=30 * i)
-            month_total = 0
-            for commission_doc in commissions:
-                commission_data = commission_doc.to_dict()
-                created_at = commission_data.get("createdAt")
-                if created_at:
-                    # Converter para datetime naive se for offset-aware
-                    if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                        created_at = created_at.replace(tzinfo=None)
-                    if created_at.month == month_date.month and created_at.year == month_date.year:
-                        month_total += commission_data.get("value", 0)
-            monthly_commissions.append({
-                "month": month_date.strftime("%b/%Y"),
-                "total": month_total
-            })
-
-        # 3. Indicações por segmento
-        niche_stats = {}
-        converted_segments = {}
-        for indication_doc in indications:
-            indication_data = indication_doc.to_dict()
-            niche = indication_data.get("segment", "geral")
-            converted = indication_data.get("converted", False)
-            niche_stats[niche] = niche_stats.get(niche, 0) + 1
-            if converted:
-                converted_segments[niche] = converted_segments.get(niche, 0) + 1
-
-        niche_data = []
-        total_for_percentage = sum(niche_stats.values())
-        for niche, count in niche_stats.items():
-            converted_niche = converted_segments.get(niche, 0)
-            conversion_rate = (converted_niche / count * 100) if count > 0 else 0
-            percent = (count / total_for_percentage) if total_for_percentage > 0 else 0
-            niche_data.append({
-                "niche": niche,
-                "count": count,
-                "converted": converted_niche,
-                "percent": percent,
-                "conversion_rate": conversion_rate
-            })
-
-        # 4. Performance mensal (últimos 5 meses)
-        monthly_performance = []
-        for i in range(5):
-            month_date = datetime.now() - timedelta(days=30 * i)
-            month_indications = 0
-            for indication_doc in indications:
-                indication_data = indication_doc.to_dict()
-                created_at = indication_data.get("createdAt")
-                if created_at:
-                    # Converter para datetime naive se for offset-aware
-                    if hasattr(created_at, 'tzinfo') and created_at.tzinfo is not None:
-                        created_at = created_at.replace(tzinfo=None)
-                    if created_at.month == month_date.month and created_at.year == month_date.year:
-                        month_indications += 1
-            monthly_performance.append({
-                "month": month_date.strftime("%b"),
-                "total_indications": total_indications,
-            })
-
-        indications_for_conversion = approved_indications + pending_indications
-        print(
-            f"Ambassador Dashboard - Approved: {approved_indications}, Pending: {pending_indications}, Rejected: {rejected_indications}, Total Indications: {total_indications}")
-        print(f"Ambassador Dashboard - Indications for Conversion: {indications_for_conversion}")
-        dashboard_data["stats"] = {
-            "total_indications": total_indications_display,
-            "approved_sales": approved_indications,
-            "conversion_rate": round(
-                (approved_indications / indications_for_conversion * 100) if indications_for_conversion > 0 else 0, 2),
-            "current_month_commission": monthly_commission,
-            "total_commissions": total_commissions,
-            "pending_indications": pending_indications,
-            "rejected_indications": rejected_indications
-        }
+        try:
+            months = int(request.args.get("months", 12))
+        except ValueError:
+            raise ValueError("Parâmetro months deve ser um número inteiro")
+        if not 1 <= months <= 24:
+            raise ValueError("Parâmetro months deve estar entre 1 e 24")
 
-        dashboard_data["monthly_indications"] = monthly_indications
-        dashboard_data["monthly_commissions"] = monthly_commissions
-        dashboard_data["niche_stats"] = niche_data
-        dashboard_data["monthly_performance"] = monthly_performance
+        # Admin vê a série geral ou de uma embaixadora; embaixadora apenas a sua
+        if user_data["role"] == "admin":
+            ambassador_id = request.args.get("ambassador_id") or None
+        else:
+            ambassador_id = current_user_id
 
-        dashboard_data = serialize_firestore_data(dashboard_data)
-        return safe_jsonify(dashboard_data, 200)
+        series = dashboard_counters.get_monthly_rollups(ambassador_id, months)
+        return safe_jsonify({"months": series}, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
-        print(f"Erro no dashboard embaixadora: {str(e)}")
+        print(f"Erro ao buscar rollups mensais: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
 
 
@@ -1202,7 +964,25 @@ def update_commission(commission_id):
             if field in data:
                 update_data[field] = data[field]
 
-        db.collection("commissions").document(commission_id).update(update_data)
+        commission_ref = db.collection("commissions").document(commission_id)
+
+        # Status, valor e embaixadora entram nos contadores (e rollups mensais): gravar a diferença junto
+        old_data = get_repository(db).get("commissions", commission_id)
+        if old_data is None:
+            return safe_jsonify({"error": "Comissão não encontrada"}, 404)
+
+        # Troca de embaixadora: o feed de alterações avisa a anterior para remover a comissão
+        if "ambassadorId" in update_data and update_data["ambassadorId"] != old_data.get("ambassadorId"):
+            update_data["previousAmbassadorId"] = old_data.get("ambassadorId")
+        elif old_data.get("previousAmbassadorId") is not None:
+            update_data["previousAmbassadorId"] = None
+
+        batch = db.batch()
+        batch.update(commission_ref, update_data)
+        dashboard_counters.apply(batch, commission_update_deltas(old_data, update_data))
+        batch.commit()
+        get_repository(db).forget("commissions", commission_id)
+
         return safe_jsonify({"message": "Comissão atualizada com sucesso"}, 200)
 
     except Exception as e:
@@ -1220,7 +1000,17 @@ def delete_commission(commission_id):
         if not db:
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
-        db.collection("commissions").document(commission_id).delete()
+        repository = get_repository(db)
+        commission_data = repository.get("commissions", commission_id)
+        if commission_data is None:
+            return safe_jsonify({"error": "Comissão não encontrada"}, 404)
+
+        batch = db.batch()
+        batch.delete(db.collection("commissions").document(commission_id))
+        record_deletion(batch, db, "commissions", commission_id, commission_data.get("ambassadorId"))
+        dashboard_counters.apply(batch, diff(commission_deltas(commission_data), commission_deltas(None)))
+        batch.commit()
+        repository.forget("commissions", commission_id)
         return safe_jsonify({"message": "Comissão excluída com sucesso"}, 200)
     except Exception as e:
         print(f"Erro ao excluir comissão: {str(e)}")
@@ -1244,18 +1034,15 @@ def update_user(user_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
         # Verificar se o usuário a ser atualizado existe
-        target_user_doc = db.collection("users").document(user_id).get()
-        if not target_user_doc.exists:
+        target_user_data = get_repository(db).get("users", user_id)
+        if target_user_data is None:
             return safe_jsonify({"error": "Usuário a ser atualizado não encontrado"}, 404)
 
         data = request.get_json()
@@ -1274,7 +1061,20 @@ def update_user(user_id):
             hashed_password = bcrypt.hashpw(data["password"].encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
             update_data["password"] = hashed_password
 
-        db.collection("users").document(user_id).update(update_data)
+        user_ref = db.collection("users").document(user_id)
+
+        # Role entra nos contadores; nome e role também ficam no documento da embaixadora
+        if "role" in update_data or "name" in update_data:
+            new_data = {**target_user_data, **update_data}
+            batch = db.batch()
+            batch.update(user_ref, update_data)
+            dashboard_counters.apply(batch, diff(user_deltas(target_user_data), user_deltas(new_data)))
+            dashboard_counters.set_ambassador_profile(batch, user_id, new_data)
+            batch.commit()
+        else:
+            user_ref.update(update_data)
+
+        invalidate_user(user_id)
         return safe_jsonify({"message": "Usuário atualizado com sucesso"}, 200)
 
     except Exception as e:
@@ -1293,25 +1093,28 @@ def delete_user(user_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
-
-        user_data = user_doc.to_dict()
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
         # Verificar se o usuário a ser excluído existe
-        target_user_doc = db.collection("users").document(user_id).get()
-        if not target_user_doc.exists:
+        target_user_data = get_repository(db).get("users", user_id)
+        if target_user_data is None:
             return safe_jsonify({"error": "Usuário a ser excluído não encontrado"}, 404)
 
         # Não permitir que um admin exclua a si mesmo
         if user_id == current_user_id:
             return safe_jsonify({"error": "Você não pode excluir seu próprio usuário"}, 400)
 
-        db.collection("users").document(user_id).delete()
+        batch = db.batch()
+        batch.delete(db.collection("users").document(user_id))
+        record_deletion(batch, db, "users", user_id, user_id)
+        dashboard_counters.apply(batch, diff(user_deltas(target_user_data), user_deltas(None)))
+        dashboard_counters.set_ambassador_profile(batch, user_id, None)
+        batch.commit()
+        invalidate_user(user_id)
         return safe_jsonify({"message": "Usuário excluído com sucesso"}, 200)
     except Exception as e:
         print(f"Erro ao excluir usuário: {str(e)}")
@@ -1331,19 +1134,18 @@ def get_commission_installments():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Obter filtros da query string
         status_filter = request.args.get("status")
         ambassador_id_filter = request.args.get("ambassador_id")
         month_filter = request.args.get("month")
         year_filter = request.args.get("year")
 
+        limit, cursor = parse_page_args(request.args)
+
         filters = {}
         if status_filter:
             filters["status"] = status_filter
@@ -1352,8 +1154,31 @@ def get_commission_installments():
         if year_filter:
             filters["year"] = year_filter
 
+        if wants_ndjson():
+            # Exportação: mesmos filtros da listagem, enviados à medida que chegam
+            if user_data["role"] == "admin":
+                if ambassador_id_filter:
+                    filters["ambassador_id"] = ambassador_id_filter
+                return ndjson_response(commission_installments.iter_installments(filters))
+            filters["ambassador_id"] = current_user_id
+            return ndjson_response(commission_installments.iter_installments(filters, descending=False))
+
+        next_cursor = None
+        if limit:
+            # Admin filtra por embaixadora; embaixadora só vê suas próprias parcelas
+            if user_data["role"] == "admin":
+                if ambassador_id_filter:
+                    filters["ambassador_id"] = ambassador_id_filter
+                installments, next_cursor = commission_installments.get_installments_page(
+                    filters, limit, cursor
+                )
+            else:
+                filters["ambassador_id"] = current_user_id
+                installments, next_cursor = commission_installments.get_installments_page(
+                    filters, limit, cursor, descending=False
+                )
         # Se for admin, pode ver todas as parcelas ou filtrar por embaixadora
-        if user_data["role"] == "admin":
+        elif user_data["role"] == "admin":
             if ambassador_id_filter:
                 filters["ambassador_id"] = ambassador_id_filter
             installments = commission_installments.get_all_installments(filters)
@@ -1363,12 +1188,13 @@ def get_commission_installments():
                 current_user_id, status_filter
             )
 
-        # Serializar dados do Firestore
-        for installment in installments:
-            installment = serialize_firestore_data(installment)
-
-        return safe_jsonify({"installments": installments}, 200)
+        response_data = {"installments": installments}
+        if limit:
+            response_data["next_cursor"] = next_cursor
+        return safe_jsonify(response_data, 200)
 
+    except ValueError as e:
+        return safe_jsonify({"error": str(e)}, 400)
     except Exception as e:
         print(f"Erro ao buscar parcelas: {str(e)}")
         return safe_jsonify({"error": str(e)}, 500)
@@ -1386,13 +1212,10 @@ def update_installment_status(installment_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Apenas admins podem atualizar status de parcelas
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
@@ -1432,13 +1255,10 @@ def get_commission_summary():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Obter filtro de embaixadora se fornecido (apenas para admins)
         ambassador_id_filter = request.args.get("ambassador_id")
 
@@ -1468,20 +1288,15 @@ def get_installments_by_indication(indication_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Verificar se a indicação existe e se o usuário tem acesso
-        indication_doc = db.collection("indications").document(indication_id).get()
-        if not indication_doc.exists:
+        indication_data = get_repository(db).get("indications", indication_id)
+        if indication_data is None:
             return safe_jsonify({"error": "Indicação não encontrada"}, 404)
 
-        indication_data = indication_doc.to_dict()
-
         # Se não for admin, verificar se é a embaixadora da indicação
         if user_data["role"] != "admin" and indication_data.get("ambassadorId") != current_user_id:
             return safe_jsonify({"error": "Acesso negado"}, 403)
@@ -1489,10 +1304,6 @@ def get_installments_by_indication(indication_id):
         # Buscar parcelas da indicação
         installments = commission_installments.get_installments_by_indication(indication_id)
 
-        # Serializar dados do Firestore
-        for installment in installments:
-            installment = serialize_firestore_data(installment)
-
         return safe_jsonify({"installments": installments}, 200)
 
     except Exception as e:
@@ -1512,27 +1323,20 @@ def check_overdue_installments():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Apenas admins podem executar esta operação
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
-        # Verificar parcelas em atraso
-        overdue_installments = commission_installments.check_overdue_installments()
-
-        # Serializar dados do Firestore
-        for installment in overdue_installments:
-            installment = serialize_firestore_data(installment)
+        # Verificar parcelas em atraso; com done=False basta chamar de novo para continuar
+        progress = commission_installments.check_overdue_installments()
 
         return safe_jsonify({
-            "message": f"{len(overdue_installments)} parcelas marcadas como atrasadas",
-            "overdue_installments": overdue_installments
+            "message": f"{progress['updated']} parcelas marcadas como atrasadas",
+            **progress
         }, 200)
 
     except Exception as e:
@@ -1571,7 +1375,10 @@ def setup():
             "updatedAt": datetime.now()
         }
 
-        db.collection("users").add(admin_data)
+        batch = db.batch()
+        batch.set(db.collection("users").document(), admin_data)
+        dashboard_counters.apply(batch, user_deltas(admin_data))
+        batch.commit()
         print("Usuário admin criado com sucesso!")
 
         return safe_jsonify({
@@ -1603,24 +1410,28 @@ def delete_commission_installment(installment_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
-
-        if not user_doc.exists:
+        user_data = get_cached_user(db, current_user_id)
+        if not user_data:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Apenas admins podem excluir parcelas
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
 
         # Verificar se a parcela existe
-        installment_doc = db.collection("commission_installments").document(installment_id).get()
-        if not installment_doc.exists:
+        repository = get_repository(db)
+        installment_data = repository.get("commission_installments", installment_id)
+        if installment_data is None:
             return safe_jsonify({"error": "Parcela não encontrada"}, 404)
 
-        # Excluir a parcela
-        db.collection("commission_installments").document(installment_id).delete()
+        # Excluir a parcela junto com a sua contribuição nos contadores
+        batch = db.batch()
+        batch.delete(db.collection("commission_installments").document(installment_id))
+        record_deletion(batch, db, "commission_installments", installment_id,
+                        installment_data.get("ambassador_id"))
+        dashboard_counters.apply(batch, diff(installment_deltas(installment_data), installment_deltas(None)))
+        batch.commit()
+        repository.forget("commission_installments", installment_id)
         
         print(f"Parcela {installment_id} excluída com sucesso pelo admin {current_user_id}")
         return safe_jsonify({"message": "Parcela excluída com sucesso"}, 200)
@@ -1,17 +1,95 @@
 """
 Modelo para gerenciar comissões parceladas no Firestore
 """
+import time
 from datetime import datetime, timedelta
 from google.cloud import firestore
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+from services.dashboard_counters import CounterDeltas, installment_deltas, diff
+from services.pagination import fetch_page, page_items
+from services.aggregations import aggregate
+from services.repository import get_repository
+
+# Limite de escritas por WriteBatch no Firestore
+MAX_BATCH_WRITES = 500
+# Escritas por parcela no pior caso: a própria parcela e 4 contadores (geral, embaixadora e rollups do mês)
+WRITES_PER_INSTALLMENT = 5
+OVERDUE_PAGE_SIZE = 400
+# Abaixo do --timeout 120 do gunicorn; o restante fica para a próxima chamada
+OVERDUE_TIME_BUDGET = 60.0
 
 
 class CommissionInstallment:
     """Classe para gerenciar parcelas de comissão"""
     
-    def __init__(self, db: firestore.Client):
+    def __init__(self, db: firestore.Client, counters=None):
         self.db = db
         self.collection_name = "commission_installments"
+        # DashboardCounters opcional: mantém os totais de parcelas junto com cada escrita
+        self.counters = counters
+
+    def _apply_counters(self, batch, old_data: Optional[Dict[str, Any]], new_data: Optional[Dict[str, Any]]):
+        if self.counters:
+            self.counters.apply(batch, diff(installment_deltas(old_data), installment_deltas(new_data)))
+    
+    def add_installments_to_batch(self, batch, indication_id: str, ambassador_id: str,
+                                  ambassador_name: str, client_name: str) -> List[str]:
+        """
+        Adiciona as 3 parcelas de R$ 300,00 de uma indicação a um batch
+        
+        Os IDs são gerados localmente, então a indicação e suas parcelas podem
+        ser gravadas no mesmo commit (uma ida ao servidor, tudo ou nada).
+        
+        Args:
+            batch: WriteBatch do Firestore (o commit fica com quem chamou)
+            indication_id: ID da indicação
+            ambassador_id: ID da embaixadora
+            ambassador_name: Nome da embaixadora
+            client_name: Nome do cliente
+            
+        Returns:
+            Lista com os IDs das parcelas adicionadas
+        """
+        base_date = datetime.now()
+        total_commission = 900.0
+        installment_value = 300.0
+        installment_ids = []
+        deltas = CounterDeltas()
+        
+        # Definir as datas das parcelas
+        installment_dates = [
+            base_date,  # 1ª parcela: no mesmo mês
+            base_date + timedelta(days=30),  # 2ª parcela: 30 dias depois
+            base_date + timedelta(days=90)   # 3ª parcela: 90 dias depois
+        ]
+        
+        for i, due_date in enumerate(installment_dates, 1):
+            installment_data = {
+                "indication_id": indication_id,
+                "ambassador_id": ambassador_id,
+                "ambassador_name": ambassador_name,
+                "client_name": client_name,
+                "installment_number": i,
+                "value": installment_value,
+                "due_date": due_date,
+                "status": "pendente",  # pendente, pago, atrasado
+                "payment_date": None,
+                "created_at": base_date,
+                "updated_at": base_date,
+                "total_commission": total_commission,
+                "notes": ""
+            }
+            
+            doc_ref = self.db.collection(self.collection_name).document()
+            batch.set(doc_ref, installment_data)
+            deltas.merge(installment_deltas(installment_data))
+            installment_ids.append(doc_ref.id)
+        
+        # Contadores das 3 parcelas somados em uma única escrita por documento
+        if self.counters:
+            self.counters.apply(batch, deltas)
+        
+        return installment_ids
     
     def create_installments_for_indication(self, indication_id: str, ambassador_id: str, 
                                          ambassador_name: str, client_name: str) -> List[str]:
@@ -28,53 +106,34 @@ class CommissionInstallment:
             Lista com os IDs das parcelas criadas
         """
         try:
-            base_date = datetime.now()
-            total_commission = 900.0
-            installment_value = 300.0
-            installment_ids = []
-            
-            # Definir as datas das parcelas
-            installment_dates = [
-                base_date,  # 1ª parcela: no mesmo mês
-                base_date + timedelta(days=30),  # 2ª parcela: 30 dias depois
-                base_date + timedelta(days=90)   # 3ª parcela: 90 dias depois
-            ]
-            
-            for i, due_date in enumerate(installment_dates, 1):
-                installment_data = {
-                    "indication_id": indication_id,
-                    "ambassador_id": ambassador_id,
-                    "ambassador_name": ambassador_name,
-                    "client_name": client_name,
-                    "installment_number": i,
-                    "value": installment_value,
-                    "due_date": due_date,
-                    "status": "pendente",  # pendente, pago, atrasado
-                    "payment_date": None,
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now(),
-                    "total_commission": total_commission,
-                    "notes": ""
-                }
-                
-                # Adicionar ao Firestore
-                doc_ref = self.db.collection(self.collection_name).add(installment_data)
-                installment_ids.append(doc_ref[1].id)
-                
-                print(f"Parcela {i} criada: R$ {installment_value} - Vencimento: {due_date.strftime('%d/%m/%Y')}")
+            batch = self.db.batch()
+            installment_ids = self.add_installments_to_batch(
+                batch, indication_id, ambassador_id, ambassador_name, client_name
+            )
+            batch.commit()
             
+            print(f"{len(installment_ids)} parcelas criadas para a indicação {indication_id}")
             return installment_ids
             
         except Exception as e:
             print(f"Erro ao criar parcelas: {str(e)}")
             raise e
     
-    def get_installments_by_indication(self, indication_id: str) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _project(query, fields: Optional[List[str]], required: tuple = ()):
+        """Aplica select() com os campos pedidos e os usados pelos filtros em memória"""
+        if not fields:
+            return query
+        return query.select(list(dict.fromkeys([*fields, *required])))
+    
+    def get_installments_by_indication(self, indication_id: str,
+                                       fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Busca todas as parcelas de uma indicação específica
         
         Args:
             indication_id: ID da indicação
+            fields: Campos a retornar (opcional, padrão: documento inteiro)
             
         Returns:
             Lista de parcelas
@@ -84,7 +143,7 @@ class CommissionInstallment:
                 field_path="indication_id", op_string="==", value=indication_id
             ).order_by("installment_number")
             
-            docs = query.stream()
+            docs = self._project(query, fields).stream()
             installments = []
             
             for doc in docs:
@@ -99,13 +158,15 @@ class CommissionInstallment:
             return []
     
     def get_installments_by_ambassador(self, ambassador_id: str, 
-                                     status_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+                                     status_filter: Optional[str] = None,
+                                     fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Busca todas as parcelas de uma embaixadora
         
         Args:
             ambassador_id: ID da embaixadora
             status_filter: Filtro por status (opcional)
+            fields: Campos a retornar (opcional, padrão: documento inteiro)
             
         Returns:
             Lista de parcelas
@@ -119,7 +180,7 @@ class CommissionInstallment:
                 query = query.where(field_path="status", op_string="==", value=status_filter)
             
             query = query.order_by("due_date")
-            docs = query.stream()
+            docs = self._project(query, fields).stream()
             installments = []
             
             for doc in docs:
@@ -133,12 +194,14 @@ class CommissionInstallment:
             print(f"Erro ao buscar parcelas da embaixadora {ambassador_id}: {str(e)}")
             return []
     
-    def get_all_installments(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    def get_all_installments(self, filters: Optional[Dict[str, Any]] = None,
+                             fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Busca todas as parcelas com filtros opcionais
         
         Args:
             filters: Dicionário com filtros (status, ambassador_id, month, year)
+            fields: Campos a retornar (opcional; due_date é incluído se houver filtro de data)
             
         Returns:
             Lista de parcelas
@@ -154,7 +217,7 @@ class CommissionInstallment:
                     query = query.where(field_path="ambassador_id", op_string="==", value=filters["ambassador_id"])
             
             query = query.order_by("due_date", direction=firestore.Query.DESCENDING)
-            docs = query.stream()
+            docs = self._project(query, fields, required=("due_date",)).stream()
             installments = []
             
             for doc in docs:
@@ -181,9 +244,95 @@ class CommissionInstallment:
             print(f"Erro ao buscar todas as parcelas: {str(e)}")
             return []
     
+    def _filtered_query(self, filters: Dict[str, Any]):
+        """
+        Monta a consulta de parcelas a partir dos filtros
+        
+        Returns:
+            (coleção, consulta filtrada, mês a filtrar em memória ou None)
+        """
+        collection = self.db.collection(self.collection_name)
+        query = collection
+        
+        if filters.get("status"):
+            query = query.where(field_path="status", op_string="==", value=filters["status"])
+        
+        if filters.get("ambassador_id"):
+            query = query.where(field_path="ambassador_id", op_string="==", value=filters["ambassador_id"])
+        
+        # Mês/ano viram intervalo de vencimento para que o filtro não quebre a paginação
+        month = int(filters["month"]) if filters.get("month") else None
+        if filters.get("year"):
+            year = int(filters["year"])
+            start = datetime(year, month or 1, 1)
+            if month:
+                end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+            else:
+                end = datetime(year + 1, 1, 1)
+            query = query.where(field_path="due_date", op_string=">=", value=start)
+            query = query.where(field_path="due_date", op_string="<", value=end)
+            month = None
+        
+        return collection, query, month
+    
+    def get_installments_page(self, filters: Optional[Dict[str, Any]], limit: int,
+                              cursor: Optional[str] = None, descending: bool = True,
+                              fields: Optional[List[str]] = None) -> tuple:
+        """
+        Busca uma página de parcelas ordenada por vencimento
+        
+        Args:
+            filters: Dicionário com filtros (status, ambassador_id, month, year)
+            limit: Tamanho da página
+            cursor: ID da última parcela da página anterior
+            descending: Ordem decrescente de vencimento
+            fields: Campos a retornar (opcional)
+            
+        Returns:
+            (lista de parcelas, cursor da próxima página ou None)
+        """
+        collection, query, month = self._filtered_query(filters or {})
+        query = self._project(query, fields, required=("due_date",))
+        
+        docs, next_cursor = fetch_page(collection, query, limit, cursor, order_by="due_date", descending=descending)
+        installments = page_items(docs)
+        
+        # Mês sem ano não vira intervalo; filtra dentro da página
+        if month:
+            installments = [i for i in installments if i["due_date"].month == month]
+        
+        return installments, next_cursor
+    
+    def iter_installments(self, filters: Optional[Dict[str, Any]] = None, descending: bool = True,
+                          fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Percorre as parcelas filtradas à medida que chegam do Firestore
+        
+        Usado nas exportações em streaming; não monta a lista completa.
+        
+        Args:
+            filters: Dicionário com filtros (status, ambassador_id, month, year)
+            descending: Ordem decrescente de vencimento
+            fields: Campos a retornar (opcional)
+            
+        Yields:
+            Parcelas com "id"
+        """
+        _, query, month = self._filtered_query(filters or {})
+        query = self._project(query, fields, required=("due_date",))
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        
+        for doc in query.order_by("due_date", direction=direction).stream():
+            installment_data = doc.to_dict()
+            if month and installment_data["due_date"].month != month:
+                continue
+            installment_data["id"] = doc.id
+            yield installment_data
+    
     def update_installment_status(self, installment_id: str, new_status: str, 
                                 payment_date: Optional[datetime] = None, 
-                                notes: Optional[str] = None) -> bool:
+                                notes: Optional[str] = None,
+                                current_data: Optional[Dict[str, Any]] = None) -> bool:
         """
         Atualiza o status de uma parcela
         
@@ -192,6 +341,7 @@ class CommissionInstallment:
             new_status: Novo status (pendente, pago, atrasado)
             payment_date: Data do pagamento (opcional)
             notes: Observações (opcional)
+            current_data: Dados atuais da parcela, se já lidos (evita nova leitura)
             
         Returns:
             True se atualizado com sucesso
@@ -215,7 +365,22 @@ class CommissionInstallment:
             if new_status == "pago" and not payment_date:
                 update_data["payment_date"] = datetime.now()
             
-            self.db.collection(self.collection_name).document(installment_id).update(update_data)
+            installment_ref = self.db.collection(self.collection_name).document(installment_id)
+
+            if self.counters:
+                # Mudança de status move valor entre os contadores de parcelas
+                if current_data is None:
+                    current_data = get_repository(self.db).get(self.collection_name, installment_id)
+                    if current_data is None:
+                        raise ValueError("Parcela não encontrada")
+                batch = self.db.batch()
+                batch.update(installment_ref, update_data)
+                self._apply_counters(batch, current_data, {**current_data, **update_data})
+                batch.commit()
+            else:
+                installment_ref.update(update_data)
+            get_repository(self.db).forget(self.collection_name, installment_id)
+
             print(f"Parcela {installment_id} atualizada para status: {new_status}")
             return True
             
@@ -223,39 +388,74 @@ class CommissionInstallment:
             print(f"Erro ao atualizar parcela {installment_id}: {str(e)}")
             return False
     
-    def check_overdue_installments(self) -> List[Dict[str, Any]]:
+    def check_overdue_installments(self, page_size: int = OVERDUE_PAGE_SIZE,
+                                   time_budget: float = OVERDUE_TIME_BUDGET) -> Dict[str, Any]:
         """
-        Verifica e marca parcelas em atraso
+        Marca como atrasadas as parcelas pendentes com vencimento passado
+        
+        A consulta já filtra status e vencimento (índice status + due_date) e as
+        atualizações são gravadas em batches de até 500 operações, junto com os
+        contadores. Parcelas marcadas saem da consulta, então a varredura pode
+        ser interrompida e retomada: ao esgotar time_budget ela para com
+        done=False e a próxima chamada continua de onde parou.
         
+        Args:
+            page_size: Parcelas lidas por consulta
+            time_budget: Segundos disponíveis antes de devolver o progresso
+            
         Returns:
-            Lista de parcelas que foram marcadas como atrasadas
+            {"updated": total marcado, "batches": commits feitos, "done": se terminou}
         """
-        try:
-            current_date = datetime.now()
-            
-            # Buscar parcelas pendentes com data de vencimento passada
-            query = self.db.collection(self.collection_name).where(
-                field_path="status", op_string="==", value="pendente"
-            )
+        current_date = datetime.now()
+        started = time.monotonic()
+        query = self.db.collection(self.collection_name).where(
+            field_path="status", op_string="==", value="pendente"
+        ).where(
+            field_path="due_date", op_string="<", value=current_date
+        ).order_by("due_date")
+        
+        progress = {"updated": 0, "batches": 0, "done": False}
+        
+        while time.monotonic() - started < time_budget:
+            docs = list(query.limit(page_size).stream())
+            if not docs:
+                progress["done"] = True
+                break
             
-            docs = query.stream()
-            overdue_installments = []
+            batch = self.db.batch()
+            writes = 0
+            deltas = CounterDeltas()
+            update_data = {"status": "atrasado", "updated_at": current_date}
             
             for doc in docs:
                 installment_data = doc.to_dict()
-                due_date = installment_data.get("due_date")
+                batch.update(doc.reference, update_data)
+                writes += 1
+                if self.counters:
+                    deltas.merge(diff(installment_deltas(installment_data),
+                                      installment_deltas({**installment_data, **update_data})))
                 
-                if due_date and due_date < current_date:
-                    # Marcar como atrasada
-                    self.update_installment_status(doc.id, "atrasado")
-                    installment_data["id"] = doc.id
-                    overdue_installments.append(installment_data)
+                # Cada documento de contador é mais uma escrita; fecha o batch antes que a próxima parcela estoure o limite
+                if writes + len(deltas.fields) > MAX_BATCH_WRITES - WRITES_PER_INSTALLMENT:
+                    self._commit_overdue(batch, deltas, writes, progress)
+                    batch, writes, deltas = self.db.batch(), 0, CounterDeltas()
             
-            return overdue_installments
+            if writes:
+                self._commit_overdue(batch, deltas, writes, progress)
             
-        except Exception as e:
-            print(f"Erro ao verificar parcelas em atraso: {str(e)}")
-            return []
+            if len(docs) < page_size:
+                progress["done"] = True
+                break
+        
+        return progress
+    
+    def _commit_overdue(self, batch, deltas: CounterDeltas, writes: int, progress: Dict[str, Any]) -> None:
+        if self.counters:
+            self.counters.apply(batch, deltas)
+        batch.commit()
+        progress["updated"] += writes
+        progress["batches"] += 1
+        print(f"Varredura de atraso: {progress['updated']} parcelas marcadas ({progress['batches']} batches)")
     
     def get_commission_summary(self, ambassador_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -268,41 +468,28 @@ class CommissionInstallment:
             Dicionário com resumo das comissões
         """
         try:
+            if self.counters:
+                counters = self.counters.get_installment_counters(ambassador_id)
+                if counters is not None:
+                    return self._summary_from_counters(counters)
+
             query = self.db.collection(self.collection_name)
             
             if ambassador_id:
                 query = query.where(field_path="ambassador_id", op_string="==", value=ambassador_id)
             
-            docs = query.stream()
-            
+            # Sem contadores: count/sum no servidor, uma consulta por status (sem ler as parcelas)
+            total = aggregate(query, count=True, sum_fields=["value"])
             summary = {
-                "total_installments": 0,
-                "total_value": 0.0,
-                "paid_installments": 0,
-                "paid_value": 0.0,
-                "pending_installments": 0,
-                "pending_value": 0.0,
-                "overdue_installments": 0,
-                "overdue_value": 0.0
+                "total_installments": total["count"],
+                "total_value": float(total["sum"]["value"])
             }
             
-            for doc in docs:
-                installment_data = doc.to_dict()
-                value = installment_data.get("value", 0.0)
-                status = installment_data.get("status", "pendente")
-                
-                summary["total_installments"] += 1
-                summary["total_value"] += value
-                
-                if status == "pago":
-                    summary["paid_installments"] += 1
-                    summary["paid_value"] += value
-                elif status == "pendente":
-                    summary["pending_installments"] += 1
-                    summary["pending_value"] += value
-                elif status == "atrasado":
-                    summary["overdue_installments"] += 1
-                    summary["overdue_value"] += value
+            for status, key in (("pago", "paid"), ("pendente", "pending"), ("atrasado", "overdue")):
+                by_status = aggregate(query.where(field_path="status", op_string="==", value=status),
+                                      count=True, sum_fields=["value"])
+                summary[f"{key}_installments"] = by_status["count"]
+                summary[f"{key}_value"] = float(by_status["sum"]["value"])
             
             return summary
             
@@ -310,3 +497,26 @@ class CommissionInstallment:
             print(f"Erro ao gerar resumo das comissões: {str(e)}")
             return {}
 
+    @staticmethod
+    def _summary_from_counters(counters: Dict[str, Any]) -> Dict[str, Any]:
+        """Monta o resumo a partir dos contadores pré-agregados"""
+        by_status = counters.get("installments", {})
+
+        def status_totals(status: str):
+            totals = by_status.get(status, {})
+            return totals.get("count", 0), float(totals.get("value", 0.0))
+
+        paid_count, paid_value = status_totals("pago")
+        pending_count, pending_value = status_totals("pendente")
+        overdue_count, overdue_value = status_totals("atrasado")
+
+        return {
+            "total_installments": counters.get("installments_total", 0),
+            "total_value": float(counters.get("installments_value", 0.0)),
+            "paid_installments": paid_count,
+            "paid_value": paid_value,
+            "pending_installments": pending_count,
+            "pending_value": pending_value,
+            "overdue_installments": overdue_count,
+            "overdue_value": overdue_value
+        }
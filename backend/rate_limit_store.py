@@ -0,0 +1,205 @@
+"""
+Armazenamento do rate limiting
+
+Vários limites da mesma requisição (ex.: 10 por minuto e 100 por hora) são
+avaliados juntos: a requisição só é registrada se passar em todos. No Redis é
+uma janela deslizante (log de requisições) em um único script Lua (uma ida ao
+servidor, atômico, sem corrida entre leitura e escrita); sem Redis,
+TokenBucketStore faz o controle no processo com memória limitada.
+"""
+import heapq
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# (chave, limite, janela em segundos)
+Rule = Tuple[str, int, int]
+
+# KEYS: uma chave por limite
+# ARGV: agora (ms), membro único, depois pares limite / janela (ms)
+# Retorno: permitido (0/1) e, por chave, contagem na janela, espera (ms) e reset (ms)
+SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local allowed = 1
+local counts = {}
+local retries = {}
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + 2 * i])
+    local window = tonumber(ARGV[2 + 2 * i])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+    counts[i] = count
+    retries[i] = 0
+    if count >= limit then
+        allowed = 0
+        local blocking = redis.call('ZRANGE', key, count - limit, count - limit, 'WITHSCORES')
+        retries[i] = tonumber(blocking[2]) + window - now
+    end
+end
+
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 + 2 * i])
+    if allowed == 1 then
+        redis.call('ZADD', key, now, member)
+        redis.call('PEXPIRE', key, window)
+        counts[i] = counts[i] + 1
+    end
+    local reset = now + window
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    if oldest[2] then
+        reset = tonumber(oldest[2]) + window
+    end
+    table.insert(result, counts[i])
+    table.insert(result, retries[i])
+    table.insert(result, reset)
+end
+return result
+"""
+
+
+def rule_info(limit: int, count: int, retry_ms: float, reset_ms: float) -> Dict:
+    """Informações de um limite no formato dos cabeçalhos X-RateLimit-*"""
+    return {
+        'limit': limit,
+        'remaining': max(limit - count, 0),
+        'reset_time': int(math.ceil(reset_ms / 1000)),
+        'retry_after': int(math.ceil(retry_ms / 1000)) if retry_ms > 0 else None
+    }
+
+
+class RedisSlidingWindowStore:
+    """Janela deslizante no Redis (sorted set por chave) avaliada por um script Lua"""
+
+    def __init__(self, client):
+        self.client = client
+        # EVALSHA com recarga automática do script se o servidor não o conhecer
+        self._script = client.register_script(SLIDING_WINDOW_LUA)
+
+    def hit(self, rules: List[Rule], now: Optional[float] = None) -> Tuple[bool, List[Dict]]:
+        """
+        Registra uma requisição se todos os limites permitirem
+
+        Returns:
+            (permitido, informações de cada limite na ordem de rules)
+        """
+        now_ms = int((now if now is not None else time.time()) * 1000)
+        args = [now_ms, f"{now_ms}-{uuid.uuid4().hex[:12]}"]
+        for _, limit, window in rules:
+            args += [limit, window * 1000]
+
+        reply = self._script(keys=[key for key, _, _ in rules], args=args)
+        infos = []
+        for index, (_, limit, _) in enumerate(rules):
+            count, retry_ms, reset_ms = (int(value) for value in reply[1 + 3 * index:4 + 3 * index])
+            infos.append(rule_info(limit, count, retry_ms, reset_ms))
+        return bool(int(reply[0])), infos
+
+
+class _Shard:
+    """Buckets de uma fração das chaves, com trava própria"""
+
+    __slots__ = ("lock", "buckets", "expiry")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # chave -> [fichas, atualizado em, cheio em]; ordem = uso mais recente por último
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        # (cheio em, chave); entradas antigas são ignoradas ao sair do heap
+        self.expiry: List[Tuple[float, str]] = []
+
+
+class TokenBucketStore:
+    """
+    Token bucket em memória (fallback sem Redis)
+
+    Cada limite é um bucket com capacidade `limite` que se recompõe em
+    `janela` segundos. As chaves são divididas em shards com trava própria (as
+    chaves de uma mesma requisição compartilham o hash tag {identificador} e
+    caem no mesmo shard). Um bucket cheio equivale a um novo e sai pelo heap
+    de expiração, sem varrer o dicionário; acima de max_entries o menos usado
+    recentemente é descartado, então a memória fica limitada mesmo com
+    milhares de IPs diferentes.
+    """
+
+    # Expirações processadas por requisição (o restante fica para as próximas)
+    EXPIRE_BATCH = 64
+
+    def __init__(self, shards: int = 16, max_entries: int = 100000):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_capacity = max(1, max_entries // shards)
+
+    def _shard_for(self, key: str) -> _Shard:
+        start = key.find("{")
+        end = key.find("}", start + 1)
+        tag = key[start + 1:end] if start != -1 and end > start + 1 else key
+        return self._shards[hash(tag) % len(self._shards)]
+
+    @staticmethod
+    def _expire(shard: _Shard, now: float, limit: Optional[int] = None) -> int:
+        removed = 0
+        while shard.expiry and shard.expiry[0][0] <= now and (limit is None or removed < limit):
+            full_at, key = heapq.heappop(shard.expiry)
+            bucket = shard.buckets.get(key)
+            if bucket is not None and bucket[2] == full_at:
+                del shard.buckets[key]
+                removed += 1
+        return removed
+
+    def hit(self, rules: List[Rule], now: Optional[float] = None) -> Tuple[bool, List[Dict]]:
+        """Mesmo contrato de RedisSlidingWindowStore.hit"""
+        now = now if now is not None else time.time()
+        shard = self._shard_for(rules[0][0])
+        with shard.lock:
+            self._expire(shard, now, self.EXPIRE_BATCH)
+
+            allowed = True
+            states = []
+            for key, limit, window in rules:
+                rate = limit / window
+                bucket = shard.buckets.get(key)
+                if bucket is None:
+                    tokens = float(limit)
+                else:
+                    tokens = min(float(limit), bucket[0] + (now - bucket[1]) * rate)
+                    shard.buckets.move_to_end(key)
+                retry = 0.0
+                if tokens < 1:
+                    allowed = False
+                    retry = (1 - tokens) / rate
+                states.append((key, limit, rate, tokens, retry))
+
+            infos = []
+            for key, limit, rate, tokens, retry in states:
+                if allowed:
+                    tokens -= 1
+                full_at = now + (limit - tokens) / rate
+                if tokens < limit:
+                    shard.buckets[key] = [tokens, now, full_at]
+                    heapq.heappush(shard.expiry, (full_at, key))
+                infos.append(rule_info(limit, limit - int(tokens), retry * 1000, full_at * 1000))
+
+            while len(shard.buckets) > self._shard_capacity:
+                shard.buckets.popitem(last=False)
+            if len(shard.expiry) > 2 * len(shard.buckets) + self.EXPIRE_BATCH:
+                # Muitas entradas antigas no heap: refaz a partir dos buckets vivos
+                shard.expiry = [(bucket[2], key) for key, bucket in shard.buckets.items()]
+                heapq.heapify(shard.expiry)
+            return allowed, infos
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Remove buckets já recompostos; retorna quantos foram removidos"""
+        now = now if now is not None else time.time()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += self._expire(shard, now)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
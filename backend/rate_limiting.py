@@ -3,17 +3,18 @@ Sistema de Rate Limiting para o projeto Beepy
 Implementa controle de taxa de requisições para melhorar a segurança
 """
 import os
-import time
 import logging
 from functools import wraps
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
 from flask import request, jsonify, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from utils.jwt_context import current_identity
 import redis
 from datetime import datetime, timedelta
 
+from rate_limit_store import RedisSlidingWindowStore, TokenBucketStore
+
 logger = logging.getLogger(__name__)
 
 class CustomRateLimiter:
@@ -22,83 +23,57 @@ class CustomRateLimiter:
     def __init__(self, redis_url: str = None):
         # Configurar Redis (usar in-memory se Redis não estiver disponível)
         self.redis_client = None
+        self.redis_store = None
         if redis_url:
             try:
                 self.redis_client = redis.from_url(redis_url)
                 self.redis_client.ping()  # Testar conexão
+                self.redis_store = RedisSlidingWindowStore(self.redis_client)
                 logger.info("Conectado ao Redis para rate limiting")
             except Exception as e:
                 logger.warning(f"Falha ao conectar ao Redis: {e}. Usando cache em memória.")
                 self.redis_client = None
+                self.redis_store = None
         
-        # Cache em memória como fallback
-        self.memory_cache: Dict[str, Dict] = {}
-        self.cleanup_interval = 300  # 5 minutos
-        self.last_cleanup = time.time()
+        # Token bucket em memória como fallback (limitado a RATE_LIMIT_MAX_ENTRIES chaves)
+        self.memory_store = TokenBucketStore(max_entries=int(os.getenv('RATE_LIMIT_MAX_ENTRIES', 100000)))
     
-    def _get_key(self, identifier: str, endpoint: str) -> str:
-        """Gera chave única para rate limiting"""
-        return f"rate_limit:{identifier}:{endpoint}"
+    def _get_key(self, identifier: str, endpoint: str, window: int) -> str:
+        """Gera chave única para rate limiting (uma por janela)"""
+        # Hash tag {identifier}: as chaves de uma requisição ficam no mesmo slot do Redis Cluster
+        return f"rate_limit:{{{identifier}}}:{endpoint}:{window}"
     
-    def _cleanup_memory_cache(self):
-        """Remove entradas expiradas do cache em memória"""
-        current_time = time.time()
-        if current_time - self.last_cleanup < self.cleanup_interval:
-            return
+    def check(self, identifier: str, endpoint: str, limits: List[Tuple[int, int]]) -> Tuple[bool, Dict]:
+        """
+        Avalia vários limites de uma vez (ex.: [(10, 60), (100, 3600)])
         
-        expired_keys = []
-        for key, data in self.memory_cache.items():
-            if data.get('expires_at', 0) < current_time:
-                expired_keys.append(key)
+        A requisição só é contada se todos os limites permitirem. Com Redis é
+        uma única chamada ao script Lua, atômica entre workers.
         
-        for key in expired_keys:
-            del self.memory_cache[key]
+        Args:
+            identifier: Identificador único (IP, user_id, etc.)
+            endpoint: Nome do endpoint
+            limits: Pares (número máximo de requisições, janela em segundos)
         
-        self.last_cleanup = current_time
-        logger.debug(f"Limpeza do cache: {len(expired_keys)} entradas removidas")
-    
-    def _get_rate_limit_data(self, key: str) -> Dict:
-        """Obtém dados de rate limiting"""
-        if self.redis_client:
-            try:
-                data = self.redis_client.hgetall(key)
-                if data:
-                    return {
-                        'count': int(data.get(b'count', 0)),
-                        'window_start': float(data.get(b'window_start', 0)),
-                        'expires_at': float(data.get(b'expires_at', 0))
-                    }
-            except Exception as e:
-                logger.error(f"Erro ao acessar Redis: {e}")
+        Returns:
+            (is_allowed, rate_limit_info) com as informações do limite mais restritivo
+        """
+        rules = [(self._get_key(identifier, endpoint, window), limit, window) for limit, window in limits]
         
-        # Fallback para cache em memória
-        self._cleanup_memory_cache()
-        return self.memory_cache.get(key, {
-            'count': 0,
-            'window_start': time.time(),
-            'expires_at': time.time() + 3600
-        })
-    
-    def _set_rate_limit_data(self, key: str, data: Dict, ttl: int = 3600):
-        """Define dados de rate limiting"""
-        if self.redis_client:
+        allowed, infos = None, None
+        if self.redis_store:
             try:
-                pipe = self.redis_client.pipeline()
-                pipe.hset(key, mapping={
-                    'count': data['count'],
-                    'window_start': data['window_start'],
-                    'expires_at': data['expires_at']
-                })
-                pipe.expire(key, ttl)
-                pipe.execute()
-                return
+                allowed, infos = self.redis_store.hit(rules)
             except Exception as e:
-                logger.error(f"Erro ao salvar no Redis: {e}")
+                logger.error(f"Erro ao acessar Redis: {e}")
+        if infos is None:
+            allowed, infos = self.memory_store.hit(rules)
         
-        # Fallback para cache em memória
-        self.memory_cache[key] = data
+        if allowed:
+            return True, min(infos, key=lambda info: info['remaining'])
+        return False, max(infos, key=lambda info: info['retry_after'] or 0)
     
-    def is_allowed(self, identifier: str, endpoint: str, limit: int, window: int) -> tuple[bool, Dict]:
+    def is_allowed(self, identifier: str, endpoint: str, limit: int, window: int) -> Tuple[bool, Dict]:
         """
         Verifica se a requisição é permitida
         
@@ -111,68 +86,23 @@ class CustomRateLimiter:
         Returns:
             (is_allowed, rate_limit_info)
         """
-        key = self._get_key(identifier, endpoint)
-        current_time = time.time()
-        
-        # Obter dados atuais
-        data = self._get_rate_limit_data(key)
-        
-        # Verificar se a janela expirou
-        if current_time - data['window_start'] >= window:
-            # Nova janela
-            data = {
-                'count': 1,
-                'window_start': current_time,
-                'expires_at': current_time + window
-            }
-            self._set_rate_limit_data(key, data, window)
-            
-            return True, {
-                'limit': limit,
-                'remaining': limit - 1,
-                'reset_time': int(current_time + window),
-                'retry_after': None
-            }
-        
-        # Verificar se excedeu o limite
-        if data['count'] >= limit:
-            retry_after = int(data['window_start'] + window - current_time)
-            return False, {
-                'limit': limit,
-                'remaining': 0,
-                'reset_time': int(data['window_start'] + window),
-                'retry_after': retry_after
-            }
-        
-        # Incrementar contador
-        data['count'] += 1
-        self._set_rate_limit_data(key, data, window)
-        
-        return True, {
-            'limit': limit,
-            'remaining': limit - data['count'],
-            'reset_time': int(data['window_start'] + window),
-            'retry_after': None
-        }
+        return self.check(identifier, endpoint, [(limit, window)])
 
 # Instância global do rate limiter
 custom_limiter = CustomRateLimiter(os.getenv('REDIS_URL'))
 
 def get_identifier() -> str:
     """Obtém identificador para rate limiting"""
-    try:
-        # Tentar obter usuário autenticado
-        verify_jwt_in_request(optional=True)
-        user_email = get_jwt_identity()
-        if user_email:
-            return f"user:{user_email}"
-    except:
-        pass
+    # Usuário autenticado (token já verificado no before_request)
+    user_email = current_identity()
+    if user_email:
+        return f"user:{user_email}"
     
     # Fallback para IP
     return f"ip:{get_remote_address()}"
 
-def rate_limit(limit: int, window: int = 3600, per_user: bool = True, endpoint_specific: bool = True):
+def rate_limit(limit: int, window: int = 3600, per_user: bool = True, endpoint_specific: bool = True,
+               extra_limits: Optional[List[Tuple[int, int]]] = None):
     """
     Decorador para rate limiting
     
@@ -181,7 +111,10 @@ def rate_limit(limit: int, window: int = 3600, per_user: bool = True, endpoint_s
         window: Janela de tempo em segundos (padrão: 1 hora)
         per_user: Se True, aplica limite por usuário; se False, por IP
         endpoint_specific: Se True, aplica limite por endpoint específico
+        extra_limits: Outros pares (limite, janela) avaliados junto, ex.: [(10, 60)]
     """
+    limits = [(limit, window)] + list(extra_limits or [])
+    
     def decorator(f: Callable) -> Callable:
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -198,9 +131,7 @@ def rate_limit(limit: int, window: int = 3600, per_user: bool = True, endpoint_s
                 endpoint = "global"
             
             # Verificar rate limit
-            is_allowed, rate_info = custom_limiter.is_allowed(
-                identifier, endpoint, limit, window
-            )
+            is_allowed, rate_info = custom_limiter.check(identifier, endpoint, limits)
             
             if not is_allowed:
                 logger.warning(f"Rate limit excedido para {identifier} no endpoint {endpoint}")
@@ -351,14 +282,7 @@ def get_rate_limit_stats(identifier: str = None, hours: int = 24) -> Dict:
 # Função para limpar dados antigos (executar periodicamente)
 def cleanup_rate_limit_data():
     """Limpa dados antigos de rate limiting"""
-    if custom_limiter.redis_client:
-        try:
-            # Implementar limpeza no Redis
-            # Por simplicidade, apenas logamos
-            logger.info("Limpeza de dados de rate limiting executada")
-        except Exception as e:
-            logger.error(f"Erro na limpeza de rate limiting: {e}")
-    else:
-        custom_limiter._cleanup_memory_cache()
-        logger.info("Limpeza de cache em memória executada")
+    # No Redis as chaves expiram sozinhas (PEXPIRE no script); o fallback em memória é limpo aqui
+    removed = custom_limiter.memory_store.cleanup()
+    logger.info(f"Limpeza de cache em memória executada: {removed} entradas removidas")
 
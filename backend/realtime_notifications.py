@@ -3,15 +3,21 @@ Sistema de notificações em tempo real para o projeto Beepy
 Usando Server-Sent Events (SSE) para comunicação em tempo real
 """
 import json
+import os
 import time
 import threading
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
 from flask import Response, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import get_jwt_identity
+from utils.jwt_context import jwt_required
 import logging
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 import queue
+from services.deletion_log import DELETIONS_COLLECTION
+from utils.cache import get_cached_user
+from utils.json_provider import dumps as json_dumps
 
 logger = logging.getLogger(__name__)
 
@@ -242,6 +248,306 @@ def create_notification_routes(app):
         
         return jsonify({'unread_count': count})
 
+class ChangeFeedFull(Exception):
+    """Limite de streams abertos no worker atingido"""
+
+
+class ChangeFeed:
+    """
+    Feed de alterações de documentos (upsert/delete) para os clientes via SSE
+
+    Cada processo escuta, por coleção, só os documentos com data de
+    atualização posterior à sua subida: o snapshot inicial fica quase vazio e
+    a memória do listener cresce com o que muda, não com o tamanho da coleção.
+    Exclusões chegam pelos registros de deleted_documents (ver
+    services/deletion_log.py). Os eventos recebem um número de sequência e
+    ficam num buffer circular para que o cliente retome a conexão pelo
+    Last-Event-ID sem recarregar.
+
+    Cada stream ocupa uma thread do worker gthread enquanto a aba fica aberta:
+    max_streams (CHANGE_FEED_MAX_STREAMS) limita os streams por worker para
+    sobrar threads à API REST; acima dele a rota responde 503 e o cliente
+    tenta de novo com backoff.
+    """
+
+    # Coleção -> campo que identifica a embaixadora dona do documento
+    COLLECTIONS = {
+        "indications": "ambassadorId",
+        "commissions": "ambassadorId",
+        "commission_installments": "ambassador_id",
+        "users": None,
+    }
+
+    # Coleção -> campo com a data da última escrita (filtro dos listeners)
+    UPDATED_FIELDS = {
+        "indications": "updatedAt",
+        "commissions": "updatedAt",
+        "commission_installments": "updated_at",
+        "users": "updatedAt",
+    }
+
+    # Coleção -> campo com a dona anterior, gravado quando o documento troca de embaixadora
+    PREVIOUS_OWNER_FIELDS = {
+        "commissions": "previousAmbassadorId",
+    }
+
+    # Margem para diferença de relógio entre os servidores que gravam
+    START_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, buffer_size: int = 1000, queue_size: int = 200, max_owners: int = 10000,
+                 max_streams: Optional[int] = None):
+        self.lock = threading.Lock()
+        self.subscribers: Dict[queue.Queue, Dict[str, Any]] = {}
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self.seq = 0
+        # Identifica o processo: IDs de outro processo/reinício forçam reset no cliente
+        self.epoch = uuid.uuid4().hex[:8]
+        # Última dona conhecida por documento, para avisar a anterior quando ele muda de dona
+        self._owners: OrderedDict = OrderedDict()
+        self.max_owners = max_owners
+        self._watches = []
+        self._started = False
+
+    # Origem dos eventos
+
+    def start(self, db):
+        """Inicia os listeners do Firestore (uma vez por processo)"""
+        with self.lock:
+            if self._started or db is None:
+                return
+            self._started = True
+
+        since = datetime.now() - self.START_MARGIN
+        for collection, updated_field in self.UPDATED_FIELDS.items():
+            query = db.collection(collection).where(field_path=updated_field, op_string=">=", value=since)
+            self._watches.append(query.on_snapshot(self._snapshot_handler(collection)))
+        deletions = db.collection(DELETIONS_COLLECTION).where(
+            field_path="deletedAt", op_string=">=", value=since)
+        self._watches.append(deletions.on_snapshot(self._deletion_handler()))
+        logger.info(f"Feed de alterações iniciado (epoch {self.epoch})")
+
+    def _snapshot_handler(self, collection: str):
+        state = {"initial": True}
+
+        def on_snapshot(collection_snapshot, changes, read_time):
+            # O primeiro snapshot traz o que mudou na margem de início: os clientes já carregaram via GET
+            if state["initial"]:
+                state["initial"] = False
+                return
+            for change in changes:
+                # Um documento só sai do filtro ao ser excluído; a exclusão vem de deleted_documents
+                if change.type.name == "REMOVED":
+                    continue
+                self.publish(collection, "upsert", change.document.id, change.document.to_dict() or {})
+
+        return on_snapshot
+
+    def _deletion_handler(self):
+        state = {"initial": True}
+
+        def on_snapshot(collection_snapshot, changes, read_time):
+            if state["initial"]:
+                state["initial"] = False
+                return
+            for change in changes:
+                if change.type.name != "ADDED":
+                    continue
+                record = change.document.to_dict() or {}
+                if record.get("collection") in self.COLLECTIONS:
+                    self.publish(record["collection"], "delete", record.get("documentId"), {},
+                                 owner=record.get("owner"))
+
+        return on_snapshot
+
+    def stop(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+        self._started = False
+
+    # Distribuição
+
+    def publish(self, collection: str, op: str, doc_id: str, data: Dict[str, Any],
+                owner: Optional[str] = None):
+        """Registra e distribui uma alteração para os assinantes autorizados"""
+        data = dict(data)
+        data.pop("password", None)
+
+        if owner is None:
+            owner_field = self.COLLECTIONS.get(collection)
+            owner = data.get(owner_field) if owner_field else doc_id
+
+        key = (collection, doc_id)
+        with self.lock:
+            if op == "upsert":
+                # Sem histórico no processo (reinício), vale a dona anterior gravada no documento
+                if key in self._owners:
+                    previous = self._owners.pop(key)
+                else:
+                    previous = data.get(self.PREVIOUS_OWNER_FIELDS.get(collection, ""))
+                self._owners[key] = owner
+                if len(self._owners) > self.max_owners:
+                    self._owners.popitem(last=False)
+                # Documento passou para outra embaixadora: some da lista da anterior
+                if previous is not None and previous != owner:
+                    self._dispatch(collection, "delete", doc_id, previous, None)
+            else:
+                self._owners.pop(key, None)
+
+            self._dispatch(collection, op, doc_id, owner, data if op == "upsert" else None)
+
+    def _dispatch(self, collection: str, op: str, doc_id: str, owner: Optional[str],
+                  data: Optional[Dict[str, Any]]):
+        """Numera o evento, guarda no buffer e entrega aos assinantes (com self.lock)"""
+        self.seq += 1
+        event = {
+            "seq": self.seq,
+            "collection": collection,
+            "op": op,
+            "id": doc_id,
+            "owner": owner,
+            "data": data,
+        }
+        self.buffer.append(event)
+
+        overflowed = []
+        for subscriber_queue, scope in self.subscribers.items():
+            if not self._allowed(event, scope):
+                continue
+            try:
+                subscriber_queue.put_nowait(event)
+            except queue.Full:
+                overflowed.append(subscriber_queue)
+
+        # Cliente lento: desconecta; ele recarrega ao receber o reset
+        for subscriber_queue in overflowed:
+            del self.subscribers[subscriber_queue]
+            self._force_reset(subscriber_queue)
+
+    @staticmethod
+    def _force_reset(subscriber_queue: queue.Queue):
+        try:
+            while True:
+                subscriber_queue.get_nowait()
+        except queue.Empty:
+            pass
+        subscriber_queue.put_nowait(None)
+
+    @staticmethod
+    def _allowed(event: Dict[str, Any], scope: Dict[str, Any]) -> bool:
+        """Admin recebe tudo; embaixadora só os próprios documentos"""
+        if scope["role"] == "admin":
+            return True
+        return event["owner"] == scope["user_id"]
+
+    def event_id(self, event: Dict[str, Any]) -> str:
+        return f"{self.epoch}:{event['seq']}"
+
+    def subscribe(self, user_id: str, role: str,
+                  last_event_id: Optional[str] = None) -> Tuple[queue.Queue, Optional[List[Dict[str, Any]]]]:
+        """
+        Registra um assinante
+
+        Returns:
+            (fila de eventos, eventos perdidos desde last_event_id ou None se o
+            cliente precisa recarregar porque o histórico não cobre o intervalo)
+
+        Raises:
+            ChangeFeedFull: max_streams assinantes já conectados no processo
+        """
+        scope = {"user_id": user_id, "role": role}
+        subscriber_queue = queue.Queue(maxsize=self.queue_size)
+
+        with self.lock:
+            if self.max_streams is not None and len(self.subscribers) >= self.max_streams:
+                raise ChangeFeedFull()
+            replay: Optional[List[Dict[str, Any]]] = []
+            if last_event_id:
+                epoch, _, seq = last_event_id.partition(":")
+                oldest = self.buffer[0]["seq"] if self.buffer else self.seq + 1
+                if epoch != self.epoch or not seq.isdigit() or int(seq) < oldest - 1:
+                    replay = None
+                else:
+                    replay = [event for event in self.buffer
+                              if event["seq"] > int(seq) and self._allowed(event, scope)]
+            self.subscribers[subscriber_queue] = scope
+
+        return subscriber_queue, replay
+
+    def unsubscribe(self, subscriber_queue: queue.Queue):
+        with self.lock:
+            self.subscribers.pop(subscriber_queue, None)
+
+
+# Streams por worker: com GUNICORN_THREADS=16, sobram 12 threads para a API
+CHANGE_FEED_MAX_STREAMS = int(os.environ.get("CHANGE_FEED_MAX_STREAMS", 4))
+CHANGE_FEED_RETRY_AFTER = 30
+
+# Instância global do feed de alterações
+change_feed = ChangeFeed(max_streams=CHANGE_FEED_MAX_STREAMS)
+
+
+def create_change_feed_routes(app, db):
+    """Cria a rota SSE do feed de alterações"""
+
+    @app.route('/changes/stream')
+    @jwt_required()
+    def change_stream():
+        """Endpoint SSE com alterações de indicações, comissões, parcelas e usuários"""
+        user_id = get_jwt_identity()
+        user = get_cached_user(db, user_id)
+        if not user:
+            return jsonify({'error': 'Usuário não encontrado'}), 404
+
+        change_feed.start(db)
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            subscriber_queue, replay = change_feed.subscribe(user_id, user.get('role'), last_event_id)
+        except ChangeFeedFull:
+            response = jsonify({'error': 'Limite de conexões do feed atingido, tente novamente'})
+            response.headers['Retry-After'] = str(CHANGE_FEED_RETRY_AFTER)
+            return response, 503
+
+        def format_event(event):
+            payload = {key: event[key] for key in ('collection', 'op', 'id', 'data')}
+            return f"id: {change_feed.event_id(event)}\nevent: change\ndata: {json_dumps(payload)}\n\n"
+
+        def event_stream():
+            try:
+                if replay is None:
+                    yield "event: reset\ndata: {}\n\n"
+                else:
+                    yield f"event: ready\ndata: {json.dumps({'epoch': change_feed.epoch})}\n\n"
+                    for event in replay:
+                        yield format_event(event)
+
+                while True:
+                    try:
+                        event = subscriber_queue.get(timeout=15)
+                    except queue.Empty:
+                        # Comentário SSE mantém proxies e a conexão vivos
+                        yield ": heartbeat\n\n"
+                        continue
+
+                    if event is None:
+                        yield "event: reset\ndata: {}\n\n"
+                        break
+                    yield format_event(event)
+            finally:
+                change_feed.unsubscribe(subscriber_queue)
+
+        return Response(
+            event_stream(),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+
 # Funções utilitárias para enviar notificações específicas
 def notify_new_indication(indication_data: Dict, ambassador_email: str):
     """Notifica sobre nova indicação"""
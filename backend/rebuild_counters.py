@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Script para (re)gerar os contadores pré-agregados dos dashboards
+
+Execute na primeira implantação dos contadores e sempre que for preciso
+reconciliá-los com as coleções de origem (ex.: após edições manuais no console).
+"""
+
+from config.firebase import get_client
+from services.dashboard_counters import DashboardCounters
+
+
+def rebuild_dashboard_counters():
+    try:
+        db = get_client()
+        if not db:
+            return
+        stats = DashboardCounters(db).rebuild()
+
+        print("Contadores reconstruídos com sucesso!")
+        for key, value in stats.items():
+            print(f"  {key}: {value}")
+
+    except Exception as e:
+        print(f"Erro ao reconstruir contadores: {e}")
+
+
+if __name__ == "__main__":
+    rebuild_dashboard_counters()
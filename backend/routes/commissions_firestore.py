@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import get_jwt_identity
+from utils.jwt_context import jwt_required
 from datetime import datetime, timedelta
 from models import CommissionInstallmentModel, create_commission_installments, get_installment_summary
 from utils import serialize_firestore_data, safe_jsonify
+from services.repository import get_repository
 
 commissions_bp = Blueprint('commissions', __name__)
 
@@ -24,13 +26,11 @@ def get_installments():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
+        user_data = get_repository(db).get("users", current_user_id)
 
-        if not user_doc.exists:
+        if user_data is None:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Buscar parcelas
         installments_ref = db.collection("commission_installments")
         
@@ -98,13 +98,11 @@ def update_installment_status(installment_id):
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
+        user_data = get_repository(db).get("users", current_user_id)
 
-        if not user_doc.exists:
+        if user_data is None:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Apenas admin pode alterar status de parcelas
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
@@ -118,8 +116,7 @@ def update_installment_status(installment_id):
             }, 400)
 
         # Buscar a parcela
-        installment_doc = db.collection("commission_installments").document(installment_id).get()
-        if not installment_doc.exists:
+        if get_repository(db).get("commission_installments", installment_id) is None:
             return safe_jsonify({"error": "Parcela não encontrada"}, 404)
 
         update_data = {
@@ -132,6 +129,7 @@ def update_installment_status(installment_id):
             update_data["paymentDate"] = datetime.now()
 
         db.collection("commission_installments").document(installment_id).update(update_data)
+        get_repository(db).forget("commission_installments", installment_id)
 
         return safe_jsonify({"message": "Status da parcela atualizado com sucesso"}, 200)
 
@@ -152,13 +150,11 @@ def get_installments_summary():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
+        user_data = get_repository(db).get("users", current_user_id)
 
-        if not user_doc.exists:
+        if user_data is None:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Buscar parcelas
         installments_ref = db.collection("commission_installments")
         
@@ -232,13 +228,11 @@ def create_installments_for_indication():
             return safe_jsonify({"error": "Erro de conexão com banco de dados"}, 500)
 
         current_user_id = get_jwt_identity()
-        user_doc = db.collection("users").document(current_user_id).get()
+        user_data = get_repository(db).get("users", current_user_id)
 
-        if not user_doc.exists:
+        if user_data is None:
             return safe_jsonify({"error": "Usuário não encontrado"}, 404)
 
-        user_data = user_doc.to_dict()
-
         # Apenas admin pode criar parcelas manualmente
         if user_data["role"] != "admin":
             return safe_jsonify({"error": "Acesso negado"}, 403)
@@ -250,20 +244,16 @@ def create_installments_for_indication():
             return safe_jsonify({"error": "ID da indicação é obrigatório"}, 400)
 
         # Buscar dados da indicação
-        indication_doc = db.collection("indications").document(indication_id).get()
-        if not indication_doc.exists:
+        indication_data = get_repository(db).get("indications", indication_id)
+        if indication_data is None:
             return safe_jsonify({"error": "Indicação não encontrada"}, 404)
-
-        indication_data = indication_doc.to_dict()
         
         # Buscar dados da embaixadora
         ambassador_id = indication_data.get("ambassadorId")
-        ambassador_doc = db.collection("users").document(ambassador_id).get()
-        if not ambassador_doc.exists:
+        ambassador_data = get_repository(db).get("users", ambassador_id)
+        if ambassador_data is None:
             return safe_jsonify({"error": "Embaixadora não encontrada"}, 404)
 
-        ambassador_data = ambassador_doc.to_dict()
-
         # Verificar se já existem parcelas para esta indicação
         existing_query = db.collection("commission_installments").where(
             field_path="indicationId", op_string="==", value=indication_id
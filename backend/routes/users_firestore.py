@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 import bcrypt
+from utils.cache import invalidate_user
+from services.repository import get_repository
 
 users_bp = Blueprint('users', __name__)
 
@@ -20,8 +22,8 @@ def update_user_status(user_id):
             return jsonify({'success': False, 'message': 'Erro de conexão com banco de dados'}), 500
 
         # Verificar se o usuário existe
-        user_doc = db.collection("users").document(user_id).get()
-        if not user_doc.exists:
+        user_data = get_repository(db).get("users", user_id)
+        if user_data is None:
             return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
 
         data = request.get_json()
@@ -37,11 +39,11 @@ def update_user_status(user_id):
         }
         
         db.collection("users").document(user_id).update(update_data)
+        invalidate_user(user_id)
 
-        # Buscar dados atualizados do usuário
-        updated_user_doc = db.collection("users").document(user_id).get()
-        user_data = updated_user_doc.to_dict()
-        user_data['id'] = updated_user_doc.id
+        # Dados atualizados sem reler o documento
+        user_data.update(update_data)
+        user_data['id'] = user_id
         # Remover senha se existir
         user_data.pop('password', None)
 
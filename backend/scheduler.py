@@ -0,0 +1,408 @@
+"""
+Agendador de tarefas de manutenção do projeto Beepy
+
+Roda em uma thread dentro de cada worker do gunicorn (ou separado, com
+`python scheduler.py`). Tarefas de dados compartilhados (varredura de atraso,
+reconciliação de contadores) são executadas por um único worker: antes de cada
+execução o worker reivindica o horário agendado em um documento de lease no
+Firestore, e só quem ganha a reivindicação executa. Tarefas de estado local
+(caches em memória) rodam em todos os workers.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+LOCKS_COLLECTION = "scheduler_locks"
+
+
+class IntervalTrigger:
+    """Executa a cada N segundos, alinhado ao relógio (mesmos horários em todos os workers)"""
+
+    def __init__(self, seconds: int):
+        if seconds <= 0:
+            raise ValueError("Intervalo deve ser maior que zero")
+        self.seconds = seconds
+
+    def next_run(self, after: datetime) -> datetime:
+        timestamp = after.timestamp()
+        return datetime.fromtimestamp((int(timestamp // self.seconds) + 1) * self.seconds)
+
+    def __repr__(self) -> str:
+        return f"every {self.seconds}s"
+
+
+class CronTrigger:
+    """
+    Expressão cron de 5 campos: minuto hora dia mês dia-da-semana
+
+    Aceita *, */n, a-b, a-b/n e listas separadas por vírgula. Dia da semana
+    vai de 0 (domingo) a 6. Horários no fuso local do servidor.
+    """
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Expressão cron inválida: {expression!r}")
+        self.expression = expression
+        self.values = [self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        # Como no cron: com dia e dia da semana restritos, basta um dos dois bater
+        self.day_any = parts[2] == "*"
+        self.weekday_any = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, raw_step = item.split("/", 1)
+                step = int(raw_step)
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = (int(v) for v in item.split("-", 1))
+            else:
+                start = end = int(item)
+            if start < low or end > high or start > end or step <= 0:
+                raise ValueError(f"Campo cron fora do intervalo: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.values[2]
+        weekday_ok = (moment.isoweekday() % 7) in self.values[4]
+        if self.day_any or self.weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, after: datetime) -> datetime:
+        minutes, hours, _, months, _ = self.values
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+
+        while moment < limit:
+            if moment.month not in months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+
+        raise ValueError(f"Expressão cron sem próxima execução: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"cron {self.expression!r}"
+
+
+class Job:
+    """Tarefa agendada e suas métricas de execução"""
+
+    def __init__(self, name: str, func: Callable[[], Any], trigger, leader_only: bool = True,
+                 lease_seconds: int = 600):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.leader_only = leader_only
+        self.lease_seconds = lease_seconds
+        self.next_run: Optional[datetime] = None
+        self.metrics: Dict[str, Any] = {
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,
+            "last_started_at": None,
+            "last_duration": None,
+            "last_result": None,
+            "last_error": None,
+        }
+
+
+class FirestoreLease:
+    """
+    Lease por tarefa no Firestore
+
+    O documento guarda o último horário agendado reivindicado (slot) e até
+    quando a execução atual é considerada viva. Um worker só executa um slot
+    que ainda não foi reivindicado e que não esteja em execução em outro.
+    """
+
+    def __init__(self, db, collection: str = LOCKS_COLLECTION):
+        self.db = db
+        self.collection = collection
+
+    def acquire(self, job_name: str, slot: float, owner: str, ttl: int) -> bool:
+        ref = self.db.collection(self.collection).document(job_name)
+
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else {}
+            now = time.time()
+            if data.get("slot", 0) >= slot:
+                return False
+            if data.get("expires_at", 0) > now and data.get("owner") != owner:
+                return False
+            transaction.set(ref, {"owner": owner, "slot": slot, "expires_at": now + ttl,
+                                  "started_at": now}, merge=True)
+            return True
+
+        return claim(self.db.transaction())
+
+    def release(self, job_name: str, owner: str, outcome: Dict[str, Any]) -> None:
+        ref = self.db.collection(self.collection).document(job_name)
+        ref.set({"expires_at": 0, "last_owner": owner, "finished_at": time.time(), **outcome}, merge=True)
+
+
+class LocalLease:
+    """Lease em memória, para rodar sem Firestore (um único processo)"""
+
+    def __init__(self):
+        self.slots: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, job_name: str, slot: float, owner: str, ttl: int) -> bool:
+        with self.lock:
+            if self.slots.get(job_name, 0) >= slot:
+                return False
+            self.slots[job_name] = slot
+            return True
+
+    def release(self, job_name: str, owner: str, outcome: Dict[str, Any]) -> None:
+        pass
+
+
+class Scheduler:
+    """Agendador com uma thread de disparo; as tarefas rodam na própria thread, em sequência"""
+
+    def __init__(self, lease=None, owner: Optional[str] = None):
+        self.lease = lease or LocalLease()
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def add_job(self, name: str, func: Callable[[], Any], trigger, leader_only: bool = True,
+                lease_seconds: int = 600) -> Job:
+        """Registra uma tarefa (nome único)"""
+        job = Job(name, func, trigger, leader_only=leader_only, lease_seconds=lease_seconds)
+        job.next_run = trigger.next_run(datetime.now())
+        with self.lock:
+            self.jobs[name] = job
+        return job
+
+    def run_job(self, job: Job, slot: Optional[datetime] = None) -> bool:
+        """
+        Executa a tarefa se este worker vencer a reivindicação do slot
+
+        Returns:
+            True se a tarefa foi executada aqui
+        """
+        slot = slot or datetime.now()
+        if job.leader_only and not self.lease.acquire(job.name, slot.timestamp(), self.owner, job.lease_seconds):
+            job.metrics["skipped"] += 1
+            return False
+
+        started = time.monotonic()
+        job.metrics["last_started_at"] = datetime.now().isoformat()
+        outcome: Dict[str, Any] = {"ok": True, "error": None}
+        try:
+            result = job.func()
+            job.metrics["runs"] += 1
+            job.metrics["last_result"] = result
+            job.metrics["last_error"] = None
+        except Exception as e:
+            job.metrics["failures"] += 1
+            job.metrics["last_error"] = str(e)
+            outcome = {"ok": False, "error": str(e)}
+            logger.error(f"Tarefa {job.name} falhou: {e}")
+        finally:
+            job.metrics["last_duration"] = round(time.monotonic() - started, 3)
+            if job.leader_only:
+                outcome["duration"] = job.metrics["last_duration"]
+                try:
+                    self.lease.release(job.name, self.owner, outcome)
+                except Exception as e:
+                    logger.warning(f"Falha ao liberar lease da tarefa {job.name}: {e}")
+
+        logger.info(f"Tarefa {job.name} executada em {job.metrics['last_duration']}s")
+        return True
+
+    def run_pending(self, now: Optional[datetime] = None) -> List[str]:
+        """Executa as tarefas vencidas; retorna os nomes das que rodaram neste worker"""
+        now = now or datetime.now()
+        executed = []
+        with self.lock:
+            due = [job for job in self.jobs.values() if job.next_run and job.next_run <= now]
+
+        for job in due:
+            slot = job.next_run
+            # Horários perdidos (worker parado) não são recuperados um a um
+            job.next_run = job.trigger.next_run(max(now, slot))
+            if self.run_job(job, slot):
+                executed.append(job.name)
+        return executed
+
+    def seconds_until_next(self) -> float:
+        with self.lock:
+            upcoming = [job.next_run for job in self.jobs.values() if job.next_run]
+        if not upcoming:
+            return 60.0
+        return max(0.0, (min(upcoming) - datetime.now()).total_seconds())
+
+    def _loop(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Erro no agendador: {e}")
+            self.stop_event.wait(min(self.seconds_until_next(), 60.0))
+
+    def start(self) -> None:
+        """Inicia a thread do agendador (idempotente)"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self.thread.start()
+        logger.info(f"Agendador iniciado com {len(self.jobs)} tarefas ({self.owner})")
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas das tarefas neste worker"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return {
+            "owner": self.owner,
+            "running": bool(self.thread and self.thread.is_alive()),
+            "jobs": {
+                job.name: {
+                    "trigger": repr(job.trigger),
+                    "leader_only": job.leader_only,
+                    "next_run": job.next_run.isoformat() if job.next_run else None,
+                    **job.metrics,
+                }
+                for job in jobs
+            },
+        }
+
+
+def scheduler_mode() -> str:
+    """
+    SCHEDULER_MODE define onde as tarefas rodam:
+
+    - embedded (padrão): cada worker roda o agendador com todas as tarefas
+    - sidecar: workers rodam só as tarefas locais; `python scheduler.py` roda as compartilhadas
+    - off: nenhum agendamento embutido
+    """
+    mode = os.environ.get("SCHEDULER_MODE", "embedded").lower()
+    if mode not in ("embedded", "sidecar", "off"):
+        logger.warning(f"SCHEDULER_MODE inválido ({mode}); usando embedded")
+        return "embedded"
+    return mode
+
+
+def register_maintenance_jobs(scheduler: Scheduler, commission_installments=None, dashboard_counters=None,
+                              outbox=None, shared: bool = True, local: bool = True) -> None:
+    """
+    Registra as tarefas de manutenção padrão
+
+    Args:
+        shared: Tarefas sobre dados do Firestore, executadas por um único worker
+        local: Tarefas sobre caches em memória, executadas em cada worker
+    """
+    if shared and commission_installments:
+        scheduler.add_job("overdue_installments", commission_installments.check_overdue_installments,
+                          CronTrigger(os.environ.get("SCHEDULE_OVERDUE", "*/30 * * * *")))
+
+    if shared and dashboard_counters:
+        # Correções com Increment sobre leituras no mesmo instante (rebuild sobrescreveria escritas concorrentes)
+        scheduler.add_job("reconcile_counters", dashboard_counters.reconcile,
+                          CronTrigger(os.environ.get("SCHEDULE_RECONCILE", "30 3 * * *")),
+                          lease_seconds=3600)
+
+    if shared and outbox:
+        # Efeitos colaterais que falharam ou não chegaram a rodar (processo reiniciado)
+        scheduler.add_job("drain_outbox", outbox.drain,
+                          CronTrigger(os.environ.get("SCHEDULE_OUTBOX", "* * * * *")))
+
+    if not local:
+        return
+
+    # Histórico de notificações fica em memória: cada worker limpa o seu
+    from realtime_notifications import notification_manager
+    scheduler.add_job("trim_notifications", notification_manager.clear_old_notifications,
+                      IntervalTrigger(3600), leader_only=False)
+
+    try:
+        from rate_limiting import cleanup_rate_limit_data
+    except ImportError as e:
+        logger.info(f"Limpeza de rate limiting não agendada: {e}")
+    else:
+        scheduler.add_job("cleanup_rate_limits", cleanup_rate_limit_data, IntervalTrigger(300), leader_only=False)
+
+
+def create_scheduler_routes(app, db, scheduler: Scheduler):
+    """Cria a rota de métricas do agendador (apenas admin)"""
+    from flask import jsonify
+    from flask_jwt_extended import get_jwt_identity
+    from utils.jwt_context import jwt_required
+    from utils.cache import get_cached_user
+
+    @app.route('/admin/scheduler', methods=['GET'])
+    @jwt_required()
+    def scheduler_status():
+        """Métricas das tarefas deste worker e o estado dos leases compartilhados"""
+        user = get_cached_user(db, get_jwt_identity()) if db else None
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Acesso negado'}), 403
+
+        stats = scheduler.stats()
+        if db:
+            stats['leases'] = {doc.id: doc.to_dict() for doc in db.collection(LOCKS_COLLECTION).stream()}
+        return jsonify(stats)
+
+
+if __name__ == "__main__":
+    # Execução separada: use SCHEDULER_MODE=sidecar nos workers web
+    logging.basicConfig(level=logging.INFO)
+    from models.commission_installments import CommissionInstallment
+    from services.commission_sync import register_outbox_tasks
+    from services.dashboard_counters import DashboardCounters
+    from services.outbox import FirestoreOutboxStore, Outbox
+
+    from config.firebase import get_client, warm_up
+
+    client = get_client()
+    warm_up(client)
+    counters = DashboardCounters(client)
+    sidecar_outbox = Outbox(FirestoreOutboxStore(client), max_workers=0)
+    register_outbox_tasks(sidecar_outbox, client, counters)
+    standalone = Scheduler(FirestoreLease(client))
+    register_maintenance_jobs(standalone, CommissionInstallment(client, counters=counters), counters,
+                              outbox=sidecar_outbox, local=False)
+    print(f"Agendador rodando: {', '.join(standalone.jobs)}")
+    standalone.start()
+    try:
+        while standalone.thread.is_alive():
+            standalone.thread.join(timeout=1)
+    except KeyboardInterrupt:
+        standalone.stop()
@@ -0,0 +1,136 @@
+"""
+Agregações (count, sum, avg) calculadas no servidor do Firestore
+
+Uma consulta de agregação é cobrada como uma leitura a cada 1000 entradas de
+índice, em vez de uma leitura por documento. Quando o servidor (ou emulador)
+não suporta agregações, o cálculo é feito localmente lendo apenas os campos
+necessários da consulta (select), nunca os documentos inteiros.
+"""
+from numbers import Number
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    from google.api_core.exceptions import Unimplemented
+except ImportError:  # pragma: no cover - depende do ambiente
+    Unimplemented = None
+
+# Limite do Firestore por consulta de agregação
+MAX_AGGREGATIONS = 5
+
+_UNSUPPORTED = tuple(e for e in (AttributeError, NotImplementedError, Unimplemented) if e is not None)
+_server_aggregations = True
+
+
+def _is_number(value: Any) -> bool:
+    # Como no Firestore, booleanos e textos são ignorados em sum/avg
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _aggregate_on_server(query, count: bool, sum_fields: Iterable[str], avg_fields: Iterable[str]) -> Dict[str, Any]:
+    aggregation = None
+    aliases = []
+
+    def add(kind, field=None):
+        nonlocal aggregation
+        alias = f"a{len(aliases)}"
+        target = aggregation if aggregation is not None else query
+        if kind == "count":
+            aggregation = target.count(alias=alias)
+        else:
+            aggregation = getattr(target, kind)(field, alias=alias)
+        aliases.append((alias, kind, field))
+
+    if count:
+        add("count")
+    for field in sum_fields:
+        add("sum", field)
+    for field in avg_fields:
+        add("avg", field)
+
+    values = {}
+    for row in aggregation.get():
+        for item in row:
+            values[item.alias] = item.value
+
+    result = {"count": None, "sum": {}, "avg": {}}
+    for alias, kind, field in aliases:
+        if kind == "count":
+            result["count"] = int(values.get(alias) or 0)
+        else:
+            result[kind][field] = values.get(alias)
+    # Firestore devolve sum 0 (e avg None) quando não há valores numéricos
+    for field in result["sum"]:
+        if result["sum"][field] is None:
+            result["sum"][field] = 0
+    return result
+
+
+def _aggregate_locally(query, count: bool, sum_fields: Iterable[str], avg_fields: Iterable[str]) -> Dict[str, Any]:
+    fields = list(dict.fromkeys(list(sum_fields) + list(avg_fields)))
+    # Sem campos, projeta só o nome do documento
+    projected = query.select(fields or ["__name__"])
+
+    total = 0
+    sums = {field: 0 for field in fields}
+    numeric = {field: 0 for field in fields}
+    for doc in projected.stream():
+        total += 1
+        data = doc.to_dict() or {}
+        for field in fields:
+            value = data.get(field)
+            if _is_number(value):
+                sums[field] += value
+                numeric[field] += 1
+
+    return {
+        "count": total if count else None,
+        "sum": {field: sums[field] for field in sum_fields},
+        "avg": {field: (sums[field] / numeric[field] if numeric[field] else None) for field in avg_fields},
+    }
+
+
+def aggregate(query, count: bool = False, sum_fields: Iterable[str] = (),
+              avg_fields: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Executa count/sum/avg sobre uma consulta em uma única requisição
+
+    Args:
+        query: Coleção ou consulta filtrada
+        count: Contar documentos
+        sum_fields: Campos a somar
+        avg_fields: Campos para média
+
+    Returns:
+        {"count": int ou None, "sum": {campo: total}, "avg": {campo: média ou None}}
+    """
+    global _server_aggregations
+    sum_fields, avg_fields = list(sum_fields), list(avg_fields)
+    if not (count or sum_fields or avg_fields):
+        raise ValueError("Nenhuma agregação pedida")
+    if int(count) + len(sum_fields) + len(avg_fields) > MAX_AGGREGATIONS:
+        raise ValueError(f"No máximo {MAX_AGGREGATIONS} agregações por consulta")
+
+    if _server_aggregations:
+        try:
+            return _aggregate_on_server(query, count, sum_fields, avg_fields)
+        except _UNSUPPORTED as e:
+            # Emulador ou biblioteca sem agregações: não tentar de novo neste processo
+            print(f"Agregação no servidor indisponível, calculando localmente: {e}")
+            _server_aggregations = False
+
+    return _aggregate_locally(query, count, sum_fields, avg_fields)
+
+
+def count(query) -> int:
+    """Quantidade de documentos da consulta"""
+    return aggregate(query, count=True)["count"]
+
+
+def sum_field(query, field: str) -> float:
+    """Soma dos valores numéricos de um campo"""
+    return aggregate(query, sum_fields=[field])["sum"][field]
+
+
+def avg_field(query, field: str) -> Optional[float]:
+    """Média dos valores numéricos de um campo (None se não houver)"""
+    return aggregate(query, avg_fields=[field])["avg"][field]
@@ -0,0 +1,41 @@
+"""
+Busca em lote de documentos do Firestore para montar joins sem consultas N+1
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+# Quantidade de referências por chamada a get_all
+GET_ALL_CHUNK_SIZE = 100
+
+
+def collect_ids(rows: Iterable[Dict[str, Any]], field: str) -> List[str]:
+    """Valores distintos (e não vazios) de um campo de referência, na ordem em que aparecem"""
+    return list(dict.fromkeys(row.get(field) for row in rows if row.get(field)))
+
+
+def fetch_documents(db, collection_name: str, ids: Iterable[str],
+                    chunk_size: int = GET_ALL_CHUNK_SIZE,
+                    field_paths: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Busca vários documentos de uma coleção com db.get_all em lotes
+
+    Args:
+        db: Cliente Firestore
+        collection_name: Nome da coleção
+        ids: IDs dos documentos (duplicados são ignorados)
+        chunk_size: Referências por chamada a get_all
+        field_paths: Campos a retornar (opcional, padrão: documento inteiro)
+
+    Returns:
+        Dicionário {id: dados} apenas com os documentos existentes
+    """
+    unique_ids = list(dict.fromkeys(doc_id for doc_id in ids if doc_id))
+    collection = db.collection(collection_name)
+    documents = {}
+
+    for start in range(0, len(unique_ids), chunk_size):
+        refs = [collection.document(doc_id) for doc_id in unique_ids[start:start + chunk_size]]
+        for snapshot in db.get_all(refs, field_paths=field_paths):
+            if snapshot.exists:
+                documents[snapshot.id] = snapshot.to_dict()
+
+    return documents
@@ -0,0 +1,109 @@
+"""
+Sincronização da comissão com o status da indicação (executada pelo outbox)
+"""
+from datetime import datetime
+from typing import Any, Dict
+
+from google.api_core.exceptions import AlreadyExists
+
+from services.dashboard_counters import CounterDeltas, commission_deltas
+from services.deletion_log import record_deletion
+from services.repository import get_repository
+from utils.cache import get_cached_user
+
+DEFAULT_COMMISSION_VALUE = 500.0
+
+
+def sync_indication_commission(db, counters, payload: Dict[str, Any]) -> str:
+    """
+    Cria, atualiza ou remove a comissão conforme o status gravado na indicação
+
+    Idempotente: reler a indicação garante que uma entrada antiga (ou repetida)
+    não desfaça uma mudança de status mais recente. A comissão criada usa o ID
+    da indicação e batch.create: duas execuções simultâneas não duplicam a
+    comissão (a segunda falha no commit e vira "skipped"). Comissão já paga ou
+    cancelada não é alterada.
+
+    Args:
+        db: Cliente Firestore
+        counters: DashboardCounters
+        payload: {"indication_id", "status", "commission_value" (opcional)}
+
+    Returns:
+        Ação executada ("created", "updated", "deleted" ou "skipped")
+    """
+    indication_id = payload["indication_id"]
+    status = payload["status"]
+
+    indication_data = get_repository(db).get("indications", indication_id)
+    if indication_data is None or indication_data.get("status") != status:
+        return "skipped"
+
+    existing = list(db.collection("commissions").where(
+        field_path="indicationId", op_string="==", value=indication_id
+    ).stream())
+
+    batch = db.batch()
+    deltas = CounterDeltas()
+    action = "skipped"
+
+    if status == "aprovado":
+        ambassador_id = indication_data.get("ambassadorId")
+        ambassador_name = "Embaixadora não encontrada"
+        if ambassador_id:
+            ambassador_data = get_cached_user(db, ambassador_id)
+            if ambassador_data:
+                ambassador_name = ambassador_data.get("name", "Nome não informado")
+        client_name = indication_data.get("client_name", "Cliente não informado")
+
+        if existing:
+            # Paga ou cancelada: a aprovação repetida não mexe na comissão
+            if existing[0].to_dict().get("status") != "pendente":
+                return "skipped"
+            # Status não muda: só os nomes, sem efeito nos contadores
+            batch.update(db.collection("commissions").document(existing[0].id), {
+                "ambassadorName": ambassador_name,
+                "clientName": client_name,
+                "updatedAt": datetime.now()
+            })
+            action = "updated"
+        else:
+            commission_data = {
+                "ambassadorId": ambassador_id,
+                "ambassadorName": ambassador_name,
+                "indicationId": indication_id,
+                "clientName": client_name,
+                "value": payload.get("commission_value", DEFAULT_COMMISSION_VALUE),
+                "status": "pendente",
+                "createdAt": datetime.now(),
+                "updatedAt": datetime.now()
+            }
+            batch.create(db.collection("commissions").document(indication_id), commission_data)
+            deltas.merge(commission_deltas(commission_data))
+            action = "created"
+
+    elif status == "não aprovado" and existing:
+        for commission_doc in existing:
+            batch.delete(db.collection("commissions").document(commission_doc.id))
+            record_deletion(batch, db, "commissions", commission_doc.id,
+                            commission_doc.to_dict().get("ambassadorId"))
+            deltas.merge(commission_deltas(commission_doc.to_dict()), sign=-1)
+        action = "deleted"
+
+    if action == "skipped":
+        return action
+
+    if counters:
+        counters.apply(batch, deltas)
+    try:
+        batch.commit()
+    except AlreadyExists:
+        # Outra execução criou a comissão entre a consulta e o commit (contadores incluídos)
+        return "skipped"
+    print(f"Comissão da indicação {indication_id}: {action}")
+    return action
+
+
+def register_outbox_tasks(outbox, db, counters) -> None:
+    """Registra os efeitos colaterais executados pelo outbox"""
+    outbox.register("sync_commission", lambda payload: sync_indication_commission(db, counters, payload))
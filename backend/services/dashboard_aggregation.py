@@ -0,0 +1,455 @@
+"""
+Agregação em passada única dos dados dos dashboards (admin e embaixadora)
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+# Campos lidos pelos agregadores; as consultas usam select() para baixar só eles
+ADMIN_USER_FIELDS = ["role", "name"]
+ADMIN_INDICATION_FIELDS = ["status", "origin", "segment", "ambassadorId", "createdAt"]
+ADMIN_COMMISSION_FIELDS = ["createdAt", "value"]
+AMBASSADOR_INDICATION_FIELDS = ["status", "segment", "converted", "createdAt"]
+AMBASSADOR_COMMISSION_FIELDS = ["createdAt", "value"]
+
+
+def to_naive(value: Any) -> Optional[datetime]:
+    """Converte datas do Firestore para datetime naive (ou None se não for data)"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def month_buckets(now: datetime, months: int) -> List[datetime]:
+    """Primeiro dia de cada um dos últimos N meses do calendário (do mais recente para o mais antigo)"""
+    buckets = []
+    year, month = now.year, now.month
+    for _ in range(months):
+        buckets.append(datetime(year, month, 1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return buckets
+
+
+def month_key(value: datetime) -> str:
+    """Chave "YYYY-MM" usada pelos contadores mensais"""
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+class AdminDashboardAggregator:
+    """
+    Acumula estatísticas e gráficos do dashboard admin em uma única passada.
+
+    Cada documento é visitado uma vez; os buckets mensais e a atividade das
+    embaixadoras são resolvidos por dicionários em vez de laços aninhados.
+    """
+
+    CHART_MONTHS = 6
+    ACTIVE_DAYS = 60
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now or datetime.now()
+        self.sixty_days_ago = self.now - timedelta(days=self.ACTIVE_DAYS)
+
+        self.buckets = month_buckets(self.now, self.CHART_MONTHS)
+        self.bucket_index: Dict[Tuple[int, int], List[int]] = {}
+        for index, month_date in enumerate(self.buckets):
+            self.bucket_index.setdefault((month_date.year, month_date.month), []).append(index)
+
+        self.users_count = 0
+        self.indications_count = 0
+        self.commissions_count = 0
+
+        self.approved_indications = 0
+        self.pending_indications = 0
+        self.rejected_indications = 0
+        self.monthly_commissions = 0
+
+        self.indications_monthly = [{"count": 0, "approved": 0} for _ in self.buckets]
+        self.sales_monthly = [0 for _ in self.buckets]
+        self.origins: Dict[str, int] = {}
+        self.segments: Dict[str, Dict[str, int]] = {}
+
+        # Embaixadoras na ordem em que aparecem na coleção de usuários
+        self.ambassador_count = 0
+        self.ambassadors: List[Tuple[str, str]] = []
+        self.indications_by_ambassador: Dict[str, int] = {}
+        self.recent_ambassadors = set()
+
+    def add_user(self, user_id: str, user_data: Dict[str, Any]) -> None:
+        """Contabiliza um documento de usuário"""
+        self.users_count += 1
+        if user_data.get("role") == "embaixadora":
+            self.ambassador_count += 1
+            self.ambassadors.append((user_id, user_data.get("name", "Sem nome")))
+
+    def add_indication(self, indication_data: Dict[str, Any]) -> None:
+        """Contabiliza um documento de indicação"""
+        self.indications_count += 1
+
+        status = indication_data.get("status", "pendente")
+        approved = status == "aprovado"
+        if approved:
+            self.approved_indications += 1
+        elif status == "não aprovado":
+            self.rejected_indications += 1
+        else:
+            self.pending_indications += 1
+
+        origin = indication_data.get("origin", "website")
+        self.origins[origin] = self.origins.get(origin, 0) + 1
+
+        segment = indication_data.get("segment", "geral")
+        segment_stats = self.segments.setdefault(segment, {"total": 0, "converted": 0})
+        segment_stats["total"] += 1
+        if approved:
+            segment_stats["converted"] += 1
+
+        ambassador_id = indication_data.get("ambassadorId")
+        if ambassador_id:
+            self.indications_by_ambassador[ambassador_id] = self.indications_by_ambassador.get(ambassador_id, 0) + 1
+
+        created_at = to_naive(indication_data.get("createdAt"))
+        if created_at is None:
+            return
+
+        for index in self.bucket_index.get((created_at.year, created_at.month), ()):
+            self.indications_monthly[index]["count"] += 1
+            if approved:
+                self.indications_monthly[index]["approved"] += 1
+
+        if ambassador_id and created_at >= self.sixty_days_ago:
+            self.recent_ambassadors.add(ambassador_id)
+
+    def add_commission(self, commission_data: Dict[str, Any]) -> None:
+        """Contabiliza um documento de comissão"""
+        self.commissions_count += 1
+
+        created_at = to_naive(commission_data.get("createdAt"))
+        if created_at is None:
+            return
+
+        value = commission_data.get("value", 0)
+        if created_at.month == self.now.month and created_at.year == self.now.year:
+            self.monthly_commissions += value
+
+        for index in self.bucket_index.get((created_at.year, created_at.month), ()):
+            self.sales_monthly[index] += value
+
+    @classmethod
+    def from_counters(cls, global_counters: Dict[str, Any], month_counters: Dict[str, Dict[str, Any]],
+                      ambassador_counters: List[Dict[str, Any]],
+                      now: Optional[datetime] = None) -> "AdminDashboardAggregator":
+        """
+        Reconstrói o agregador a partir dos documentos de contadores pré-agregados
+
+        Args:
+            global_counters: Documento stats/global
+            month_counters: Documentos mensais indexados por "YYYY-MM"
+            ambassador_counters: Documentos por embaixadora, na ordem do ID
+            now: Data de referência (padrão: agora)
+        """
+        aggregator = cls(now)
+
+        aggregator.users_count = global_counters.get("users_total", 0)
+        aggregator.indications_count = global_counters.get("indications_total", 0)
+        aggregator.commissions_count = global_counters.get("commissions_total", 0)
+
+        by_status = global_counters.get("indications_by_status", {})
+        aggregator.approved_indications = by_status.get("approved", 0)
+        aggregator.pending_indications = by_status.get("pending", 0)
+        aggregator.rejected_indications = by_status.get("rejected", 0)
+
+        aggregator.origins = dict(global_counters.get("origins", {}))
+        aggregator.segments = {
+            segment: {"total": data.get("total", 0), "converted": data.get("approved", 0)}
+            for segment, data in global_counters.get("segments", {}).items()
+        }
+
+        current = month_counters.get(month_key(aggregator.now), {})
+        aggregator.monthly_commissions = current.get("commissions_value", 0)
+        for index, month_date in enumerate(aggregator.buckets):
+            month = month_counters.get(month_key(month_date), {})
+            aggregator.indications_monthly[index] = {
+                "count": month.get("indications_total", 0),
+                "approved": month.get("indications_approved", 0)
+            }
+            aggregator.sales_monthly[index] = month.get("commissions_value", 0)
+
+        aggregator.ambassador_count = global_counters.get("users_by_role", {}).get("embaixadora", 0)
+        for counters in ambassador_counters:
+            if counters.get("role") != "embaixadora":
+                continue
+            ambassador_id = counters.get("ambassador_id")
+            aggregator.ambassadors.append((ambassador_id, counters.get("name") or "Sem nome"))
+            aggregator.indications_by_ambassador[ambassador_id] = counters.get("indications_total", 0)
+            last_indication_at = to_naive(counters.get("last_indication_at"))
+            if last_indication_at and last_indication_at >= aggregator.sixty_days_ago:
+                aggregator.recent_ambassadors.add(ambassador_id)
+
+        return aggregator
+
+    def result(self) -> Dict[str, Any]:
+        """Monta a resposta do dashboard no formato esperado pelo frontend"""
+        indications_monthly = [
+            {
+                "month": month_date.strftime("%b"),
+                "count": self.indications_monthly[index]["count"],
+                "approved": self.indications_monthly[index]["approved"]
+            }
+            for index, month_date in enumerate(self.buckets)
+        ]
+        sales_monthly = [
+            {"month": month_date.strftime("%b"), "value": self.sales_monthly[index]}
+            for index, month_date in enumerate(self.buckets)
+        ]
+
+        leads_origin = [{"name": k, "value": v} for k, v in self.origins.items()]
+
+        conversion_by_segment = []
+        for segment, data in self.segments.items():
+            conversion_rate = (data["converted"] / data["total"] * 100) if data["total"] > 0 else 0
+            conversion_by_segment.append({
+                "segment": segment,
+                "total": data["total"],
+                "converted": data["converted"],
+                "rate": conversion_rate
+            })
+
+        # Top embaixadoras por volume (nomes repetidos se sobrescrevem, como antes)
+        ambassador_stats = {}
+        for user_id, user_name in self.ambassadors:
+            user_indications = self.indications_by_ambassador.get(user_id, 0)
+            if user_indications > 0:
+                ambassador_stats[user_name] = user_indications
+
+        top_ambassadors = sorted(ambassador_stats.items(), key=lambda x: x[1], reverse=True)[:5]
+        top_ambassadors_data = [{"name": name, "indications": count} for name, count in top_ambassadors]
+
+        total_ambassadors = self.ambassador_count
+        active_ambassadors = sum(1 for user_id, _ in self.ambassadors if user_id in self.recent_ambassadors)
+
+        indications_for_conversion = self.approved_indications + self.pending_indications
+        active_percentage = (active_ambassadors / total_ambassadors * 100) if total_ambassadors > 0 else 0
+
+        return {
+            "stats": {
+                "totalUsers": self.users_count,
+                "totalIndications": self.indications_count,
+                "totalCommissions": self.commissions_count,
+                "monthlyCommissions": self.monthly_commissions,
+                "activeAmbassadors": active_ambassadors,
+                "activePercentage": round(active_percentage, 2),
+                "approvedIndications": self.approved_indications,
+                "pendingIndications": self.pending_indications,
+                "rejectedIndications": self.rejected_indications,
+                "approvalRate": round(
+                    (self.approved_indications / indications_for_conversion * 100)
+                    if indications_for_conversion > 0 else 0, 2)
+            },
+            "charts": {
+                "indicationsMonthly": list(reversed(indications_monthly)),
+                "leadsOrigin": leads_origin,
+                "conversionBySegment": conversion_by_segment,
+                "salesMonthly": list(reversed(sales_monthly)),
+                "topAmbassadors": top_ambassadors_data
+            }
+        }
+
+
+def build_admin_dashboard(users: Iterable, indications: Iterable, commissions: Iterable,
+                          now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Calcula o dashboard admin consumindo cada coleção uma única vez
+
+    Args:
+        users: Documentos (snapshots) da coleção users
+        indications: Documentos da coleção indications
+        commissions: Documentos da coleção commissions
+        now: Data de referência (padrão: agora)
+
+    Returns:
+        Dicionário com as chaves "stats" e "charts"
+    """
+    aggregator = AdminDashboardAggregator(now)
+
+    for user_doc in users:
+        aggregator.add_user(user_doc.id, user_doc.to_dict())
+
+    for indication_doc in indications:
+        aggregator.add_indication(indication_doc.to_dict())
+
+    for commission_doc in commissions:
+        aggregator.add_commission(commission_doc.to_dict())
+
+    return aggregator.result()
+
+
+class AmbassadorDashboardAggregator:
+    """Acumula as estatísticas do dashboard de uma embaixadora em uma única passada"""
+
+    CHART_MONTHS = 12
+    PERFORMANCE_MONTHS = 5
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now or datetime.now()
+
+        self.buckets = month_buckets(self.now, self.CHART_MONTHS)
+        self.bucket_index: Dict[Tuple[int, int], List[int]] = {}
+        for index, month_date in enumerate(self.buckets):
+            self.bucket_index.setdefault((month_date.year, month_date.month), []).append(index)
+
+        self.total_indications = 0
+        self.approved_indications = 0
+        self.pending_indications = 0
+        self.rejected_indications = 0
+
+        self.total_commissions = 0
+        self.monthly_commission = 0
+
+        self.indications_monthly = [0 for _ in self.buckets]
+        self.commissions_monthly = [0 for _ in self.buckets]
+        self.niches: Dict[str, Dict[str, int]] = {}
+
+    def add_indication(self, indication_data: Dict[str, Any]) -> None:
+        """Contabiliza uma indicação da embaixadora"""
+        self.total_indications += 1
+
+        status = indication_data.get("status", "agendado")
+        if status == "aprovado":
+            self.approved_indications += 1
+        elif status == "não aprovado":
+            self.rejected_indications += 1
+        else:
+            self.pending_indications += 1
+
+        niche = indication_data.get("segment", "geral")
+        niche_stats = self.niches.setdefault(niche, {"count": 0, "converted": 0})
+        niche_stats["count"] += 1
+        if indication_data.get("converted", False):
+            niche_stats["converted"] += 1
+
+        created_at = to_naive(indication_data.get("createdAt"))
+        if created_at is not None:
+            for index in self.bucket_index.get((created_at.year, created_at.month), ()):
+                self.indications_monthly[index] += 1
+
+    def add_commission(self, commission_data: Dict[str, Any]) -> None:
+        """Contabiliza uma comissão da embaixadora"""
+        value = commission_data.get("value", 0)
+        self.total_commissions += value
+
+        created_at = to_naive(commission_data.get("createdAt"))
+        if created_at is None:
+            return
+
+        if created_at.month == self.now.month and created_at.year == self.now.year:
+            self.monthly_commission += value
+
+        for index in self.bucket_index.get((created_at.year, created_at.month), ()):
+            self.commissions_monthly[index] += value
+
+    @classmethod
+    def from_counters(cls, ambassador_counters: Dict[str, Any], month_counters: Dict[str, Dict[str, Any]],
+                      now: Optional[datetime] = None) -> "AmbassadorDashboardAggregator":
+        """
+        Reconstrói o agregador a partir dos contadores da embaixadora
+
+        Args:
+            ambassador_counters: Documento de contadores da embaixadora
+            month_counters: Documentos mensais da embaixadora indexados por "YYYY-MM"
+            now: Data de referência (padrão: agora)
+        """
+        aggregator = cls(now)
+
+        aggregator.total_indications = ambassador_counters.get("indications_total", 0)
+        by_status = ambassador_counters.get("indications_by_status", {})
+        aggregator.approved_indications = by_status.get("approved", 0)
+        aggregator.pending_indications = by_status.get("pending", 0)
+        aggregator.rejected_indications = by_status.get("rejected", 0)
+
+        aggregator.total_commissions = ambassador_counters.get("commissions_value", 0)
+        aggregator.monthly_commission = month_counters.get(month_key(aggregator.now), {}).get("commissions_value", 0)
+
+        for index, month_date in enumerate(aggregator.buckets):
+            month = month_counters.get(month_key(month_date), {})
+            aggregator.indications_monthly[index] = month.get("indications_total", 0)
+            aggregator.commissions_monthly[index] = month.get("commissions_value", 0)
+
+        aggregator.niches = {
+            niche: {"count": data.get("total", 0), "converted": data.get("converted", 0)}
+            for niche, data in ambassador_counters.get("segments", {}).items()
+        }
+
+        return aggregator
+
+    def result(self) -> Dict[str, Any]:
+        """Monta a resposta do dashboard da embaixadora"""
+        monthly_indications = [
+            {"month": month_date.strftime("%b/%Y"), "count": self.indications_monthly[index]}
+            for index, month_date in enumerate(self.buckets)
+        ]
+        monthly_commissions = [
+            {"month": month_date.strftime("%b/%Y"), "total": self.commissions_monthly[index]}
+            for index, month_date in enumerate(self.buckets)
+        ]
+
+        niche_data = []
+        total_for_percentage = sum(data["count"] for data in self.niches.values())
+        for niche, data in self.niches.items():
+            count = data["count"]
+            conversion_rate = (data["converted"] / count * 100) if count > 0 else 0
+            percent = (count / total_for_percentage) if total_for_percentage > 0 else 0
+            niche_data.append({
+                "niche": niche,
+                "count": count,
+                "converted": data["converted"],
+                "percent": percent,
+                "conversion_rate": conversion_rate
+            })
+
+        monthly_performance = [
+            {"month": month_date.strftime("%b"), "total_indications": self.total_indications}
+            for month_date in self.buckets[:self.PERFORMANCE_MONTHS]
+        ]
+
+        indications_for_conversion = self.approved_indications + self.pending_indications
+
+        return {
+            "stats": {
+                "total_indications": self.total_indications,
+                "approved_sales": self.approved_indications,
+                "conversion_rate": round(
+                    (self.approved_indications / indications_for_conversion * 100)
+                    if indications_for_conversion > 0 else 0, 2),
+                "current_month_commission": self.monthly_commission,
+                "total_commissions": self.total_commissions,
+                "pending_indications": self.pending_indications,
+                "rejected_indications": self.rejected_indications
+            },
+            "monthly_indications": monthly_indications,
+            "monthly_commissions": monthly_commissions,
+            "niche_stats": niche_data,
+            "monthly_performance": monthly_performance
+        }
+
+
+def build_ambassador_dashboard(indications: Iterable, commissions: Iterable,
+                               now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Calcula o dashboard de uma embaixadora consumindo cada coleção uma única vez
+
+    Args:
+        indications: Documentos de indicações da embaixadora
+        commissions: Documentos de comissões da embaixadora
+        now: Data de referência (padrão: agora)
+    """
+    aggregator = AmbassadorDashboardAggregator(now)
+
+    for indication_doc in indications:
+        aggregator.add_indication(indication_doc.to_dict())
+
+    for commission_doc in commissions:
+        aggregator.add_commission(commission_doc.to_dict())
+
+    return aggregator.result()
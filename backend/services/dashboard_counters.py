@@ -0,0 +1,589 @@
+"""
+Contadores pré-agregados dos dashboards mantidos incrementalmente no Firestore
+
+Documentos da coleção "stats":
+    global                              totais gerais, status, origens, segmentos, parcelas
+    ambassador_{id}                     totais por embaixadora (+ nome, role, última indicação)
+
+Documentos da coleção "rollups_monthly" ({escopo}:{YYYY-MM}, escopo "global" ou "ambassador_{id}"):
+    indicações por status/segmento/origem e comissões por status (mês de criação),
+    parcelas por status (mês de vencimento); os gráficos leem no máximo 12 deles
+
+As rotas de escrita calculam a contribuição do documento antes/depois da
+alteração e gravam a diferença com firestore.Increment no mesmo WriteBatch da
+escrita principal, de modo que entidade e contadores mudam atomicamente.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterable
+from google.cloud import firestore
+from services.dashboard_aggregation import (
+    AdminDashboardAggregator, AmbassadorDashboardAggregator, month_buckets, month_key, to_naive
+)
+
+STATS_COLLECTION = "stats"
+ROLLUPS_COLLECTION = "rollups_monthly"
+GLOBAL_DOC = "global"
+
+# Limite de operações por WriteBatch do Firestore
+MAX_BATCH_SIZE = 500
+
+# Campos lidos pelas funções de contribuição; o rebuild baixa só eles (select)
+USER_FIELDS = ["role", "name"]
+INDICATION_FIELDS = ["status", "origin", "segment", "createdAt", "ambassadorId", "converted"]
+COMMISSION_FIELDS = ["value", "status", "createdAt", "ambassadorId"]
+INSTALLMENT_FIELDS = ["value", "status", "ambassador_id", "due_date"]
+
+# Campos de um rollup mensal sem dados
+EMPTY_ROLLUP = {
+    "indications_total": 0,
+    "indications_approved": 0,
+    "indications_by_status": {},
+    "indications_by_segment": {},
+    "indications_by_origin": {},
+    "commissions_total": 0,
+    "commissions_value": 0,
+    "commissions_by_status": {},
+    "installments_total": 0,
+    "installments_value": 0,
+    "installments": {},
+}
+
+
+def ambassador_doc_id(ambassador_id: str) -> str:
+    return f"ambassador_{ambassador_id}"
+
+
+def rollup_doc_id(scope: str, key: str) -> str:
+    return f"{scope}:{key}"
+
+
+def month_doc_id(key: str) -> str:
+    return rollup_doc_id(GLOBAL_DOC, key)
+
+
+def ambassador_month_doc_id(ambassador_id: str, key: str) -> str:
+    return rollup_doc_id(ambassador_doc_id(ambassador_id), key)
+
+
+def is_rollup_doc(doc_id: str) -> bool:
+    """Rollups mensais têm ":" no ID; os demais contadores ficam em "stats" """
+    return ":" in doc_id
+
+
+def _number(value: Any) -> float:
+    """Valores monetários inválidos contam como zero"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value
+
+
+def _map_key(value: Any, default: str) -> str:
+    """Chaves de mapa do Firestore não podem ser vazias"""
+    return str(value) if value else default
+
+
+def _status_bucket(status: Optional[str]) -> str:
+    """Mesmo agrupamento de status usado pelos dashboards"""
+    if status == "aprovado":
+        return "approved"
+    if status == "não aprovado":
+        return "rejected"
+    return "pending"
+
+
+class CounterDeltas:
+    """Conjunto de incrementos por documento de contador"""
+
+    def __init__(self):
+        self.fields: Dict[str, Dict[str, Any]] = {}
+        self.identity: Dict[str, Dict[str, Any]] = {}
+
+    def ensure(self, doc_id: str, identity: Dict[str, Any]) -> Dict[str, Any]:
+        if doc_id not in self.fields:
+            self.fields[doc_id] = {}
+            self.identity[doc_id] = identity
+        return self.fields[doc_id]
+
+    def add(self, doc_id: str, identity: Dict[str, Any], path: tuple, amount: float = 1) -> None:
+        """Soma amount ao campo (possivelmente aninhado) indicado por path"""
+        if not amount:
+            return
+        node = self.ensure(doc_id, identity)
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = node.get(path[-1], 0) + amount
+
+    def merge(self, other: "CounterDeltas", sign: int = 1) -> "CounterDeltas":
+        """Acumula outro conjunto de deltas (sign=-1 para subtrair)"""
+        for doc_id, fields in other.fields.items():
+            self.ensure(doc_id, other.identity[doc_id])
+            self._merge_fields(self.fields[doc_id], fields, sign)
+        return self
+
+    def _merge_fields(self, target: Dict[str, Any], source: Dict[str, Any], sign: int) -> None:
+        for key, value in source.items():
+            if isinstance(value, dict):
+                self._merge_fields(target.setdefault(key, {}), value, sign)
+            else:
+                target[key] = target.get(key, 0) + sign * value
+
+
+def _prune(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove deltas nulos (ex.: atualização que não muda contadores)"""
+    pruned = {}
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            nested = _prune(value)
+            if nested:
+                pruned[key] = nested
+        elif value:
+            pruned[key] = value
+    return pruned
+
+
+def _as_increments(fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: _as_increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for key, value in fields.items()
+    }
+
+
+def _counter_corrections(expected: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Diferença esperado - atual nos campos numéricos (identidade, nomes e datas são ignorados)"""
+    corrections = {}
+    for key in set(expected) | set(current):
+        wanted, found = expected.get(key), current.get(key)
+        if isinstance(wanted, dict) or isinstance(found, dict):
+            nested = _counter_corrections(wanted if isinstance(wanted, dict) else {},
+                                          found if isinstance(found, dict) else {})
+            if nested:
+                corrections[key] = nested
+            continue
+        if not _is_number(wanted) and not _is_number(found):
+            continue
+        delta = (wanted if _is_number(wanted) else 0) - (found if _is_number(found) else 0)
+        if abs(delta) > 1e-9:
+            corrections[key] = delta
+    return corrections
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _global_identity() -> Dict[str, Any]:
+    return {"kind": "global"}
+
+
+def _ambassador_identity(ambassador_id: str) -> Dict[str, Any]:
+    return {"kind": "ambassador", "ambassador_id": ambassador_id}
+
+
+def _month_identity(key: str) -> Dict[str, Any]:
+    return {"scope": GLOBAL_DOC, "month": key}
+
+
+def _ambassador_month_identity(ambassador_id: str, key: str) -> Dict[str, Any]:
+    return {"scope": ambassador_doc_id(ambassador_id), "ambassador_id": ambassador_id, "month": key}
+
+
+def _month_targets(value: Any, ambassador_id: Optional[str]) -> List[tuple]:
+    """Rollups (global e da embaixadora) do mês de uma data; vazio se não for data"""
+    moment = to_naive(value)
+    if moment is None:
+        return []
+    key = month_key(moment)
+    targets = [(month_doc_id(key), _month_identity(key))]
+    if ambassador_id:
+        targets.append((ambassador_month_doc_id(ambassador_id, key), _ambassador_month_identity(ambassador_id, key)))
+    return targets
+
+
+# Contribuições de cada tipo de documento
+
+def indication_deltas(data: Optional[Dict[str, Any]]) -> CounterDeltas:
+    """Contribuição de uma indicação para os contadores"""
+    deltas = CounterDeltas()
+    if data is None:
+        return deltas
+
+    status = _status_bucket(data.get("status"))
+    approved = status == "approved"
+    origin = _map_key(data.get("origin", "website"), "website")
+    segment = _map_key(data.get("segment", "geral"), "geral")
+
+    g = _global_identity()
+    deltas.add(GLOBAL_DOC, g, ("indications_total",))
+    deltas.add(GLOBAL_DOC, g, ("indications_by_status", status))
+    deltas.add(GLOBAL_DOC, g, ("origins", origin))
+    deltas.add(GLOBAL_DOC, g, ("segments", segment, "total"))
+    if approved:
+        deltas.add(GLOBAL_DOC, g, ("segments", segment, "approved"))
+
+    ambassador_id = data.get("ambassadorId")
+    converted = data.get("converted", False)
+    if ambassador_id:
+        doc_id = ambassador_doc_id(ambassador_id)
+        a = _ambassador_identity(ambassador_id)
+        deltas.add(doc_id, a, ("indications_total",))
+        deltas.add(doc_id, a, ("indications_by_status", status))
+        deltas.add(doc_id, a, ("segments", segment, "total"))
+        if converted:
+            deltas.add(doc_id, a, ("segments", segment, "converted"))
+
+    for doc_id, identity in _month_targets(data.get("createdAt"), ambassador_id):
+        deltas.add(doc_id, identity, ("indications_total",))
+        deltas.add(doc_id, identity, ("indications_by_status", status))
+        deltas.add(doc_id, identity, ("indications_by_origin", origin))
+        deltas.add(doc_id, identity, ("indications_by_segment", segment, "total"))
+        if approved:
+            deltas.add(doc_id, identity, ("indications_approved",))
+            deltas.add(doc_id, identity, ("indications_by_segment", segment, "approved"))
+        if converted:
+            deltas.add(doc_id, identity, ("indications_by_segment", segment, "converted"))
+
+    return deltas
+
+
+def commission_deltas(data: Optional[Dict[str, Any]]) -> CounterDeltas:
+    """Contribuição de uma comissão para os contadores"""
+    deltas = CounterDeltas()
+    if data is None:
+        return deltas
+
+    value = _number(data.get("value", 0))
+    g = _global_identity()
+    deltas.add(GLOBAL_DOC, g, ("commissions_total",))
+    deltas.add(GLOBAL_DOC, g, ("commissions_value",), value)
+
+    ambassador_id = data.get("ambassadorId")
+    if ambassador_id:
+        deltas.add(ambassador_doc_id(ambassador_id), _ambassador_identity(ambassador_id),
+                   ("commissions_value",), value)
+
+    status = _map_key(data.get("status", "pending"), "pending")
+    for doc_id, identity in _month_targets(data.get("createdAt"), ambassador_id):
+        deltas.add(doc_id, identity, ("commissions_total",))
+        deltas.add(doc_id, identity, ("commissions_value",), value)
+        deltas.add(doc_id, identity, ("commissions_by_status", status, "count"))
+        deltas.add(doc_id, identity, ("commissions_by_status", status, "value"), value)
+
+    return deltas
+
+
+def commission_update_deltas(old: Dict[str, Any], changes: Dict[str, Any]) -> CounterDeltas:
+    """Deltas de uma atualização de comissão (valor, status, embaixadora ou data)"""
+    return diff(commission_deltas(old), commission_deltas({**old, **changes}))
+
+
+def installment_deltas(data: Optional[Dict[str, Any]]) -> CounterDeltas:
+    """Contribuição de uma parcela de comissão para os contadores"""
+    deltas = CounterDeltas()
+    if data is None:
+        return deltas
+
+    value = _number(data.get("value", 0.0))
+    status = _map_key(data.get("status", "pendente"), "pendente")
+
+    targets = [(GLOBAL_DOC, _global_identity())]
+    ambassador_id = data.get("ambassador_id")
+    if ambassador_id:
+        targets.append((ambassador_doc_id(ambassador_id), _ambassador_identity(ambassador_id)))
+
+    # Totais gerais e, por mês de vencimento, os rollups mensais
+    targets += _month_targets(data.get("due_date"), ambassador_id)
+    for doc_id, identity in targets:
+        deltas.add(doc_id, identity, ("installments_total",))
+        deltas.add(doc_id, identity, ("installments_value",), value)
+        deltas.add(doc_id, identity, ("installments", status, "count"))
+        deltas.add(doc_id, identity, ("installments", status, "value"), value)
+
+    return deltas
+
+
+def user_deltas(data: Optional[Dict[str, Any]]) -> CounterDeltas:
+    """Contribuição de um usuário para os contadores"""
+    deltas = CounterDeltas()
+    if data is None:
+        return deltas
+
+    g = _global_identity()
+    deltas.add(GLOBAL_DOC, g, ("users_total",))
+    deltas.add(GLOBAL_DOC, g, ("users_by_role", _map_key(data.get("role"), "sem_role")))
+    return deltas
+
+
+def diff(old: CounterDeltas, new: CounterDeltas) -> CounterDeltas:
+    """Deltas necessários para passar da contribuição antiga para a nova"""
+    return CounterDeltas().merge(new).merge(old, sign=-1)
+
+
+class DashboardCounters:
+    """Leitura e escrita dos contadores pré-agregados"""
+
+    def __init__(self, db: firestore.Client):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db.collection(STATS_COLLECTION)
+
+    @property
+    def rollups(self):
+        return self.db.collection(ROLLUPS_COLLECTION)
+
+    def _ref(self, doc_id: str):
+        return (self.rollups if is_rollup_doc(doc_id) else self.collection).document(doc_id)
+
+    # Escrita
+
+    def apply(self, batch, deltas: CounterDeltas) -> None:
+        """Adiciona os incrementos ao batch (o commit fica com quem chamou)"""
+        for doc_id, fields in deltas.fields.items():
+            pruned = _prune(fields)
+            if not pruned:
+                continue
+            payload = dict(deltas.identity[doc_id])
+            payload.update(_as_increments(pruned))
+            batch.set(self._ref(doc_id), payload, merge=True)
+
+    def set_ambassador_profile(self, batch, ambassador_id: str, user_data: Optional[Dict[str, Any]],
+                               last_indication_at: Optional[datetime] = None) -> None:
+        """Atualiza nome/role (e última indicação) no documento da embaixadora"""
+        payload = _ambassador_identity(ambassador_id)
+        if user_data is None:
+            payload["role"] = None
+        else:
+            payload["name"] = user_data.get("name", "Sem nome")
+            payload["role"] = user_data.get("role")
+        if last_indication_at is not None:
+            payload["last_indication_at"] = last_indication_at
+        batch.set(self.collection.document(ambassador_doc_id(ambassador_id)), payload, merge=True)
+
+    # Leitura
+
+    def _get_many(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        # Contadores e rollups na mesma chamada a get_all
+        refs = [self._ref(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists}
+
+    def get_admin_dashboard(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Monta o dashboard admin lendo apenas documentos de contadores
+
+        Returns:
+            Dados do dashboard ou None se os contadores ainda não foram gerados
+        """
+        now = now or datetime.now()
+        month_keys = [month_key(month_date) for month_date in month_buckets(now, AdminDashboardAggregator.CHART_MONTHS)]
+        docs = self._get_many([GLOBAL_DOC] + [month_doc_id(key) for key in month_keys])
+
+        if GLOBAL_DOC not in docs:
+            return None
+
+        month_counters = {key: docs.get(month_doc_id(key), {}) for key in month_keys}
+        ambassador_docs = self.collection.where(field_path="kind", op_string="==", value="ambassador").stream()
+        ambassador_counters = [doc.to_dict() for doc in ambassador_docs]
+
+        return AdminDashboardAggregator.from_counters(
+            docs[GLOBAL_DOC], month_counters, ambassador_counters, now
+        ).result()
+
+    def get_ambassador_dashboard(self, ambassador_id: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Monta o dashboard de uma embaixadora lendo apenas documentos de contadores
+
+        Returns:
+            Dados do dashboard ou None se os contadores ainda não foram gerados
+        """
+        now = now or datetime.now()
+        month_keys = [month_key(month_date)
+                      for month_date in month_buckets(now, AmbassadorDashboardAggregator.CHART_MONTHS)]
+        doc_ids = [GLOBAL_DOC, ambassador_doc_id(ambassador_id)]
+        doc_ids += [ambassador_month_doc_id(ambassador_id, key) for key in month_keys]
+        docs = self._get_many(doc_ids)
+
+        if GLOBAL_DOC not in docs:
+            return None
+
+        month_counters = {key: docs.get(ambassador_month_doc_id(ambassador_id, key), {}) for key in month_keys}
+        return AmbassadorDashboardAggregator.from_counters(
+            docs.get(ambassador_doc_id(ambassador_id), {}), month_counters, now
+        ).result()
+
+    def get_installment_counters(self, ambassador_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retorna os contadores de parcelas (gerais ou de uma embaixadora)
+
+        Returns:
+            Documento de contadores ou None se ainda não foram gerados
+        """
+        doc_ids = [GLOBAL_DOC]
+        if ambassador_id:
+            doc_ids.append(ambassador_doc_id(ambassador_id))
+        docs = self._get_many(doc_ids)
+
+        if GLOBAL_DOC not in docs:
+            return None
+        if ambassador_id:
+            return docs.get(ambassador_doc_id(ambassador_id), {})
+        return docs[GLOBAL_DOC]
+
+    def get_monthly_rollups(self, ambassador_id: Optional[str] = None, months: int = 12,
+                            now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Série mensal (do mês mais antigo ao atual) lida dos rollups
+
+        Args:
+            ambassador_id: Escopo da embaixadora (padrão: global)
+            months: Quantidade de meses do calendário
+            now: Data de referência (padrão: agora)
+
+        Returns:
+            Um item por mês com "month" (YYYY-MM) e os campos de EMPTY_ROLLUP
+        """
+        scope = ambassador_doc_id(ambassador_id) if ambassador_id else GLOBAL_DOC
+        keys = [month_key(month_date) for month_date in month_buckets(now or datetime.now(), months)]
+        docs = self._get_many([rollup_doc_id(scope, key) for key in keys])
+
+        series = []
+        for key in reversed(keys):
+            data = docs.get(rollup_doc_id(scope, key), {})
+            series.append({"month": key, **{field: data.get(field, default) for field, default in EMPTY_ROLLUP.items()}})
+        return series
+
+    # Reconstrução
+
+    def _scan_sources(self, read_time: Optional[datetime] = None) -> tuple:
+        """Contribuição de todos os documentos de origem (no instante read_time, se informado)"""
+        totals = CounterDeltas()
+        profiles: Dict[str, Dict[str, Any]] = {}
+        last_indication: Dict[str, datetime] = {}
+        stats = {"users": 0, "indications": 0, "commissions": 0, "installments": 0}
+
+        for doc in self.db.collection("users").select(USER_FIELDS).stream(read_time=read_time):
+            user_data = doc.to_dict()
+            stats["users"] += 1
+            totals.merge(user_deltas(user_data))
+            profiles[doc.id] = {"name": user_data.get("name", "Sem nome"), "role": user_data.get("role")}
+
+        for doc in self.db.collection("indications").select(INDICATION_FIELDS).stream(read_time=read_time):
+            indication_data = doc.to_dict()
+            stats["indications"] += 1
+            totals.merge(indication_deltas(indication_data))
+            ambassador_id = indication_data.get("ambassadorId")
+            created_at = indication_data.get("createdAt")
+            if ambassador_id and isinstance(created_at, datetime):
+                current = last_indication.get(ambassador_id)
+                if current is None or to_naive(created_at) > to_naive(current):
+                    last_indication[ambassador_id] = created_at
+
+        for doc in self.db.collection("commissions").select(COMMISSION_FIELDS).stream(read_time=read_time):
+            stats["commissions"] += 1
+            totals.merge(commission_deltas(doc.to_dict()))
+
+        for doc in self.db.collection("commission_installments").select(INSTALLMENT_FIELDS).stream(
+                read_time=read_time):
+            stats["installments"] += 1
+            totals.merge(installment_deltas(doc.to_dict()))
+
+        return totals, profiles, last_indication, stats
+
+    def reconcile(self, read_time: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Corrige os contadores com incrementos, sem sobrescrevê-los
+
+        Coleções de origem e contadores são lidos no mesmo instante (read_time);
+        como cada rota grava entidade e incrementos no mesmo batch, os dois
+        lados são consistentes nesse instante e a diferença é aplicada com
+        firestore.Increment. Escritas feitas durante a reconciliação continuam
+        somando normalmente. Seguro para rodar agendado; só corrige contadores
+        (nome, role e última indicação ficam com as rotas e com rebuild).
+
+        Returns:
+            Documentos lidos por coleção e contadores corrigidos
+        """
+        # read_time precisa estar na última hora: a varredura deve terminar antes disso
+        read_time = read_time or datetime.now(timezone.utc)
+        totals, _, _, stats = self._scan_sources(read_time)
+        totals.ensure(GLOBAL_DOC, _global_identity())
+
+        current = {doc.id: doc.to_dict() for collection in (self.collection, self.rollups)
+                   for doc in collection.stream(read_time=read_time)}
+
+        corrections = CounterDeltas()
+        for doc_id in set(totals.fields) | set(current):
+            # Documento que só existe nos contadores já tem a identidade gravada
+            identity = totals.identity.get(doc_id, {})
+            fields = _counter_corrections(totals.fields.get(doc_id, {}), current.get(doc_id) or {})
+            if fields:
+                corrections.ensure(doc_id, identity).update(fields)
+
+        operations = []
+        for doc_id, fields in corrections.fields.items():
+            payload = dict(corrections.identity[doc_id])
+            payload.update(_as_increments(fields))
+            operations.append(("merge", doc_id, payload))
+        self._commit_in_chunks(operations)
+
+        stats["counters_corrected"] = len(operations)
+        return stats
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        Recalcula todos os contadores a partir das coleções de origem
+
+        Sobrescreve os contadores: escritas concorrentes durante a reconstrução
+        podem ser perdidas. Uso manual (rebuild_counters.py, primeira implantação);
+        a tarefa agendada usa reconcile.
+
+        Returns:
+            Quantidade de documentos lidos por coleção e de contadores gravados
+        """
+        totals, profiles, last_indication, stats = self._scan_sources()
+
+        # Garante o documento global mesmo com coleções vazias
+        totals.ensure(GLOBAL_DOC, _global_identity())
+
+        documents = {}
+        for doc_id, fields in totals.fields.items():
+            data = dict(totals.identity[doc_id])
+            data.update(_prune(fields))
+            ambassador_id = data.get("ambassador_id")
+            if data.get("kind") == "ambassador":
+                profile = profiles.get(ambassador_id, {"name": None, "role": None})
+                data.update(profile)
+                if ambassador_id in last_indication:
+                    data["last_indication_at"] = last_indication[ambassador_id]
+            data["rebuilt_at"] = datetime.now()
+            documents[doc_id] = data
+
+        stale_ids = [doc.id for collection in (self.collection, self.rollups)
+                     for doc in collection.select(["__name__"]).stream() if doc.id not in documents]
+
+        operations = [("set", doc_id, data) for doc_id, data in documents.items()]
+        operations += [("delete", doc_id, None) for doc_id in stale_ids]
+        self._commit_in_chunks(operations)
+
+        stats["counters_written"] = len(documents)
+        stats["counters_deleted"] = len(stale_ids)
+        return stats
+
+    def _commit_in_chunks(self, operations: Iterable[tuple]) -> None:
+        batch = self.db.batch()
+        pending = 0
+        for operation, doc_id, data in operations:
+            ref = self._ref(doc_id)
+            if operation == "set":
+                batch.set(ref, data)
+            elif operation == "merge":
+                batch.set(ref, data, merge=True)
+            else:
+                batch.delete(ref)
+            pending += 1
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
@@ -0,0 +1,22 @@
+"""
+Registro de exclusões para o feed de alterações
+
+O feed só escuta documentos alterados depois que o processo subiu; a exclusão
+de um documento antigo não chega por esse listener. Cada rota que exclui grava,
+no mesmo batch, um registro em deleted_documents com a coleção, o ID e a dona
+do documento, e o feed escuta essa coleção.
+"""
+from datetime import datetime
+from typing import Optional
+
+DELETIONS_COLLECTION = "deleted_documents"
+
+
+def record_deletion(batch, db, collection: str, doc_id: str, owner: Optional[str]) -> None:
+    """Adiciona ao batch o registro da exclusão de collection/doc_id"""
+    batch.set(db.collection(DELETIONS_COLLECTION).document(), {
+        "collection": collection,
+        "documentId": doc_id,
+        "owner": owner,
+        "deletedAt": datetime.now()
+    })
@@ -1,11 +1,15 @@
 """
 Serviço de abstração para operações com Firestore
 """
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any
 from datetime import datetime
 from google.cloud import firestore
 from config.firebase import firebase_config
 from utils.serializers import serialize_firestore_data
+from utils.cache import invalidate_user
+from services.pagination import DEFAULT_PAGE_SIZE, fetch_page, iter_pages
+from services import aggregations
+from services.repository import get_repository
 
 
 class FirestoreService:
@@ -42,13 +46,12 @@ class FirestoreService:
     
     def get_by_id(self, document_id: str) -> Optional[Dict[str, Any]]:
         """Busca um documento por ID"""
-        doc = self.collection.document(document_id).get()
+        data = get_repository(self._db).get(self.collection_name, document_id)
         
-        if not doc.exists:
+        if data is None:
             return None
         
-        data = doc.to_dict()
-        data["id"] = doc.id
+        data["id"] = document_id
         return serialize_firestore_data(data)
     
     def get_all(self) -> List[Dict[str, Any]]:
@@ -63,9 +66,9 @@ class FirestoreService:
         
         return results
     
-    def get_by_field(self, field: str, value: Any) -> List[Dict[str, Any]]:
-        """Busca documentos por um campo específico"""
-        query = self.collection.where(field_path=field, op_string="==", value=value)
+    def get_by_field(self, field: str, value: Any, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Busca documentos por um campo específico (fields: projeção opcional)"""
+        query = self._filtered([(field, "==", value)], fields)
         docs = query.stream()
         results = []
         
@@ -76,6 +79,54 @@ class FirestoreService:
         
         return results
     
+    def _filtered(self, filters: Optional[List[tuple]] = None, fields: Optional[List[str]] = None):
+        query = self.collection
+        for field, operator, value in filters or []:
+            query = query.where(field_path=field, op_string=operator, value=value)
+        # Projeção: baixa só os campos pedidos (o id do documento vem sempre)
+        if fields:
+            query = query.select(fields)
+        return query
+    
+    def _serialize_docs(self, docs) -> List[Dict[str, Any]]:
+        results = []
+        for doc in docs:
+            data = doc.to_dict()
+            data["id"] = doc.id
+            results.append(serialize_firestore_data(data))
+        return results
+    
+    def get_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                 filters: Optional[List[tuple]] = None, order_by: Optional[str] = None,
+                 descending: bool = False, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Busca uma página de documentos: {"items": [...], "next_cursor": id_ou_None}"""
+        docs, next_cursor = fetch_page(self.collection, self._filtered(filters, fields), limit, cursor,
+                                       order_by, descending)
+        return {"items": self._serialize_docs(docs), "next_cursor": next_cursor}
+    
+    def iter_pages(self, page_size: int = DEFAULT_PAGE_SIZE, filters: Optional[List[tuple]] = None,
+                   order_by: Optional[str] = None, fields: Optional[List[str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Percorre a coleção (ou consulta filtrada) página a página"""
+        for docs in iter_pages(self.collection, self._filtered(filters, fields), page_size, order_by):
+            yield self._serialize_docs(docs)
+    
+    def count(self, filters: Optional[List[tuple]] = None) -> int:
+        """Conta documentos com agregação no servidor (sem ler os documentos)"""
+        return aggregations.count(self._filtered(filters))
+    
+    def sum(self, field: str, filters: Optional[List[tuple]] = None) -> float:
+        """Soma um campo numérico com agregação no servidor"""
+        return aggregations.sum_field(self._filtered(filters), field)
+    
+    def avg(self, field: str, filters: Optional[List[tuple]] = None) -> Optional[float]:
+        """Média de um campo numérico com agregação no servidor (None se vazio)"""
+        return aggregations.avg_field(self._filtered(filters), field)
+    
+    def aggregate(self, filters: Optional[List[tuple]] = None, count: bool = False,
+                  sum_fields: Optional[List[str]] = None, avg_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Várias agregações em uma única consulta: {"count", "sum": {...}, "avg": {...}}"""
+        return aggregations.aggregate(self._filtered(filters), count, sum_fields or (), avg_fields or ())
+    
     def update(self, document_id: str, data: Dict[str, Any]) -> bool:
         """Atualiza um documento"""
         try:
@@ -83,6 +134,7 @@ class FirestoreService:
             data["updated_at"] = datetime.now()
             
             self.collection.document(document_id).update(data)
+            get_repository(self._db).forget(self.collection_name, document_id)
             return True
         except Exception as e:
             print(f"Erro ao atualizar documento {document_id}: {e}")
@@ -92,17 +144,15 @@ class FirestoreService:
         """Deleta um documento"""
         try:
             self.collection.document(document_id).delete()
+            get_repository(self._db).forget(self.collection_name, document_id)
             return True
         except Exception as e:
             print(f"Erro ao deletar documento {document_id}: {e}")
             return False
     
-    def query(self, filters: List[tuple]) -> List[Dict[str, Any]]:
-        """Executa uma query com múltiplos filtros"""
-        query = self.collection
-        
-        for field, operator, value in filters:
-            query = query.where(field_path=field, op_string=operator, value=value)
+    def query(self, filters: List[tuple], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Executa uma query com múltiplos filtros (fields: projeção opcional)"""
+        query = self._filtered(filters, fields)
         
         docs = query.stream()
         results = []
@@ -121,6 +171,18 @@ class UserService(FirestoreService):
     def __init__(self):
         super().__init__("users")
     
+    def update(self, document_id: str, data: Dict[str, Any]) -> bool:
+        """Atualiza o usuário e remove do cache de usuários"""
+        updated = super().update(document_id, data)
+        invalidate_user(document_id)
+        return updated
+    
+    def delete(self, document_id: str) -> bool:
+        """Deleta o usuário e remove do cache de usuários"""
+        deleted = super().delete(document_id)
+        invalidate_user(document_id)
+        return deleted
+    
     def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Busca usuário por email"""
         results = self.get_by_field("email", email)
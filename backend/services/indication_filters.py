@@ -0,0 +1,126 @@
+"""
+Filtros e ordenação de indicações traduzidos para consultas do Firestore
+
+Cada filtro de igualdade combina com o campo de ordenação por meio de um
+índice composto (campo, ordenação) declarado em firestore.indexes.json; o
+Firestore mescla esses índices quando há mais de um filtro de igualdade.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# Parâmetro da query string -> campo do documento
+EQUALITY_FILTERS = {
+    "status": "status",
+    "segment": "segment",
+    "origin": "origin",
+    "converted": "converted",
+    "ambassadorId": "ambassadorId",
+}
+
+SORT_FIELDS = ("createdAt", "updatedAt", "client_name")
+DEFAULT_DIRECTION = "desc"
+
+VALID_STATUS = ("agendado", "aprovado", "não aprovado")
+
+
+def _parse_bool(value: str) -> bool:
+    normalized = value.strip().lower()
+    if normalized in ("true", "1", "sim"):
+        return True
+    if normalized in ("false", "0", "nao", "não"):
+        return False
+    raise ValueError("Parâmetro converted deve ser true ou false")
+
+
+def _parse_date(value: str, name: str) -> datetime:
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Parâmetro {name} deve ser uma data ISO 8601 (ex.: 2025-01-31)")
+    # Datas sem fuso são UTC (como o Firestore grava datetime naive): com fuso, converter para UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_indication_filters(args: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Valida os parâmetros de filtro e ordenação de GET /indications
+
+    Sem "sort" (e sem intervalo de datas) a ordenação padrão da consulta é
+    mantida, pois order_by exclui documentos antigos que não têm o campo.
+
+    Returns:
+        {"equals": {campo: valor}, "created_from", "created_to", "sort", "descending"}
+
+    Raises:
+        ValueError: parâmetro inválido ou combinação sem índice
+    """
+    equals = {}
+    for param, field in EQUALITY_FILTERS.items():
+        value = args.get(param)
+        if value in (None, ""):
+            continue
+        if param == "converted":
+            value = _parse_bool(value)
+        elif param == "status" and value not in VALID_STATUS:
+            raise ValueError(f"Status inválido. Use: {', '.join(VALID_STATUS)}")
+        equals[field] = value
+
+    created_from = _parse_date(args["from"], "from") if args.get("from") else None
+    created_to = _parse_date(args["to"], "to") if args.get("to") else None
+    if created_to and len(args["to"].strip()) == 10:
+        # Data sem horário: incluir o dia inteiro
+        created_to = created_to.replace(hour=23, minute=59, second=59, microsecond=999999)
+    if created_from and created_to and created_from > created_to:
+        raise ValueError("Parâmetro from deve ser anterior a to")
+
+    sort = args.get("sort") or None
+    if sort is not None and sort not in SORT_FIELDS:
+        raise ValueError(f"Ordenação inválida. Use: {', '.join(SORT_FIELDS)}")
+
+    direction = (args.get("direction") or DEFAULT_DIRECTION).lower()
+    if direction not in ("asc", "desc"):
+        raise ValueError("Direção inválida. Use: asc ou desc")
+
+    # O Firestore exige que o filtro de intervalo seja o primeiro campo ordenado
+    if created_from or created_to:
+        if sort not in (None, "createdAt"):
+            raise ValueError("Filtro por data só pode ser combinado com sort=createdAt")
+        sort = "createdAt"
+
+    return {
+        "equals": equals,
+        "created_from": created_from,
+        "created_to": created_to,
+        "sort": sort,
+        "descending": direction == "desc",
+    }
+
+
+def apply_indication_filters(query, filters: Dict[str, Any],
+                             ambassador_id: Optional[str] = None) -> Tuple[Any, Optional[str], bool]:
+    """
+    Aplica os filtros validados à consulta de indicações
+
+    Args:
+        query: Coleção ou consulta de indicações
+        filters: Resultado de parse_indication_filters
+        ambassador_id: Restringe à embaixadora (sobrepõe o filtro ambassadorId)
+
+    Returns:
+        (consulta filtrada, campo de ordenação ou None, ordem decrescente)
+    """
+    equals = dict(filters["equals"])
+    if ambassador_id:
+        equals["ambassadorId"] = ambassador_id
+
+    for field, value in equals.items():
+        query = query.where(field_path=field, op_string="==", value=value)
+
+    if filters["created_from"]:
+        query = query.where(field_path="createdAt", op_string=">=", value=filters["created_from"])
+    if filters["created_to"]:
+        query = query.where(field_path="createdAt", op_string="<=", value=filters["created_to"])
+
+    return query, filters["sort"], filters["descending"]
@@ -0,0 +1,276 @@
+"""
+Outbox de efeitos colaterais executados fora da thread da requisição
+
+A rota grava a entrada do outbox no mesmo WriteBatch da escrita principal
+(enqueue) e, depois do commit, entrega a entrada ao pool de workers do
+processo (dispatch). A resposta sai após um único commit; a sincronização de
+comissões, notificações etc. rodam em segundo plano.
+
+Antes de executar, run reivindica a entrada em uma transação: só uma entrada
+"pending" (ou "running" com a concessão vencida) passa para "running", com
+next_attempt_at como fim da concessão. Quem perde a disputa (o pool do worker
+ou drain) não executa. Se o efeito falha, a entrada volta para "pending" e a
+tarefa agendada drain a executa de novo com backoff exponencial; se o processo
+morre no meio, drain a retoma quando a concessão vence. Handlers precisam ser
+idempotentes: uma execução interrompida pode ser repetida.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "outbox"
+
+# Concessão de uma execução; também é o prazo do dispatch antes de drain pegar a entrada
+LEASE_SECONDS = 120
+# Tentativas antes de a entrada ficar como "failed" para análise manual
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+DRAIN_LIMIT = 100
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Firestore devolve datas com fuso (UTC); o outbox grava datetime.now() sem fuso
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def claimable(entry: Dict[str, Any], now: datetime) -> bool:
+    """Entrada pendente ou em execução com a concessão vencida"""
+    if entry.get("status") == "pending":
+        return True
+    return entry.get("status") == "running" and _naive_utc(entry["next_attempt_at"]) <= now
+
+
+def claim_fields(entry: Dict[str, Any], lease_until: datetime) -> Dict[str, Any]:
+    return {"status": "running", "attempts": entry.get("attempts", 0) + 1, "next_attempt_at": lease_until}
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff exponencial: 30s, 1min, 2min, ... até 1h"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+class FirestoreOutboxStore:
+    """Entradas persistidas na coleção "outbox" (pendentes até o handler concluir)"""
+
+    def __init__(self, db: firestore.Client):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db.collection(OUTBOX_COLLECTION)
+
+    def add(self, batch, entry: Dict[str, Any]) -> str:
+        ref = self.collection.document()
+        batch.set(ref, entry)
+        return ref.id
+
+    def due(self, now: datetime, limit: int) -> List[Dict[str, Any]]:
+        # Pendentes vencidas e execuções cuja concessão venceu (processo morreu no meio)
+        query = (self.collection
+                 .where(field_path="status", op_string="in", value=["pending", "running"])
+                 .where(field_path="next_attempt_at", op_string="<=", value=now)
+                 .order_by("next_attempt_at")
+                 .limit(limit))
+        return [dict(doc.to_dict(), id=doc.id) for doc in query.stream()]
+
+    def claim(self, entry_id: str, now: datetime, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        """Marca a entrada como "running" em uma transação; None se outra execução a tem"""
+        ref = self.collection.document(entry_id)
+
+        @firestore.transactional
+        def claim_in_transaction(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists or not claimable(snapshot.to_dict(), now):
+                return None
+            entry = snapshot.to_dict()
+            fields = claim_fields(entry, lease_until)
+            transaction.update(ref, fields)
+            return dict(entry, id=entry_id, **fields)
+
+        return claim_in_transaction(self.db.transaction())
+
+    def update(self, entry_id: str, fields: Dict[str, Any]) -> None:
+        self.collection.document(entry_id).update(fields)
+
+    def complete(self, entry_id: str) -> None:
+        # Entradas concluídas são removidas: a coleção guarda só o que falta fazer
+        self.collection.document(entry_id).delete()
+
+
+class InMemoryOutboxStore:
+    """Outbox local (testes e desenvolvimento): grava na hora, sem batch"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def add(self, batch, entry: Dict[str, Any]) -> str:
+        with self._lock:
+            self._next_id += 1
+            entry_id = f"outbox{self._next_id}"
+            self.entries[entry_id] = dict(entry)
+        return entry_id
+
+    def due(self, now: datetime, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            due = [dict(entry, id=entry_id) for entry_id, entry in self.entries.items()
+                   if entry["status"] in ("pending", "running") and entry["next_attempt_at"] <= now]
+        return sorted(due, key=lambda entry: entry["next_attempt_at"])[:limit]
+
+    def claim(self, entry_id: str, now: datetime, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None or not claimable(entry, now):
+                return None
+            entry.update(claim_fields(entry, lease_until))
+            return dict(entry, id=entry_id)
+
+    def update(self, entry_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[entry_id].update(fields)
+
+    def complete(self, entry_id: str) -> None:
+        with self._lock:
+            self.entries.pop(entry_id, None)
+
+
+class Outbox:
+    """Fila de efeitos colaterais com pool de workers e reexecução a partir do store"""
+
+    def __init__(self, store, max_workers: int = 4):
+        """
+        Args:
+            store: FirestoreOutboxStore ou InMemoryOutboxStore
+            max_workers: Threads do pool (0 executa na hora, na thread de quem chamou)
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self.metrics = {"dispatched": 0, "succeeded": 0, "retried": 0, "failed": 0, "skipped": 0}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def register(self, task: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """Associa um handler (recebe o payload) ao nome da tarefa"""
+        self.handlers[task] = handler
+
+    def enqueue(self, batch, task: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Adiciona a entrada ao batch da escrita principal (o commit fica com quem chamou)
+
+        Returns:
+            Entrada a ser passada para dispatch após o commit
+        """
+        if task not in self.handlers:
+            raise ValueError(f"Tarefa de outbox não registrada: {task}")
+
+        now = datetime.now()
+        entry = {
+            "task": task,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now + timedelta(seconds=LEASE_SECONDS),
+            "last_error": None,
+        }
+        entry["id"] = self.store.add(batch, dict(entry))
+        return entry
+
+    def dispatch(self, entry: Dict[str, Any]) -> None:
+        """Executa a entrada no pool de workers (chamar depois do commit)"""
+        self.metrics["dispatched"] += 1
+        if self.max_workers <= 0:
+            self.run(entry)
+            return
+        self._get_executor().submit(self.run, entry)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Criado sob demanda: processos filhos (fork) não herdam threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="outbox")
+            return self._executor
+
+    def run(self, entry: Dict[str, Any], now: Optional[datetime] = None) -> Optional[bool]:
+        """
+        Reivindica a entrada, executa o handler e registra sucesso ou nova tentativa no store
+
+        Returns:
+            True/False conforme o handler, ou None se outra execução reivindicou a entrada
+        """
+        now = now or datetime.now()
+        claimed = self.store.claim(entry["id"], now, now + timedelta(seconds=LEASE_SECONDS))
+        if claimed is None:
+            self.metrics["skipped"] += 1
+            return None
+
+        entry, attempts = claimed, claimed["attempts"]
+        if attempts > MAX_ATTEMPTS:
+            # Concessões vencidas em sequência: o processo morre ao executar a entrada
+            self._record_failure(entry, MAX_ATTEMPTS, RuntimeError("concessão vencida sem conclusão"))
+            return False
+        try:
+            handler = self.handlers.get(entry["task"])
+            if handler is None:
+                raise ValueError(f"Tarefa de outbox não registrada: {entry['task']}")
+            handler(entry["payload"])
+        except Exception as e:
+            self._record_failure(entry, attempts, e)
+            return False
+
+        try:
+            self.store.complete(entry["id"])
+        except Exception as e:
+            # O efeito já aconteceu; se a remoção falhar, drain repete (handlers idempotentes)
+            logger.warning(f"Erro ao concluir entrada {entry['id']} do outbox: {e}")
+        self.metrics["succeeded"] += 1
+        return True
+
+    def _record_failure(self, entry: Dict[str, Any], attempts: int, error: Exception) -> None:
+        fields = {"attempts": attempts, "last_error": str(error), "status": "pending"}
+        if attempts >= MAX_ATTEMPTS:
+            fields["status"] = "failed"
+            self.metrics["failed"] += 1
+            logger.error(f"Entrada {entry['id']} ({entry['task']}) falhou {attempts} vezes: {error}")
+        else:
+            fields["next_attempt_at"] = datetime.now() + retry_delay(attempts)
+            self.metrics["retried"] += 1
+            logger.warning(f"Entrada {entry['id']} ({entry['task']}) será repetida: {error}")
+
+        try:
+            self.store.update(entry["id"], fields)
+        except Exception as e:
+            logger.error(f"Erro ao registrar falha da entrada {entry['id']} do outbox: {e}")
+
+    def drain(self, limit: int = DRAIN_LIMIT, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Reexecuta as entradas vencidas (falhas anteriores, não executadas ou com a concessão vencida)
+
+        Returns:
+            Quantidade de entradas processadas, concluídas, que falharam e já reivindicadas por outra execução
+        """
+        now = now or datetime.now()
+        results = [self.run(entry, now) for entry in self.store.due(now, limit)]
+        return {"processed": len(results), "succeeded": results.count(True),
+                "failed": results.count(False), "skipped": results.count(None)}
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.metrics, tasks=sorted(self.handlers))
@@ -0,0 +1,109 @@
+"""
+Paginação por cursor para consultas do Firestore
+
+O cursor é o ID do último documento da página. Sem campo de ordenação a
+consulta é ordenada pelo ID do documento (__name__), o que dá uma ordem
+estável sem índice extra. Com campo de ordenação, o documento do cursor é
+lido para que start_after use o valor do campo e o ID como desempate.
+"""
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+from google.cloud import firestore
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursorError(ValueError):
+    """Cursor não corresponde a um documento da coleção"""
+
+
+def parse_page_args(args: Mapping[str, Any]) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Lê "limit" e "cursor" da query string
+
+    Returns:
+        (limit, cursor); limit é None quando a paginação não foi pedida
+
+    Raises:
+        ValueError: se limit não for um inteiro positivo
+    """
+    raw_limit = args.get("limit")
+    cursor = args.get("cursor") or None
+
+    if raw_limit in (None, ""):
+        return (DEFAULT_PAGE_SIZE if cursor else None), cursor
+
+    try:
+        limit = int(raw_limit)
+    except (TypeError, ValueError):
+        raise ValueError("Parâmetro limit deve ser um número inteiro")
+
+    if limit <= 0:
+        raise ValueError("Parâmetro limit deve ser maior que zero")
+
+    return min(limit, MAX_PAGE_SIZE), cursor
+
+
+def fetch_page(collection, query=None, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+               order_by: Optional[str] = None, descending: bool = False) -> Tuple[List[Any], Optional[str]]:
+    """
+    Busca uma página de documentos
+
+    Args:
+        collection: Referência da coleção (usada para resolver o cursor)
+        query: Consulta já filtrada (padrão: a coleção inteira)
+        limit: Tamanho da página
+        cursor: ID do último documento da página anterior
+        order_by: Campo de ordenação (padrão: ID do documento)
+        descending: Ordem decrescente
+
+    Returns:
+        (snapshots da página, cursor da próxima página ou None se acabou)
+
+    Raises:
+        InvalidCursorError: se o cursor não existir na coleção
+    """
+    query = collection if query is None else query
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+
+    if order_by:
+        query = query.order_by(order_by, direction=direction)
+        if cursor:
+            cursor_doc = collection.document(cursor).get()
+            if not cursor_doc.exists:
+                raise InvalidCursorError("Cursor inválido")
+            query = query.start_after(cursor_doc)
+    else:
+        query = query.order_by("__name__", direction=direction)
+        if cursor:
+            query = query.start_after({"__name__": collection.document(cursor)})
+
+    # Um documento a mais indica se existe próxima página sem outra consulta
+    docs = list(query.limit(limit + 1).stream())
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, docs[-1].id
+
+    return docs, None
+
+
+def iter_pages(collection, query=None, page_size: int = DEFAULT_PAGE_SIZE, order_by: Optional[str] = None,
+               descending: bool = False) -> Iterator[List[Any]]:
+    """Percorre a consulta página a página sem materializar a coleção inteira"""
+    cursor = None
+    while True:
+        docs, cursor = fetch_page(collection, query, page_size, cursor, order_by, descending)
+        if docs:
+            yield docs
+        if cursor is None:
+            return
+
+
+def page_items(docs: List[Any]) -> List[Dict[str, Any]]:
+    """Converte snapshots em dicionários com "id" """
+    items = []
+    for doc in docs:
+        data = doc.to_dict()
+        data["id"] = doc.id
+        items.append(data)
+    return items
@@ -0,0 +1,115 @@
+"""
+Repositório de documentos com mapa de identidade por requisição
+
+Dentro de uma requisição cada documento é lido no máximo uma vez: a checagem
+de papel, a busca do nome da embaixadora e a releitura da indicação passam
+pelo mesmo mapa. Leituras de vários IDs vão em lotes de db.get_all.
+
+O armazenamento fica atrás de um backend plugável (Firestore ou memória) com
+a mesma interface, registrado na aplicação com init_repository.
+"""
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from flask import current_app, g, has_app_context
+
+from services.batch_fetch import GET_ALL_CHUNK_SIZE, fetch_documents
+
+
+class FirestoreBackend:
+    """Backend que lê do Firestore com get_all em lotes"""
+
+    def __init__(self, db, chunk_size: int = GET_ALL_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def get_many(self, collection: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return fetch_documents(self.db, collection, ids, chunk_size=self.chunk_size)
+
+
+class InMemoryBackend:
+    """Backend em memória (testes e desenvolvimento local)"""
+
+    def __init__(self, collections: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None):
+        self.collections = collections if collections is not None else {}
+        self.calls = 0
+
+    def get_many(self, collection: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        self.calls += 1
+        documents = self.collections.get(collection, {})
+        return {doc_id: dict(documents[doc_id]) for doc_id in dict.fromkeys(ids) if doc_id in documents}
+
+
+class Repository:
+    """Leitura de documentos por ID com mapa de identidade"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        # (coleção, id) -> dados; None registra que o documento não existe
+        self._identity: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Dados do documento (cópia) ou None se não existir"""
+        if not doc_id:
+            return None
+        return self.get_many(collection, [doc_id]).get(doc_id)
+
+    def get_many(self, collection: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Busca vários documentos, indo ao backend só pelos que ainda não foram lidos
+
+        Returns:
+            Dicionário {id: dados} apenas com os documentos existentes
+        """
+        unique_ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id]
+        missing = [doc_id for doc_id in unique_ids if (collection, doc_id) not in self._identity]
+        if missing:
+            found = self.backend.get_many(collection, missing)
+            for doc_id in missing:
+                self._identity[(collection, doc_id)] = found.get(doc_id)
+
+        documents = {}
+        for doc_id in unique_ids:
+            data = self._identity[(collection, doc_id)]
+            if data is not None:
+                documents[doc_id] = dict(data)
+        return documents
+
+    def remember(self, collection: str, doc_id: str, data: Optional[Dict[str, Any]]) -> None:
+        """Registra um documento já lido por outra via (consulta, transação)"""
+        self._identity[(collection, doc_id)] = dict(data) if data is not None else None
+
+    def forget(self, collection: str, doc_id: str) -> None:
+        """Descarta o documento do mapa após escrita nele"""
+        self._identity.pop((collection, doc_id), None)
+
+    def clear(self) -> None:
+        self._identity.clear()
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._identity
+
+
+def init_repository(app, backend) -> None:
+    """Registra o backend da aplicação e descarta o mapa ao fim de cada requisição"""
+    app.extensions["repository_backend"] = backend
+
+    @app.teardown_appcontext
+    def _drop_repository(exception=None):
+        g.pop("repository", None)
+
+
+def get_repository(db=None) -> Repository:
+    """
+    Repositório da requisição atual
+
+    Fora de um contexto Flask devolve um repositório novo (sem compartilhar o
+    mapa), lendo do Firestore pelo db informado.
+    """
+    if not has_app_context():
+        return Repository(FirestoreBackend(db))
+
+    repository = g.get("repository")
+    if repository is None:
+        backend = current_app.extensions.get("repository_backend") or FirestoreBackend(db)
+        repository = g.repository = Repository(backend)
+    return repository
@@ -0,0 +1,143 @@
+"""
+Testes para as agregações count/sum/avg e o cálculo local de reserva
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import aggregations
+from services.aggregations import aggregate, avg_field, count, sum_field
+
+ROWS = [
+    {"status": "pago", "value": 300.0},
+    {"status": "pendente", "value": 300},
+    {"status": "pendente", "value": "300"},
+    {"status": "atrasado", "value": True},
+    {"status": "atrasado"},
+]
+
+
+class FakeResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """Simula AggregationQuery: acumula agregações e responde em uma chamada"""
+
+    def __init__(self, rows, calls):
+        self.rows = rows
+        self.calls = calls
+        self.specs = []
+
+    def _numbers(self, field):
+        return [row[field] for row in self.rows
+                if isinstance(row.get(field), (int, float)) and not isinstance(row.get(field), bool)]
+
+    def count(self, alias=None):
+        self.specs.append((alias, len(self.rows)))
+        return self
+
+    def sum(self, field, alias=None):
+        self.specs.append((alias, sum(self._numbers(field))))
+        return self
+
+    def avg(self, field, alias=None):
+        numbers = self._numbers(field)
+        self.specs.append((alias, sum(numbers) / len(numbers) if numbers else None))
+        return self
+
+    def get(self):
+        self.calls.append(len(self.specs))
+        return [[FakeResult(alias, value) for alias, value in self.specs]]
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+
+class FakeQuery:
+    """Consulta com projeção; com server=True também oferece agregações"""
+
+    def __init__(self, rows, server=True):
+        self.rows = rows
+        self.server = server
+        self.calls = []
+        self.projection = None
+
+    def __getattr__(self, name):
+        if name in ("count", "sum", "avg") and self.server:
+            return getattr(FakeAggregationQuery(self.rows, self.calls), name)
+        raise AttributeError(name)
+
+    def select(self, fields):
+        projected = FakeQuery(self.rows, self.server)
+        projected.projection = list(fields)
+        self.projection = projected.projection
+        return projected
+
+    def stream(self):
+        keep = [field for field in self.projection if field != "__name__"]
+        return [FakeSnapshot({k: row[k] for k in keep if k in row}) for row in self.rows]
+
+
+@pytest.fixture(autouse=True)
+def reset_server_flag():
+    aggregations._server_aggregations = True
+    yield
+    aggregations._server_aggregations = True
+
+
+class TestServerAggregations:
+    """Agregações executadas pelo servidor"""
+
+    def test_count_sum_avg_in_one_request(self):
+        query = FakeQuery(ROWS)
+        result = aggregate(query, count=True, sum_fields=["value"], avg_fields=["value"])
+
+        assert result == {"count": 5, "sum": {"value": 600.0}, "avg": {"value": 300.0}}
+        assert query.calls == [3]
+        assert query.projection is None
+
+    def test_helpers(self):
+        assert count(FakeQuery(ROWS)) == 5
+        assert sum_field(FakeQuery(ROWS), "value") == 600.0
+        assert avg_field(FakeQuery([]), "value") is None
+
+    def test_limits(self):
+        with pytest.raises(ValueError):
+            aggregate(FakeQuery(ROWS))
+        with pytest.raises(ValueError):
+            aggregate(FakeQuery(ROWS), count=True, sum_fields=["a", "b", "c"], avg_fields=["d", "e"])
+
+
+class TestLocalFallback:
+    """Sem suporte no servidor, lê só os campos projetados"""
+
+    def test_same_results_as_server(self):
+        server = aggregate(FakeQuery(ROWS), count=True, sum_fields=["value"], avg_fields=["value"])
+        aggregations._server_aggregations = True
+        query = FakeQuery(ROWS, server=False)
+        local = aggregate(query, count=True, sum_fields=["value"], avg_fields=["value"])
+
+        assert local == server
+        assert query.projection == ["value"]
+
+    def test_count_projects_only_document_name(self):
+        query = FakeQuery(ROWS, server=False)
+        assert count(query) == 5
+        assert query.projection == ["__name__"]
+
+    def test_fallback_is_remembered(self):
+        count(FakeQuery(ROWS, server=False))
+        server_capable = FakeQuery(ROWS)
+        assert count(server_capable) == 5
+        assert server_capable.calls == []
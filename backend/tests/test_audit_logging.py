@@ -0,0 +1,72 @@
+"""
+Testes para o pipeline assíncrono de auditoria
+"""
+import json
+import logging
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit_logging
+from audit_logging import AuditLogger, AuditPipeline
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    pipeline = AuditPipeline(log_dir=str(tmp_path))
+    pipeline.start()
+    monkeypatch.setattr(audit_logging, "_pipeline", pipeline)
+    yield pipeline
+    pipeline.stop()
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line.split(" - AUDIT - INFO - ", 1)[1]) for line in f]
+
+
+class TestAuditPipeline:
+    """Eventos enfileirados na requisição e gravados em lote por outra thread"""
+
+    def test_events_are_written_with_verifiable_checksum(self, pipeline, tmp_path):
+        logger = AuditLogger()
+        with Flask(__name__).test_request_context("/indications", method="POST"):
+            for i in range(3):
+                logger.log_indication_action("create", f"ind-{i}", new_data={"client_name": "João"})
+        pipeline.stop()
+
+        events = read_events(tmp_path / "audit.log")
+        assert [event["resource"]["id"] for event in events] == ["ind-0", "ind-1", "ind-2"]
+        assert events[0]["changes"]["new_values"] == {"client_name": "João"}
+
+        checksum = events[0].pop("checksum")
+        assert logger._calculate_checksum(events[0]) == checksum
+
+        # O mesmo lote vai para o store consultável
+        stored = pipeline.store_handler.store.search(event_type="indication_created")
+        assert [event["resource"]["id"] for event in stored] == ["ind-2", "ind-1", "ind-0"]
+
+    def test_full_queue_drops_low_severity_events(self, tmp_path):
+        # Sem listener iniciado: nada sai da fila
+        pipeline = AuditPipeline(log_dir=str(tmp_path), queue_size=1, block_timeout=0.01)
+        for severity in ("low", "low", "critical"):
+            record = logging.LogRecord("audit", logging.INFO, __file__, 0, "{}", None, None)
+            record.audit_severity = severity
+            pipeline.handler.handle(record)
+
+        assert pipeline.stats() == {"queued": 1, "dropped": 2}
+
+    def test_rotates_by_size(self, tmp_path):
+        pipeline = AuditPipeline(log_dir=str(tmp_path), max_bytes=200, backup_count=2)
+        pipeline.start()
+        logger = logging.getLogger("audit")
+        for i in range(10):
+            logger.info(json.dumps({"event_id": i, "description": "x" * 50}))
+        pipeline.stop()
+
+        assert (tmp_path / "audit.log.1").exists()
+        assert not (tmp_path / "audit.log.3").exists()
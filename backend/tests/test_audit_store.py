@@ -0,0 +1,84 @@
+"""
+Testes para o armazenamento consultável da auditoria
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_store import AuditStore
+
+
+def make_event(i, when, event_type="indication_created", severity="medium", email="admin@beepy.com",
+               success=True):
+    return {
+        "event_id": f"evt-{i}",
+        "timestamp": when.isoformat(),
+        "event_type": event_type,
+        "description": f"Evento {i}",
+        "severity": severity,
+        "success": success,
+        "user_context": {"user_email": email, "authenticated": email is not None},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Três dias de eventos, um a cada 6 horas, em segmentos de 5 eventos
+    store = AuditStore(str(tmp_path), segment_max_events=5)
+    start = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    events = []
+    for i in range(12):
+        events.append(make_event(
+            i, start + timedelta(hours=6 * i),
+            event_type="login_failure" if i % 4 == 0 else "indication_created",
+            severity="high" if i % 3 == 0 else "medium",
+            email="embaixadora@teste.com" if i % 2 else "admin@beepy.com",
+            success=i % 4 != 0,
+        ))
+    for chunk in (events[:4], events[4:9], events[9:]):
+        store.append_many(chunk)
+    yield store
+    store.close()
+
+
+class TestAuditStore:
+    """Busca por índices e resumos a partir dos contadores"""
+
+    def test_rotates_segments_between_batches(self, store):
+        # 4 + 5 eventos no primeiro segmento (cheio após o lote), 3 no segundo
+        assert len(store.segments()) == 2
+
+    def test_search_filters_newest_first(self, store):
+        results = store.search(event_type="login_failure")
+        assert [event["event_id"] for event in results] == ["evt-8", "evt-4", "evt-0"]
+
+        results = store.search(user_email="embaixadora@teste.com", severity="high", limit=1)
+        assert [event["event_id"] for event in results] == ["evt-9"]
+
+    def test_search_by_period_skips_other_segments(self, store):
+        results = store.search(start_date=datetime(2025, 7, 2), end_date=datetime(2025, 7, 2, 12))
+        assert [event["event_id"] for event in results] == ["evt-6", "evt-5", "evt-4"]
+
+    def test_summary_over_everything(self, store):
+        summary = store.summary()
+
+        assert summary["total_events"] == 12
+        assert summary["events_by_type"] == {"login_failure": 3, "indication_created": 9}
+        assert summary["events_by_severity"] == {"high": 4, "medium": 8}
+        assert summary["top_users"] == [{"email": "admin@beepy.com", "event_count": 6},
+                                        {"email": "embaixadora@teste.com", "event_count": 6}]
+        assert summary["failed_operations"] == 3
+        assert summary["security_events"] == 0
+
+    def test_summary_with_partial_days_matches_search(self, store):
+        # 1/7 12h até 3/7 06h: meio dia, um dia inteiro (contadores) e a ponta final
+        start, end = datetime(2025, 7, 1, 12), datetime(2025, 7, 3, 6)
+        summary = store.summary(start, end)
+        events = store.search(start_date=start, end_date=end, limit=1000)
+
+        assert summary["total_events"] == len(events) == 8
+        assert summary["failed_operations"] == sum(1 for event in events if not event["success"])
@@ -0,0 +1,60 @@
+"""
+Testes para a busca em lote de documentos
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.batch_fetch import collect_ids, fetch_documents
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDb:
+    """Cliente mínimo que registra as chamadas a get_all"""
+
+    def __init__(self, collections):
+        self.collections = collections
+        self.get_all_calls = []
+
+    def collection(self, name):
+        class Collection:
+            def document(self, doc_id):
+                return (name, doc_id)
+
+        return Collection()
+
+    def get_all(self, refs, field_paths=None):
+        self.get_all_calls.append(list(refs))
+        return [FakeSnapshot(doc_id, self.collections[name].get(doc_id)) for name, doc_id in refs]
+
+
+class TestBatchFetch:
+    """Testes para collect_ids e fetch_documents"""
+
+    def test_collect_ids_is_distinct_and_ordered(self):
+        rows = [{"ambassadorId": "b"}, {"ambassadorId": "a"}, {"ambassadorId": "b"}, {"ambassadorId": None}, {}]
+        assert collect_ids(rows, "ambassadorId") == ["b", "a"]
+
+    def test_fetch_documents_in_chunks(self):
+        users = {f"u{i}": {"name": f"User {i}"} for i in range(5)}
+        db = FakeDb({"users": users})
+
+        result = fetch_documents(db, "users", ["u0", "u1", "u1", "u2", "u3", "u4", "missing"], chunk_size=2)
+
+        assert result == users
+        assert [len(call) for call in db.get_all_calls] == [2, 2, 2]
+
+    def test_fetch_documents_without_ids(self):
+        db = FakeDb({"users": {}})
+        assert fetch_documents(db, "users", []) == {}
+        assert db.get_all_calls == []
@@ -0,0 +1,65 @@
+"""
+Testes para o cache em memória com TTL e LRU
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import cache as cache_module
+from utils.cache import TTLCache
+
+
+class TestTTLCache:
+    """Testes para TTLCache"""
+
+    def test_get_and_set(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_expiration(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+        cache = TTLCache(maxsize=10, ttl=30)
+        cache.set("a", 1)
+        now[0] += 29
+        assert cache.get("a") == 1
+        now[0] += 2
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_get_or_load_does_not_cache_none(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return None
+
+        assert cache.get_or_load("a", loader) is None
+        assert cache.get_or_load("a", loader) is None
+        assert len(calls) == 2
+
+        assert cache.get_or_load("b", lambda: {"role": "admin"}) == {"role": "admin"}
+        assert cache.get_or_load("b", loader) == {"role": "admin"}
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        assert cache.get("a") is None
@@ -0,0 +1,154 @@
+"""
+Testes para o feed de alterações (SSE)
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from realtime_notifications import ChangeFeed, ChangeFeedFull
+
+
+def drain(subscriber_queue):
+    events = []
+    while not subscriber_queue.empty():
+        events.append(subscriber_queue.get_nowait())
+    return events
+
+
+class TestChangeFeed:
+    """Testes para ChangeFeed"""
+
+    def setup_method(self):
+        self.feed = ChangeFeed(buffer_size=3, queue_size=10)
+
+    def test_role_scoping(self):
+        admin_queue, _ = self.feed.subscribe("admin1", "admin")
+        ambassador_queue, _ = self.feed.subscribe("amb1", "embaixadora")
+
+        self.feed.publish("indications", "upsert", "i1", {"ambassadorId": "amb1", "status": "agendado"})
+        self.feed.publish("indications", "upsert", "i2", {"ambassadorId": "amb2"})
+        self.feed.publish("commission_installments", "delete", "p1", {"ambassador_id": "amb1"})
+        self.feed.publish("users", "upsert", "amb2", {"name": "Bia", "password": "hash"})
+
+        admin_events = drain(admin_queue)
+        assert [event["id"] for event in admin_events] == ["i1", "i2", "p1", "amb2"]
+        assert "password" not in admin_events[-1]["data"]
+
+        ambassador_events = drain(ambassador_queue)
+        assert [(event["id"], event["op"]) for event in ambassador_events] == [("i1", "upsert"), ("p1", "delete")]
+        assert ambassador_events[1]["data"] is None
+
+    def test_replay_from_last_event_id(self):
+        for index in range(3):
+            self.feed.publish("indications", "upsert", f"i{index}", {"ambassadorId": "amb1"})
+
+        _, replay = self.feed.subscribe("amb1", "embaixadora", f"{self.feed.epoch}:1")
+        assert [event["id"] for event in replay] == ["i1", "i2"]
+
+    def test_reset_when_history_is_gone_or_epoch_differs(self):
+        for index in range(5):
+            self.feed.publish("indications", "upsert", f"i{index}", {"ambassadorId": "amb1"})
+
+        _, replay = self.feed.subscribe("amb1", "embaixadora", f"{self.feed.epoch}:1")
+        assert replay is None
+
+        _, replay = self.feed.subscribe("amb1", "embaixadora", "outro:4")
+        assert replay is None
+
+    def test_slow_subscriber_is_reset(self):
+        feed = ChangeFeed(queue_size=2)
+        subscriber_queue, _ = feed.subscribe("admin1", "admin")
+        for index in range(3):
+            feed.publish("indications", "upsert", f"i{index}", {})
+
+        assert drain(subscriber_queue) == [None]
+        assert subscriber_queue not in feed.subscribers
+
+    def test_stream_limit_per_process(self):
+        feed = ChangeFeed(max_streams=2)
+        first, _ = feed.subscribe("amb1", "embaixadora")
+        feed.subscribe("amb2", "embaixadora")
+
+        with pytest.raises(ChangeFeedFull):
+            feed.subscribe("amb3", "embaixadora")
+
+        # Aba fechada libera a vaga
+        feed.unsubscribe(first)
+        feed.subscribe("amb3", "embaixadora")
+
+    def test_owner_change_removes_document_from_previous_owner(self):
+        old_owner_queue, _ = self.feed.subscribe("amb1", "embaixadora")
+        new_owner_queue, _ = self.feed.subscribe("amb2", "embaixadora")
+
+        self.feed.publish("commissions", "upsert", "c1", {"ambassadorId": "amb1", "status": "pendente"})
+        self.feed.publish("commissions", "upsert", "c1", {"ambassadorId": "amb2", "status": "pendente"})
+
+        assert [(event["id"], event["op"]) for event in drain(old_owner_queue)] == [("c1", "upsert"), ("c1", "delete")]
+        assert [(event["id"], event["op"]) for event in drain(new_owner_queue)] == [("c1", "upsert")]
+
+    def test_owner_change_after_restart_uses_previous_owner_field(self):
+        old_owner_queue, _ = self.feed.subscribe("amb1", "embaixadora")
+
+        self.feed.publish("commissions", "upsert", "c1", {"ambassadorId": "amb2", "previousAmbassadorId": "amb1"})
+        # A dona anterior já foi avisada: novas escritas não repetem a remoção
+        self.feed.publish("commissions", "upsert", "c1", {"ambassadorId": "amb2", "previousAmbassadorId": "amb1"})
+
+        assert [(event["id"], event["op"]) for event in drain(old_owner_queue)] == [("c1", "delete")]
+
+
+class FakeChange:
+    def __init__(self, type_name, doc_id, data):
+        self.type = type("ChangeType", (), {"name": type_name})
+        self.document = type("Doc", (), {"id": doc_id, "to_dict": lambda _self: data})()
+
+
+class FakeListenQuery:
+    def __init__(self, db, collection, filters=()):
+        self.db = db
+        self.collection = collection
+        self.filters = filters
+
+    def where(self, field_path, op_string, value):
+        return FakeListenQuery(self.db, self.collection, self.filters + ((field_path, op_string, value),))
+
+    def on_snapshot(self, callback):
+        self.db.listeners[self.collection] = (self.filters, callback)
+        return self
+
+
+class FakeListenDb:
+    def __init__(self):
+        self.listeners = {}
+
+    def collection(self, name):
+        return FakeListenQuery(self, name)
+
+
+class TestChangeFeedListeners:
+    """Listeners filtrados por data de atualização e exclusões registradas"""
+
+    def setup_method(self):
+        self.feed = ChangeFeed()
+        self.db = FakeListenDb()
+        self.feed.start(self.db)
+        # Snapshot inicial é descartado
+        for _, callback in self.db.listeners.values():
+            callback(None, [], None)
+
+    def test_listeners_only_watch_recent_writes(self):
+        assert set(self.db.listeners) == set(ChangeFeed.UPDATED_FIELDS) | {"deleted_documents"}
+        for collection, field in ChangeFeed.UPDATED_FIELDS.items():
+            (filter_field, op, _), = self.db.listeners[collection][0]
+            assert (filter_field, op) == (field, ">=")
+
+    def test_deletions_come_from_deletion_records(self):
+        subscriber_queue, _ = self.feed.subscribe("amb1", "embaixadora")
+
+        self.db.listeners["indications"][1](None, [FakeChange("REMOVED", "i1", {"ambassadorId": "amb1"})], None)
+        self.db.listeners["deleted_documents"][1](None, [FakeChange("ADDED", "d1", {
+            "collection": "indications", "documentId": "i1", "owner": "amb1"})], None)
+
+        assert [(event["id"], event["op"]) for event in drain(subscriber_queue)] == [("i1", "delete")]
@@ -0,0 +1,62 @@
+"""
+Testes para ETag / If-None-Match em safe_jsonify
+"""
+import os
+import sys
+
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import safe_jsonify
+
+
+def create_test_app():
+    app = Flask(__name__)
+    state = {"items": [{"id": "a", "status": "agendado"}]}
+
+    @app.route("/items", methods=["GET", "POST"])
+    def items():
+        return safe_jsonify(state["items"], 200)
+
+    @app.route("/items/change", methods=["POST"])
+    def change():
+        state["items"][0]["status"] = "aprovado"
+        return safe_jsonify({"message": "ok"}, 200)
+
+    @app.route("/missing")
+    def missing():
+        return safe_jsonify({"error": "Não encontrado"}, 404)
+
+    return app
+
+
+class TestConditionalResponses:
+    """Testes para respostas condicionais"""
+
+    def setup_method(self):
+        self.client = create_test_app().test_client()
+
+    def test_get_has_strong_etag_and_private_cache(self):
+        response = self.client.get("/items")
+        assert response.status_code == 200
+        assert response.headers["ETag"].startswith('"')
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        assert "Authorization" in response.headers["Vary"]
+
+    def test_matching_etag_returns_304_without_body(self):
+        etag = self.client.get("/items").headers["ETag"]
+        response = self.client.get("/items", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_changed_content_returns_new_body(self):
+        etag = self.client.get("/items").headers["ETag"]
+        self.client.post("/items/change")
+        response = self.client.get("/items", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_non_get_and_errors_are_not_conditional(self):
+        assert "ETag" not in self.client.post("/items").headers
+        assert "ETag" not in self.client.get("/missing").headers
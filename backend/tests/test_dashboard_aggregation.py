@@ -0,0 +1,167 @@
+"""
+Testes para a agregação em passada única dos dashboards
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.dashboard_aggregation import (
+    build_admin_dashboard, build_ambassador_dashboard, ADMIN_USER_FIELDS, ADMIN_INDICATION_FIELDS,
+    ADMIN_COMMISSION_FIELDS, AMBASSADOR_INDICATION_FIELDS, AMBASSADOR_COMMISSION_FIELDS
+)
+
+
+class FakeDoc:
+    """Snapshot mínimo com id e to_dict()"""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+NOW = datetime(2025, 7, 15, 12, 0, 0)
+
+
+def make_users():
+    return [
+        FakeDoc("admin", {"role": "admin", "name": "Admin"}),
+        FakeDoc("amb1", {"role": "embaixadora", "name": "Ana"}),
+        FakeDoc("amb2", {"role": "embaixadora", "name": "Bia"}),
+        FakeDoc("amb3", {"role": "embaixadora", "name": "Carla"}),
+    ]
+
+
+def make_indications():
+    return [
+        FakeDoc("i1", {"status": "aprovado", "origin": "instagram", "segment": "saude",
+                       "ambassadorId": "amb1", "createdAt": NOW - timedelta(days=2)}),
+        FakeDoc("i2", {"status": "agendado", "origin": "instagram", "segment": "saude",
+                       "ambassadorId": "amb1",
+                       "createdAt": (NOW - timedelta(days=5)).replace(tzinfo=timezone.utc)}),
+        FakeDoc("i3", {"status": "não aprovado", "segment": "varejo",
+                       "ambassadorId": "amb2", "createdAt": NOW - timedelta(days=100)}),
+        FakeDoc("i4", {"ambassadorId": "amb2"}),
+    ]
+
+
+def make_commissions():
+    return [
+        FakeDoc("c1", {"value": 500, "createdAt": NOW - timedelta(days=1)}),
+        FakeDoc("c2", {"value": 300, "createdAt": NOW - timedelta(days=40)}),
+        FakeDoc("c3", {"value": 100}),
+    ]
+
+
+class TestAdminDashboardAggregation:
+    """Testes para build_admin_dashboard"""
+
+    def setup_method(self):
+        self.result = build_admin_dashboard(make_users(), make_indications(), make_commissions(), now=NOW)
+
+    def test_basic_counts(self):
+        stats = self.result["stats"]
+        assert stats["totalUsers"] == 4
+        assert stats["totalIndications"] == 4
+        assert stats["totalCommissions"] == 3
+        assert stats["monthlyCommissions"] == 500
+
+    def test_status_counts_and_approval_rate(self):
+        stats = self.result["stats"]
+        assert stats["approvedIndications"] == 1
+        assert stats["rejectedIndications"] == 1
+        assert stats["pendingIndications"] == 2
+        assert stats["approvalRate"] == round(1 / 3 * 100, 2)
+
+    def test_monthly_series_are_oldest_first(self):
+        monthly = self.result["charts"]["indicationsMonthly"]
+        assert len(monthly) == 6
+        assert monthly[-1] == {"month": "Jul", "count": 2, "approved": 1}
+
+        sales = self.result["charts"]["salesMonthly"]
+        assert sales[-1] == {"month": "Jul", "value": 500}
+        assert sales[-2] == {"month": "Jun", "value": 300}
+
+    def test_origins_and_segments(self):
+        origins = {item["name"]: item["value"] for item in self.result["charts"]["leadsOrigin"]}
+        assert origins == {"instagram": 2, "website": 2}
+
+        segments = {item["segment"]: item for item in self.result["charts"]["conversionBySegment"]}
+        assert segments["saude"]["total"] == 2
+        assert segments["saude"]["converted"] == 1
+        assert segments["saude"]["rate"] == 50
+        assert segments["geral"]["total"] == 1
+
+    def test_top_and_active_ambassadors(self):
+        top = self.result["charts"]["topAmbassadors"]
+        assert top == [{"name": "Ana", "indications": 2}, {"name": "Bia", "indications": 2}]
+
+        stats = self.result["stats"]
+        assert stats["activeAmbassadors"] == 1
+        assert stats["activePercentage"] == round(1 / 3 * 100, 2)
+
+    def test_empty_collections(self):
+        result = build_admin_dashboard([], [], [], now=NOW)
+        assert result["stats"]["totalUsers"] == 0
+        assert result["stats"]["approvalRate"] == 0
+        assert result["charts"]["topAmbassadors"] == []
+
+
+class TestAmbassadorDashboardAggregation:
+    """Testes para build_ambassador_dashboard"""
+
+    def setup_method(self):
+        indications = [doc for doc in make_indications() if doc.to_dict().get("ambassadorId") == "amb1"]
+        commissions = make_commissions()[:2]
+        self.result = build_ambassador_dashboard(indications, commissions, now=NOW)
+
+    def test_stats(self):
+        stats = self.result["stats"]
+        assert stats["total_indications"] == 2
+        assert stats["approved_sales"] == 1
+        assert stats["pending_indications"] == 1
+        assert stats["conversion_rate"] == 50
+        assert stats["current_month_commission"] == 500
+        assert stats["total_commissions"] == 800
+
+    def test_monthly_series_are_newest_first(self):
+        assert len(self.result["monthly_indications"]) == 12
+        assert self.result["monthly_indications"][0] == {"month": "Jul/2025", "count": 2}
+        assert self.result["monthly_commissions"][1] == {"month": "Jun/2025", "total": 300}
+        assert len(self.result["monthly_performance"]) == 5
+        assert self.result["monthly_performance"][0]["total_indications"] == 2
+
+
+def project(docs, fields):
+    """Simula select(): mantém apenas os campos projetados"""
+    return [FakeDoc(doc.id, {k: v for k, v in doc.to_dict().items() if k in fields}) for doc in docs]
+
+
+class TestProjectedFields:
+    """Os campos projetados devem bastar para calcular os mesmos dashboards"""
+
+    def with_extra_fields(self, docs):
+        return [FakeDoc(doc.id, {**doc.to_dict(), "email": "x@y.com", "phone": "119", "notes": "..."})
+                for doc in docs]
+
+    def test_admin_dashboard_from_projection(self):
+        users, indications, commissions = (self.with_extra_fields(make_users()),
+                                           self.with_extra_fields(make_indications()),
+                                           self.with_extra_fields(make_commissions()))
+        full = build_admin_dashboard(users, indications, commissions, now=NOW)
+        projected = build_admin_dashboard(project(users, ADMIN_USER_FIELDS),
+                                          project(indications, ADMIN_INDICATION_FIELDS),
+                                          project(commissions, ADMIN_COMMISSION_FIELDS), now=NOW)
+        assert projected == full
+
+    def test_ambassador_dashboard_from_projection(self):
+        indications = self.with_extra_fields(make_indications())
+        commissions = self.with_extra_fields(make_commissions())
+        full = build_ambassador_dashboard(indications, commissions, now=NOW)
+        projected = build_ambassador_dashboard(project(indications, AMBASSADOR_INDICATION_FIELDS),
+                                               project(commissions, AMBASSADOR_COMMISSION_FIELDS), now=NOW)
+        assert projected == full
@@ -0,0 +1,266 @@
+"""
+Testes para os contadores pré-agregados dos dashboards
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from services.dashboard_aggregation import (
+    AdminDashboardAggregator, AmbassadorDashboardAggregator, build_admin_dashboard, build_ambassador_dashboard
+)
+from services.dashboard_counters import (
+    ROLLUPS_COLLECTION, CounterDeltas, DashboardCounters, commission_deltas, commission_update_deltas, diff, indication_deltas, installment_deltas, user_deltas, _prune,
+    is_rollup_doc,
+    COMMISSION_FIELDS, INDICATION_FIELDS, USER_FIELDS
+)
+from tests.test_dashboard_aggregation import NOW, FakeDoc, make_commissions, make_indications, make_users, project
+
+
+def accumulate(users, indications, commissions):
+    """Soma as contribuições como se cada documento tivesse sido criado pelas rotas"""
+    totals = CounterDeltas()
+    for doc in users:
+        totals.merge(user_deltas(doc.to_dict()))
+    for doc in indications:
+        totals.merge(indication_deltas(doc.to_dict()))
+    for doc in commissions:
+        totals.merge(commission_deltas(doc.to_dict()))
+    return {doc_id: _prune(fields) for doc_id, fields in totals.fields.items()}
+
+
+class TestCounterDeltas:
+    """Testes para o cálculo das contribuições"""
+
+    def test_diff_of_status_change(self):
+        old = {"status": "agendado", "segment": "saude", "ambassadorId": "amb1", "createdAt": NOW}
+        new = dict(old, status="aprovado")
+
+        fields = {doc_id: _prune(f) for doc_id, f in diff(indication_deltas(old), indication_deltas(new)).fields.items()}
+
+        assert fields["global"] == {
+            "indications_by_status": {"pending": -1, "approved": 1},
+            "segments": {"saude": {"approved": 1}}
+        }
+        month_change = {
+            "indications_approved": 1,
+            "indications_by_status": {"pending": -1, "approved": 1},
+            "indications_by_segment": {"saude": {"approved": 1}}
+        }
+        assert fields["global:2025-07"] == month_change
+        assert fields["ambassador_amb1"] == {"indications_by_status": {"pending": -1, "approved": 1}}
+        assert fields["ambassador_amb1:2025-07"] == month_change
+
+    def test_projected_documents_give_same_counters(self):
+        users, indications, commissions = make_users(), make_indications(), make_commissions()
+        # Documento sem nenhum campo projetado continua sendo contado
+        indications.append(FakeDoc("i5", {"email": "x@y.com"}))
+        full = accumulate(users, indications, commissions)
+        projected = accumulate(project(users, USER_FIELDS), project(indications, INDICATION_FIELDS),
+                               project(commissions, COMMISSION_FIELDS))
+        assert projected == full
+
+    def test_status_only_commission_update_moves_rollup_bucket(self):
+        old = {"status": "pendente", "value": 500.0, "ambassadorId": "amb1", "createdAt": NOW}
+
+        fields = {doc_id: _prune(f) for doc_id, f in
+                  commission_update_deltas(old, {"status": "pago", "updatedAt": NOW}).fields.items()}
+
+        moved = {"commissions_by_status": {"pendente": {"count": -1, "value": -500.0},
+                                           "pago": {"count": 1, "value": 500.0}}}
+        assert fields["global:2025-07"] == moved
+        assert fields["ambassador_amb1:2025-07"] == moved
+        # Totais e valores gerais não mudam
+        assert fields["global"] == {} and fields["ambassador_amb1"] == {}
+
+    def test_delete_reverts_creation(self):
+        data = {"value": 300.0, "status": "pendente", "ambassador_id": "amb1"}
+        reverted = CounterDeltas().merge(installment_deltas(data)).merge(
+            diff(installment_deltas(data), installment_deltas(None)))
+        assert all(not _prune(fields) for fields in reverted.fields.values())
+
+
+class TestDashboardsFromCounters:
+    """Dashboards montados a partir dos contadores devem bater com a leitura completa"""
+
+    def setup_method(self):
+        users = make_users()
+        indications = make_indications()
+        commissions = [FakeDoc(doc.id, dict(doc.to_dict(), ambassadorId="amb1")) for doc in make_commissions()]
+        self.users, self.indications, self.commissions = users, indications, commissions
+        self.counters = accumulate(users, indications, commissions)
+
+    def ambassador_docs(self):
+        profiles = {doc.id: doc.to_dict() for doc in self.users}
+        last_indication = {"amb1": NOW - timedelta(days=2)}
+        docs = []
+        for doc_id, fields in self.counters.items():
+            if doc_id.startswith("ambassador_") and not is_rollup_doc(doc_id):
+                ambassador_id = doc_id[len("ambassador_"):]
+                profile = profiles[ambassador_id]
+                docs.append(dict(fields, ambassador_id=ambassador_id, name=profile["name"], role=profile["role"],
+                                 last_indication_at=last_indication.get(ambassador_id)))
+        return docs
+
+    def test_admin_dashboard_matches_scan(self):
+        months = {doc_id[len("global:"):]: fields for doc_id, fields in self.counters.items()
+                  if doc_id.startswith("global:")}
+        from_counters = AdminDashboardAggregator.from_counters(
+            self.counters["global"], months, self.ambassador_docs(), NOW).result()
+        scanned = build_admin_dashboard(self.users, self.indications, self.commissions, now=NOW)
+
+        assert from_counters == scanned
+
+    def test_ambassador_dashboard_matches_scan(self):
+        prefix = "ambassador_amb1:"
+        months = {doc_id[len(prefix):]: fields for doc_id, fields in self.counters.items()
+                  if doc_id.startswith(prefix)}
+        from_counters = AmbassadorDashboardAggregator.from_counters(
+            self.counters["ambassador_amb1"], months, NOW).result()
+        scanned = build_ambassador_dashboard(
+            [doc for doc in self.indications if doc.to_dict().get("ambassadorId") == "amb1"],
+            self.commissions, now=NOW)
+
+        assert from_counters == scanned
+
+
+class FakeRef:
+    def __init__(self, collection, doc_id):
+        self.collection, self.id = collection, doc_id
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id, self.data, self.exists = doc_id, data, data is not None
+
+    def to_dict(self):
+        return self.data
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeRef(self.name, doc_id)
+
+
+class FakeRollupDb:
+    """Guarda documentos por coleção e registra as chamadas a get_all"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def collection(self, name):
+        return FakeCollection(name)
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self.calls.append(refs)
+        return [FakeSnapshot(ref.id, self.docs.get((ref.collection, ref.id))) for ref in refs]
+
+
+class TestMonthlyRollups:
+    """Testes para os rollups mensais por calendário"""
+
+    def test_installment_is_bucketed_by_due_month(self):
+        deltas = installment_deltas({"value": 100.0, "status": "pago", "ambassador_id": "amb1",
+                                     "due_date": datetime(2025, 3, 31, 23, 0)})
+        for doc_id in ("global:2025-03", "ambassador_amb1:2025-03"):
+            assert deltas.fields[doc_id]["installments"]["pago"] == {"count": 1, "value": 100.0}
+            assert deltas.fields[doc_id]["installments_total"] == 1
+
+    def test_series_reads_rollups_in_one_call(self):
+        db = FakeRollupDb({
+            (ROLLUPS_COLLECTION, "ambassador_amb1:2025-06"): {"indications_total": 4, "commissions_value": 900.0},
+            (ROLLUPS_COLLECTION, "global:2025-07"): {"indications_total": 9},
+        })
+        series = DashboardCounters(db).get_monthly_rollups("amb1", months=3, now=datetime(2025, 7, 15))
+
+        assert [item["month"] for item in series] == ["2025-05", "2025-06", "2025-07"]
+        assert series[1]["indications_total"] == 4 and series[1]["commissions_value"] == 900.0
+        # Meses sem documento vêm zerados e o escopo global não vaza
+        assert series[0]["indications_total"] == 0 and series[2]["indications_total"] == 0
+        assert len(db.calls) == 1
+        assert {ref.collection for ref in db.calls[0]} == {ROLLUPS_COLLECTION}
+
+
+class FakeStreamCollection(FakeCollection):
+    def __init__(self, db, name):
+        super().__init__(name)
+        self.db = db
+
+    def select(self, fields):
+        return self
+
+    def stream(self, read_time=None):
+        self.db.read_times.append(read_time)
+        return iter([FakeSnapshot(doc_id, dict(data)) for doc_id, data in self.db.docs.get(self.name, {}).items()])
+
+
+class FakeMergeBatch:
+    """Aplica set(merge=True) com Increment direto nos documentos do banco falso"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def set(self, ref, data, merge=False):
+        target = self.db.docs.setdefault(ref.collection, {}).setdefault(ref.id, {})
+        self._merge(target, data)
+
+    def _merge(self, target, data):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                self._merge(target.setdefault(key, {}), value)
+            elif hasattr(value, "value") and type(value).__name__ == "Increment":
+                target[key] = target.get(key, 0) + value.value
+            else:
+                target[key] = value
+
+    def commit(self):
+        pass
+
+
+class FakeReconcileDb:
+    def __init__(self, docs):
+        self.docs = docs
+        self.read_times = []
+
+    def collection(self, name):
+        return FakeStreamCollection(self, name)
+
+    def batch(self):
+        return FakeMergeBatch(self)
+
+
+class TestReconcile:
+    """Reconciliação agendada corrige com incrementos, sem sobrescrever"""
+
+    def test_corrections_are_increments_read_at_one_instant(self):
+        indication = {"status": "aprovado", "segment": "saude", "origin": "website",
+                      "ambassadorId": "amb1", "createdAt": NOW}
+        expected = accumulate([], [FakeDoc("i1", indication)], [])
+        db = FakeReconcileDb({
+            "indications": {"i1": indication},
+            # Contador desatualizado; o nome não é campo de contador e fica como está
+            "stats": {"global": {"kind": "global", "indications_total": 5},
+                      "ambassador_amb1": {"kind": "ambassador", "ambassador_id": "amb1", "name": "Ana",
+                                          "indications_total": 1, "stale": 2}},
+        })
+        read_time = datetime(2025, 7, 15, 3, 30)
+
+        stats = DashboardCounters(db).reconcile(read_time=read_time)
+
+        assert set(db.read_times) == {read_time}
+        assert stats["indications"] == 1
+        stored = db.docs["stats"]
+        assert _prune({k: v for k, v in stored["global"].items() if k != "kind"}) == expected["global"]
+        assert stored["ambassador_amb1"]["name"] == "Ana"
+        assert stored["ambassador_amb1"]["stale"] == 0
+        assert db.docs[ROLLUPS_COLLECTION]["global:2025-07"]["indications_total"] == 1
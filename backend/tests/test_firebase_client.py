@@ -0,0 +1,59 @@
+"""
+Testes para o cliente Firestore compartilhado
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from google.auth.credentials import AnonymousCredentials
+
+from config import firebase
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(firebase, "_client", None)
+    monkeypatch.setattr(firebase, "load_credentials", lambda: (AnonymousCredentials(), "projeto-teste"))
+    yield
+    firebase._client = None
+
+
+class TestSharedClient:
+    """Um cliente por processo, com canal refeito após fork"""
+
+    def test_same_client_for_every_caller(self, fresh_client):
+        client = firebase.get_client()
+        assert client is firebase.get_client()
+        assert firebase.firebase_config.db is client
+
+    def test_reset_after_fork_keeps_client_and_drops_channel(self, fresh_client):
+        client = firebase.get_client()
+        api = client._firestore_api
+
+        firebase.reset_after_fork()
+
+        assert firebase.get_client() is client
+        assert client._firestore_api is not api
+
+    def test_channel_has_keepalive(self):
+        options = dict(firebase.channel_options())
+        assert options["grpc.keepalive_time_ms"] == 30000
+        assert options["grpc.keepalive_permit_without_calls"] == 1
+
+
+class TestCredentials:
+    """Credenciais lidas do ambiente sem arquivo temporário"""
+
+    def test_invalid_json_is_rejected(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", "{nao e json")
+        with pytest.raises(ValueError):
+            firebase.load_credentials()
+
+    def test_path_uses_library_default(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", "/secrets/firebase.json")
+        assert firebase.load_credentials() == (None, None)
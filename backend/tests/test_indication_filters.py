@@ -0,0 +1,79 @@
+"""
+Testes para os filtros e ordenação de GET /indications
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.indication_filters import apply_indication_filters, parse_indication_filters
+
+
+class FakeQuery:
+    """Registra as cláusulas where aplicadas"""
+
+    def __init__(self, clauses=()):
+        self.clauses = list(clauses)
+
+    def where(self, field_path, op_string, value):
+        return FakeQuery(self.clauses + [(field_path, op_string, value)])
+
+
+class TestParseIndicationFilters:
+    """Testes para parse_indication_filters"""
+
+    def test_defaults_keep_natural_order(self):
+        filters = parse_indication_filters({})
+        assert filters["equals"] == {}
+        assert filters["sort"] is None
+        assert filters["descending"] is True
+
+    def test_equality_filters(self):
+        filters = parse_indication_filters({"status": "aprovado", "segment": "saude", "converted": "true"})
+        assert filters["equals"] == {"status": "aprovado", "segment": "saude", "converted": True}
+
+    def test_date_range_forces_created_at_sort(self):
+        filters = parse_indication_filters({"from": "2025-01-01", "to": "2025-01-31"})
+        assert filters["sort"] == "createdAt"
+        assert filters["created_from"] == datetime(2025, 1, 1)
+        assert filters["created_to"] == datetime(2025, 1, 31, 23, 59, 59, 999999)
+
+    def test_mixed_timezone_bounds_are_compared_in_utc(self):
+        filters = parse_indication_filters({"from": "2025-01-01T00:00:00Z", "to": "2025-01-31"})
+        assert filters["created_from"] == datetime(2025, 1, 1)
+        assert filters["created_to"] == datetime(2025, 1, 31, 23, 59, 59, 999999)
+
+        filters = parse_indication_filters({"from": "2025-01-01T00:00:00-03:00"})
+        assert filters["created_from"] == datetime(2025, 1, 1, 3)
+
+        with pytest.raises(ValueError):
+            parse_indication_filters({"from": "2025-02-01T00:00:00+00:00", "to": "2025-01-31"})
+
+    def test_invalid_values(self):
+        for args in ({"status": "x"}, {"converted": "talvez"}, {"sort": "email"}, {"direction": "up"},
+                     {"from": "ontem"}, {"from": "2025-02-01", "to": "2025-01-01"},
+                     {"from": "2025-01-01", "sort": "client_name"}):
+            with pytest.raises(ValueError):
+                parse_indication_filters(args)
+
+
+class TestApplyIndicationFilters:
+    """Testes para apply_indication_filters"""
+
+    def test_ambassador_scope_overrides_filter(self):
+        filters = parse_indication_filters({"ambassadorId": "outra", "origin": "instagram", "sort": "client_name",
+                                            "direction": "asc"})
+        query, sort, descending = apply_indication_filters(FakeQuery(), filters, ambassador_id="amb1")
+        assert ("ambassadorId", "==", "amb1") in query.clauses
+        assert ("ambassadorId", "==", "outra") not in query.clauses
+        assert ("origin", "==", "instagram") in query.clauses
+        assert (sort, descending) == ("client_name", False)
+
+    def test_date_range_clauses(self):
+        filters = parse_indication_filters({"from": "2025-01-01T10:00:00"})
+        query, sort, _ = apply_indication_filters(FakeQuery(), filters)
+        assert query.clauses == [("createdAt", ">=", datetime(2025, 1, 1, 10, 0))]
+        assert sort == "createdAt"
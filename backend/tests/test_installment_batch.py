@@ -0,0 +1,211 @@
+"""
+Testes para a criação das parcelas em um único batch
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from models.commission_installments import CommissionInstallment
+
+
+class FakeRef:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+
+class FakeCollection:
+    def __init__(self, name, counter):
+        self.name = name
+        self.counter = counter
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            self.counter[0] += 1
+            doc_id = f"auto{self.counter[0]}"
+        return FakeRef(self.name, doc_id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.collection, ref.id, data))
+
+    def commit(self):
+        self.db.commits.append(self.writes)
+
+
+class FakeDB:
+    def __init__(self):
+        self.counter = [0]
+        self.commits = []
+
+    def collection(self, name):
+        return FakeCollection(name, self.counter)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+class FakeSnapshot:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+        self.reference = FakeRef("commission_installments", doc_id)
+
+    def to_dict(self):
+        return dict(self.store[self.id])
+
+
+class FakeOverdueQuery:
+    """Simula status == pendente AND due_date < agora, ordenado por vencimento"""
+
+    def __init__(self, store, size=None):
+        self.store = store
+        self.size = size
+
+    def where(self, field_path, op_string, value):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, size):
+        return FakeOverdueQuery(self.store, size)
+
+    def stream(self):
+        now = datetime.now()
+        ids = sorted((doc_id for doc_id, data in self.store.items()
+                      if data["status"] == "pendente" and data["due_date"] < now),
+                     key=lambda doc_id: self.store[doc_id]["due_date"])
+        return [FakeSnapshot(self.store, doc_id) for doc_id in ids[:self.size]]
+
+
+class FakeSweepBatch:
+    def __init__(self, db):
+        self.db = db
+        self.updates = []
+        self.counter_writes = 0
+
+    def update(self, ref, data):
+        self.updates.append((ref.id, data))
+
+    def set(self, ref, data, merge=False):
+        self.counter_writes += 1
+
+    def commit(self):
+        for doc_id, data in self.updates:
+            self.db.store[doc_id].update(data)
+        self.db.commits.append(len(self.updates) + self.counter_writes)
+
+
+class FakeSweepDB:
+    def __init__(self, store):
+        self.store = store
+        self.commits = []
+
+    def collection(self, name):
+        return FakeOverdueQuery(self.store)
+
+    def batch(self):
+        return FakeSweepBatch(self)
+
+
+class FakeCounters:
+    def __init__(self):
+        self.applied = []
+
+    def apply(self, batch, deltas):
+        self.applied.append(deltas)
+
+
+class WritingCounters:
+    """Grava um documento por contador tocado, como DashboardCounters.apply"""
+
+    def apply(self, batch, deltas):
+        for doc_id in deltas.fields:
+            batch.set(FakeRef("stats", doc_id), {}, merge=True)
+
+
+class TestInstallmentBatch:
+    """Testes para a gravação atômica das parcelas"""
+
+    def test_three_installments_in_one_commit(self):
+        db = FakeDB()
+        model = CommissionInstallment(db)
+
+        ids = model.create_installments_for_indication("ind1", "amb1", "Ana", "Cliente")
+
+        assert ids == ["auto1", "auto2", "auto3"]
+        assert len(db.commits) == 1
+        writes = db.commits[0]
+        assert [w[2]["installment_number"] for w in writes] == [1, 2, 3]
+        assert all(w[0] == "commission_installments" and w[2]["indication_id"] == "ind1" for w in writes)
+
+    def test_installments_join_caller_batch(self):
+        db = FakeDB()
+        counters = FakeCounters()
+        model = CommissionInstallment(db, counters=counters)
+        batch = db.batch()
+        batch.set(db.collection("indications").document("ind1"), {"status": "agendado"})
+
+        model.add_installments_to_batch(batch, "ind1", "amb1", "Ana", "Cliente")
+
+        # Nada é gravado até o commit de quem chamou
+        assert db.commits == []
+        assert len(batch.writes) == 4
+        # Deltas das 3 parcelas somados em uma só aplicação
+        assert len(counters.applied) == 1
+        batch.commit()
+        assert len(db.commits) == 1
+
+
+class TestOverdueSweep:
+    """Testes para a varredura de parcelas em atraso"""
+
+    def make_store(self, overdue, future=2):
+        now = datetime.now()
+        store = {f"late{i}": {"status": "pendente", "value": 300.0, "ambassador_id": f"amb{i % 3}",
+                              "due_date": now - timedelta(days=i + 1)} for i in range(overdue)}
+        store.update({f"next{i}": {"status": "pendente", "value": 300.0, "ambassador_id": "amb0",
+                                   "due_date": now + timedelta(days=i + 1)} for i in range(future)})
+        store["paid"] = {"status": "pago", "value": 300.0, "due_date": now - timedelta(days=5)}
+        return store
+
+    def test_marks_only_past_due_pending(self):
+        store = self.make_store(overdue=7)
+        db = FakeSweepDB(store)
+
+        progress = CommissionInstallment(db, counters=FakeCounters()).check_overdue_installments(page_size=3)
+
+        assert progress == {"updated": 7, "batches": 3, "done": True}
+        assert sum(1 for data in store.values() if data["status"] == "atrasado") == 7
+        assert store["next0"]["status"] == "pendente"
+        assert store["paid"]["status"] == "pago"
+
+    def test_batches_stay_under_write_limit(self):
+        store = self.make_store(overdue=1200, future=0)
+        db = FakeSweepDB(store)
+
+        progress = CommissionInstallment(db, counters=WritingCounters()).check_overdue_installments(page_size=1000)
+
+        assert progress["updated"] == 1200 and progress["done"]
+        # Atualizações + documentos de contador (geral, embaixadoras e rollups mensais)
+        assert all(writes <= 500 for writes in db.commits)
+
+    def test_resumes_after_time_budget(self):
+        store = self.make_store(overdue=5)
+        model = CommissionInstallment(FakeSweepDB(store))
+
+        assert model.check_overdue_installments(time_budget=0) == {"updated": 0, "batches": 0, "done": False}
+        assert model.check_overdue_installments()["updated"] == 5
+        assert model.check_overdue_installments() == {"updated": 0, "batches": 0, "done": True}
@@ -0,0 +1,45 @@
+"""
+Testes para o codificador JSON das respostas
+"""
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from flask import Flask, jsonify
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import GeoPoint
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_provider import FirestoreJSONProvider, dumps
+
+
+class TestJsonProvider:
+    """Testes para dumps e FirestoreJSONProvider"""
+
+    def test_firestore_types_in_single_pass(self):
+        data = {
+            "createdAt": datetime(2025, 7, 15, 12, 0, 0),
+            "updatedAt": DatetimeWithNanoseconds(2025, 7, 15, 12, 0, 0, 123456, tzinfo=timezone.utc),
+            "location": GeoPoint(-23.5, -46.6),
+            "nested": [{"due_date": datetime(2025, 8, 1)}],
+        }
+        assert json.loads(dumps(data)) == {
+            "createdAt": "2025-07-15T12:00:00",
+            "updatedAt": "2025-07-15T12:00:00.123456+00:00",
+            "location": {"latitude": -23.5, "longitude": -46.6},
+            "nested": [{"due_date": "2025-08-01T00:00:00"}],
+        }
+
+    def test_keys_are_sorted_for_stable_etags(self):
+        assert dumps({"b": 1, "a": 2}) == dumps({"a": 2, "b": 1})
+        assert dumps({"b": 1, "a": 2}).index('"a"') < dumps({"b": 1, "a": 2}).index('"b"')
+
+    def test_flask_jsonify_uses_provider(self):
+        app = Flask(__name__)
+        app.json = FirestoreJSONProvider(app)
+        with app.app_context():
+            response = jsonify({"when": datetime(2025, 1, 2, 3, 4, 5), "name": "Ana"})
+        assert response.mimetype == "application/json"
+        assert json.loads(response.get_data()) == {"name": "Ana", "when": "2025-01-02T03:04:05"}
@@ -0,0 +1,78 @@
+"""
+Testes para a verificação única do JWT por requisição
+"""
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, view_decorators
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.jwt_context import current_identity, init_jwt_context, jwt_required
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    calls = []
+    original = view_decorators.decode_token
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(view_decorators, "decode_token", counting_decode)
+    return calls
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "segredo-de-teste-com-pelo-menos-32-bytes"
+    JWTManager(app)
+    init_jwt_context(app)
+
+    @app.route("/protegida")
+    @jwt_required()
+    def protected():
+        # Rate limiting e auditoria consultam a mesma identidade
+        return {"identity": get_jwt_identity(), "context": current_identity()}
+
+    @app.route("/publica")
+    def public():
+        return {"identity": current_identity()}
+
+    return app
+
+
+def auth_header(app, **kwargs):
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='user-1', **kwargs)}"}
+
+
+class TestJwtContext:
+    """Token decodificado no before_request e reaproveitado"""
+
+    def test_valid_token_is_decoded_once(self, app, decode_calls):
+        response = app.test_client().get("/protegida", headers=auth_header(app))
+
+        assert response.status_code == 200
+        assert response.get_json() == {"identity": "user-1", "context": "user-1"}
+        assert len(decode_calls) == 1
+
+    def test_missing_token_keeps_library_error(self, app):
+        response = app.test_client().get("/protegida")
+
+        assert response.status_code == 401
+        assert response.get_json() == {"msg": "Missing Authorization Header"}
+
+    def test_expired_token_only_fails_on_protected_routes(self, app):
+        headers = auth_header(app, expires_delta=timedelta(seconds=-1))
+        client = app.test_client()
+
+        assert client.get("/publica", headers=headers).get_json() == {"identity": None}
+        response = client.get("/protegida", headers=headers)
+        assert response.status_code == 401
+        assert response.get_json() == {"msg": "Token has expired"}
@@ -0,0 +1,150 @@
+"""
+Testes para as métricas por requisição (Server-Timing e /metrics)
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask, Response
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import metrics
+from utils.metrics import Histogram, InstrumentedFirestoreAPI, MetricsRegistry, init_metrics, record_firestore
+
+
+class FakeGapicAPI:
+    """Respostas do cliente GAPIC para leituras em lote, consultas e commit"""
+
+    def __init__(self, batch_responses=(), query_responses=()):
+        self.batch_responses = list(batch_responses)
+        self.query_responses = list(query_responses)
+        self._transport = "transport"
+
+    def batch_get_documents(self, request=None, metadata=None):
+        return iter(self.batch_responses)
+
+    def run_query(self, request=None, metadata=None):
+        return iter(self.query_responses)
+
+    def commit(self, request=None, metadata=None):
+        return {"write_results": request["writes"]}
+
+
+@pytest.fixture
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", MetricsRegistry())
+    return metrics.registry
+
+
+def make_app(registry, token="token-de-teste"):
+    app = Flask(__name__)
+    init_metrics(app, registry, token=token)
+
+    @app.route("/indications/<indication_id>")
+    def indication(indication_id):
+        record_firestore(reads=3, query="query", seconds=0.002)
+        return {"id": indication_id}
+
+    @app.route("/export")
+    def export():
+        def rows():
+            record_firestore(reads=2, query="query")
+            yield b'{"a": 1}\n'
+            yield b'{"b": 2}\n'
+        return Response(rows(), mimetype="application/x-ndjson")
+
+    return app
+
+
+class TestMiddleware:
+    """Testes para o cabeçalho Server-Timing e os histogramas por rota"""
+
+    def test_server_timing_and_histograms(self, fresh_registry):
+        client = make_app(fresh_registry).test_client()
+        response = client.get("/indications/abc")
+        # Histogramas são gravados ao fechar a resposta (o servidor WSGI chama close)
+        response.close()
+
+        assert response.status_code == 200
+        timing = response.headers["Server-Timing"]
+        assert timing.startswith("app;dur=")
+        assert '3 leituras, 0 escritas, 1 consultas' in timing
+
+        labels = {"method": "GET", "endpoint": "/indications/<indication_id>"}
+        assert fresh_registry.request_reads.snapshot(**labels) == {"count": 1, "sum": 3}
+        assert fresh_registry.response_size.snapshot(**labels)["sum"] == len(response.data)
+        assert fresh_registry.reads.value() == 3
+
+    def test_streamed_response_is_recorded_on_close(self, fresh_registry):
+        client = make_app(fresh_registry).test_client()
+        response = client.get("/export")
+        body = response.get_data()
+        response.close()
+
+        labels = {"method": "GET", "endpoint": "/export"}
+        assert fresh_registry.request_reads.snapshot(**labels)["sum"] == 2
+        assert fresh_registry.response_size.snapshot(**labels)["sum"] == len(body)
+
+    def test_metrics_endpoint_renders_prometheus_text(self, fresh_registry):
+        client = make_app(fresh_registry).test_client()
+        client.get("/indications/abc").close()
+        text = client.get("/metrics", headers={"Authorization": "Bearer token-de-teste"}).get_data(as_text=True)
+
+        assert "# TYPE http_request_duration_seconds histogram" in text
+        assert ('firestore_reads_per_request_bucket{method="GET",endpoint="/indications/<indication_id>",le="5"} 1'
+                in text)
+        assert "firestore_reads_total 3" in text
+
+    def test_metrics_endpoint_requires_token(self, fresh_registry):
+        client = make_app(fresh_registry).test_client()
+
+        assert client.get("/metrics").status_code == 403
+        assert client.get("/metrics", headers={"Authorization": "Bearer outro"}).status_code == 403
+
+    def test_metrics_endpoint_not_registered_without_token(self, fresh_registry, monkeypatch):
+        monkeypatch.delenv("METRICS_TOKEN", raising=False)
+        client = make_app(fresh_registry, token=None).test_client()
+
+        assert client.get("/metrics").status_code == 404
+        # A medição das requisições continua ativa
+        assert "Server-Timing" in client.get("/indications/abc").headers
+
+
+class TestHistogram:
+    """Formato texto do Prometheus"""
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram("leituras", "teste", (1, 5))
+        for value in (0, 3, 4, 10):
+            histogram.observe(value)
+
+        lines = histogram.render()
+        assert 'leituras_bucket{le="1"} 1' in lines
+        assert 'leituras_bucket{le="5"} 3' in lines
+        assert 'leituras_bucket{le="+Inf"} 4' in lines
+        assert "leituras_count 4" in lines
+
+
+class TestInstrumentedFirestoreAPI:
+    """Contagem feita na camada GAPIC do cliente"""
+
+    def test_counts_found_documents_queries_and_writes(self, fresh_registry):
+        types = pytest.importorskip("google.cloud.firestore_v1.types")
+        name = "projects/p/databases/(default)/documents/users/{}"
+        api = InstrumentedFirestoreAPI(FakeGapicAPI(
+            batch_responses=[types.BatchGetDocumentsResponse(found=types.Document(name=name.format("a"))),
+                             types.BatchGetDocumentsResponse(missing=name.format("b"))],
+            query_responses=[types.RunQueryResponse(document=types.Document(name=name.format("c"))),
+                             types.RunQueryResponse()],
+        ))
+
+        assert len(list(api.batch_get_documents(request={}))) == 2
+        assert len(list(api.run_query(request={}))) == 2
+        api.commit(request={"writes": ["w1", "w2", "w3"]})
+
+        assert fresh_registry.reads.value() == 2
+        assert fresh_registry.queries.value(kind="query") == 1
+        assert fresh_registry.writes.value() == 3
+        # Demais atributos passam direto para o cliente original
+        assert api._transport == "transport"
@@ -0,0 +1,261 @@
+"""
+Testes para o outbox de efeitos colaterais
+"""
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from services.outbox import LEASE_SECONDS, MAX_ATTEMPTS, InMemoryOutboxStore, Outbox, retry_delay
+
+
+def make_outbox(handler, max_workers=0):
+    outbox = Outbox(InMemoryOutboxStore(), max_workers=max_workers)
+    outbox.register("sync_commission", handler)
+    return outbox
+
+
+class TestOutbox:
+    """Testes para entrega imediata, repetição e desistência"""
+
+    def test_dispatched_entry_runs_and_is_removed(self):
+        calls = []
+        outbox = make_outbox(calls.append)
+
+        entry = outbox.enqueue(None, "sync_commission", {"indication_id": "ind1"})
+        assert entry["id"] in outbox.store.entries
+        outbox.dispatch(entry)
+
+        assert calls == [{"indication_id": "ind1"}]
+        assert outbox.store.entries == {}
+
+    def test_worker_pool_runs_off_the_caller_thread(self):
+        threads = []
+        outbox = make_outbox(lambda payload: threads.append(threading.current_thread().name), max_workers=2)
+        outbox.dispatch(outbox.enqueue(None, "sync_commission", {}))
+        outbox.shutdown(wait=True)
+
+        assert threads and threads[0].startswith("outbox")
+        assert outbox.metrics["succeeded"] == 1
+
+    def test_failure_is_retried_by_drain(self):
+        attempts = []
+
+        def flaky(payload):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("firestore indisponível")
+
+        outbox = make_outbox(flaky)
+        entry = outbox.enqueue(None, "sync_commission", {})
+        outbox.dispatch(entry)
+
+        stored = outbox.store.entries[entry["id"]]
+        assert stored["attempts"] == 1 and stored["last_error"] == "firestore indisponível"
+        # Ainda dentro do backoff: nada a fazer
+        assert outbox.drain(now=datetime.now())["processed"] == 0
+
+        result = outbox.drain(now=datetime.now() + retry_delay(1) + timedelta(seconds=1))
+        assert result == {"processed": 1, "succeeded": 1, "failed": 0, "skipped": 0}
+        assert outbox.store.entries == {}
+
+    def test_entry_not_dispatched_is_picked_up_after_lease_window(self):
+        calls = []
+        outbox = make_outbox(calls.append)
+        outbox.enqueue(None, "sync_commission", {"indication_id": "ind1"})
+
+        assert outbox.drain(now=datetime.now())["processed"] == 0
+        outbox.drain(now=datetime.now() + timedelta(seconds=LEASE_SECONDS + 1))
+        assert calls == [{"indication_id": "ind1"}]
+
+    def test_entry_claimed_by_drain_is_not_run_again_by_pool(self):
+        calls = []
+        outbox = make_outbox(calls.append)
+        entry = outbox.enqueue(None, "sync_commission", {"indication_id": "ind1"})
+        later = datetime.now() + timedelta(seconds=LEASE_SECONDS + 1)
+
+        # Handler lento: drain reivindica a entrada que ainda esperava na fila do pool
+        claimed = outbox.store.claim(entry["id"], later, later + timedelta(seconds=LEASE_SECONDS))
+        assert claimed["status"] == "running" and claimed["attempts"] == 1
+
+        outbox.dispatch(entry)
+        assert outbox.metrics["skipped"] == 1
+        # Concessão de drain ainda válida: a entrada não aparece como vencida
+        assert outbox.drain(now=later)["processed"] == 0
+        assert calls == []
+
+    def test_expired_lease_is_reclaimed_by_drain(self):
+        calls = []
+        outbox = make_outbox(calls.append)
+        entry = outbox.enqueue(None, "sync_commission", {"indication_id": "ind1"})
+        now = datetime.now()
+        # Processo morreu durante a execução: entrada fica "running" até a concessão vencer
+        outbox.store.claim(entry["id"], now, now + timedelta(seconds=LEASE_SECONDS))
+
+        assert outbox.drain(now=now + timedelta(seconds=LEASE_SECONDS - 1))["processed"] == 0
+        result = outbox.drain(now=now + timedelta(seconds=LEASE_SECONDS + 1))
+        assert result == {"processed": 1, "succeeded": 1, "failed": 0, "skipped": 0}
+        assert calls == [{"indication_id": "ind1"}]
+
+    def test_gives_up_after_max_attempts(self):
+        def failing(payload):
+            raise RuntimeError("erro permanente")
+
+        outbox = make_outbox(failing)
+        entry = outbox.enqueue(None, "sync_commission", {})
+        outbox.dispatch(entry)
+        for _ in range(MAX_ATTEMPTS):
+            outbox.drain(now=datetime.now() + timedelta(days=1))
+
+        stored = outbox.store.entries[entry["id"]]
+        assert stored["status"] == "failed"
+        assert stored["attempts"] == MAX_ATTEMPTS
+        assert outbox.metrics["failed"] == 1
+
+    def test_unknown_task_is_rejected(self):
+        outbox = make_outbox(lambda payload: None)
+        with pytest.raises(ValueError):
+            outbox.enqueue(None, "send_email", {})
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeRef:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+
+class FakeQuery:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def stream(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id=None):
+        return FakeRef(self.name, doc_id or "novo")
+
+    def where(self, field_path, op_string, value):
+        docs = self.db.docs.get(self.name, {})
+        return FakeQuery([FakeSnapshot(doc_id, data) for doc_id, data in docs.items()
+                          if data.get(field_path) == value])
+
+
+class FakeBatch:
+    def __init__(self, fail_with=None):
+        self.operations = []
+        self.committed = False
+        self.fail_with = fail_with
+
+    def create(self, ref, data):
+        self.operations.append(("create", ref.id, data))
+
+    def update(self, ref, data):
+        self.operations.append(("update", ref.id, data))
+
+    def set(self, ref, data, merge=False):
+        self.operations.append(("set", ref.id, data))
+
+    def delete(self, ref):
+        self.operations.append(("delete", ref.id))
+
+    def commit(self):
+        if self.fail_with:
+            raise self.fail_with
+        self.committed = True
+
+
+class FakeSyncDb:
+    """Coleções em memória com as chamadas usadas por sync_indication_commission"""
+
+    def __init__(self, docs, fail_with=None):
+        self.docs = docs
+        self.batches = []
+        self.fail_with = fail_with
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def get_all(self, refs, field_paths=None):
+        return [FakeSnapshot(ref.id, self.docs.get(ref.collection, {}).get(ref.id)) for ref in refs]
+
+    def batch(self):
+        self.batches.append(FakeBatch(self.fail_with))
+        return self.batches[-1]
+
+
+class FakeCounters:
+    def __init__(self):
+        self.applied = []
+
+    def apply(self, batch, deltas):
+        self.applied.append(deltas)
+
+
+class TestCommissionSync:
+    """Sincronização idempotente: uma comissão por indicação, sem reabrir as já pagas"""
+
+    def test_approval_creates_commission_keyed_by_indication(self):
+        from services.commission_sync import sync_indication_commission
+
+        db = FakeSyncDb({
+            "indications": {"ind1": {"status": "aprovado", "ambassadorId": "amb-sync", "client_name": "Ana"}},
+        })
+        counters = FakeCounters()
+
+        action = sync_indication_commission(db, counters, {"indication_id": "ind1", "status": "aprovado"})
+
+        assert action == "created"
+        operation, doc_id, data = db.batches[-1].operations[0]
+        assert (operation, doc_id, data["status"]) == ("create", "ind1", "pendente")
+        assert counters.applied
+
+    def test_concurrent_creation_is_skipped(self):
+        from google.api_core.exceptions import AlreadyExists
+        from services.commission_sync import sync_indication_commission
+
+        # Outra execução criou a comissão depois da consulta: o commit falha inteiro
+        db = FakeSyncDb({
+            "indications": {"ind1": {"status": "aprovado", "ambassadorId": "amb-sync"}},
+        }, fail_with=AlreadyExists("commissions/ind1"))
+
+        action = sync_indication_commission(db, FakeCounters(), {"indication_id": "ind1", "status": "aprovado"})
+
+        assert action == "skipped"
+        assert not db.batches[-1].committed
+
+    def test_reapproval_keeps_paid_commission(self):
+        from services.commission_sync import sync_indication_commission
+
+        db = FakeSyncDb({
+            "indications": {"ind1": {"status": "aprovado", "ambassadorId": "amb-sync", "client_name": "Ana"}},
+            "commissions": {"com1": {"indicationId": "ind1", "status": "pago", "value": 500.0,
+                                     "ambassadorId": "amb-sync", "createdAt": datetime(2025, 7, 10)}},
+        })
+        counters = FakeCounters()
+
+        action = sync_indication_commission(db, counters, {"indication_id": "ind1", "status": "aprovado"})
+
+        assert action == "skipped"
+        assert not any(batch.committed for batch in db.batches) and counters.applied == []
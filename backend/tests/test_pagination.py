@@ -0,0 +1,126 @@
+"""
+Testes para a paginação por cursor
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from services.pagination import InvalidCursorError, fetch_page, iter_pages, parse_page_args
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    """Consulta em memória com order_by/start_after/limit como no Firestore"""
+
+    def __init__(self, docs, order=None, after=None, size=None):
+        self.docs, self.order, self.after, self.size = docs, order, after, size
+
+    def order_by(self, field, direction="ASCENDING"):
+        return FakeQuery(self.docs, (field, direction == "DESCENDING"), self.after, self.size)
+
+    def start_after(self, cursor):
+        return FakeQuery(self.docs, self.order, cursor, self.size)
+
+    def limit(self, size):
+        return FakeQuery(self.docs, self.order, self.after, size)
+
+    def _key(self, doc_id, data):
+        field, _ = self.order
+        return (doc_id,) if field == "__name__" else (data[field], doc_id)
+
+    def stream(self):
+        descending = self.order[1]
+        rows = sorted(self.docs.items(), key=lambda item: self._key(*item), reverse=descending)
+        if self.after is not None:
+            if isinstance(self.after, dict):
+                after_key = (self.after["__name__"].id,)
+            else:
+                after_key = self._key(self.after.id, self.after.to_dict())
+            rows = [row for row in rows
+                    if (self._key(*row) < after_key if descending else self._key(*row) > after_key)]
+        return [FakeSnapshot(doc_id, data) for doc_id, data in rows[:self.size]]
+
+
+class FakeRef:
+    def __init__(self, docs, doc_id):
+        self.docs, self.id = docs, doc_id
+
+    def get(self):
+        return FakeSnapshot(self.id, self.docs.get(self.id))
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeRef(self.docs, doc_id)
+
+
+def make_collection(count=5):
+    return FakeCollection({f"d{i}": {"rank": count - i} for i in range(count)})
+
+
+class TestParsePageArgs:
+    """Testes para parse_page_args"""
+
+    def test_without_limit(self):
+        assert parse_page_args({}) == (None, None)
+
+    def test_with_limit_and_cursor(self):
+        assert parse_page_args({"limit": "10", "cursor": "abc"}) == (10, "abc")
+
+    def test_limit_is_capped(self):
+        assert parse_page_args({"limit": "100000"})[0] == 500
+
+    def test_invalid_limit(self):
+        with pytest.raises(ValueError):
+            parse_page_args({"limit": "abc"})
+        with pytest.raises(ValueError):
+            parse_page_args({"limit": "0"})
+
+
+class TestFetchPage:
+    """Testes para fetch_page e iter_pages"""
+
+    def test_pages_by_document_id(self):
+        collection = make_collection()
+        docs, cursor = fetch_page(collection, limit=2)
+        assert [doc.id for doc in docs] == ["d0", "d1"]
+        assert cursor == "d1"
+
+        docs, cursor = fetch_page(collection, limit=2, cursor=cursor)
+        assert [doc.id for doc in docs] == ["d2", "d3"]
+
+        docs, cursor = fetch_page(collection, limit=2, cursor=cursor)
+        assert [doc.id for doc in docs] == ["d4"]
+        assert cursor is None
+
+    def test_pages_by_field(self):
+        collection = make_collection()
+        docs, cursor = fetch_page(collection, limit=3, order_by="rank")
+        assert [doc.id for doc in docs] == ["d4", "d3", "d2"]
+
+        docs, cursor = fetch_page(collection, limit=3, cursor=cursor, order_by="rank")
+        assert [doc.id for doc in docs] == ["d1", "d0"]
+        assert cursor is None
+
+    def test_unknown_cursor_with_field_order(self):
+        collection = make_collection()
+        with pytest.raises(InvalidCursorError):
+            fetch_page(collection, limit=2, cursor="missing", order_by="rank")
+
+    def test_iter_pages(self):
+        pages = list(iter_pages(make_collection(), page_size=2))
+        assert [[doc.id for doc in page] for page in pages] == [["d0", "d1"], ["d2", "d3"], ["d4"]]
@@ -0,0 +1,107 @@
+"""
+Testes para o rate limiting: janela deslizante no Redis (script Lua) e token bucket em memória
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit_store import RedisSlidingWindowStore, TokenBucketStore
+
+
+@pytest.fixture
+def store():
+    fakeredis = pytest.importorskip("fakeredis")
+    # O script Lua roda no fakeredis com o pacote lupa
+    pytest.importorskip("lupa")
+    return RedisSlidingWindowStore(fakeredis.FakeRedis())
+
+
+class TestSlidingWindow:
+    """Janela deslizante do script Lua (fakeredis)"""
+
+    def test_blocks_after_limit_and_reports_retry(self, store):
+        rules = [("rate_limit:{ip:1}:login:60", 3, 60)]
+        results = [store.hit(rules, now=1000 + i) for i in range(3)]
+        assert [allowed for allowed, _ in results] == [True, True, True]
+        assert results[-1][1][0]["remaining"] == 0
+
+        allowed, infos = store.hit(rules, now=1010)
+        assert not allowed
+        # A primeira requisição (t=1000) sai da janela em t=1060
+        assert infos[0]["retry_after"] == 50
+        assert infos[0]["reset_time"] == 1060
+
+    def test_window_slides(self, store):
+        rules = [("rate_limit:{ip:1}:login:60", 2, 60)]
+        store.hit(rules, now=1000)
+        store.hit(rules, now=1030)
+        assert not store.hit(rules, now=1059)[0]
+        # Em t=1061 só a requisição de t=1030 continua na janela
+        allowed, infos = store.hit(rules, now=1061)
+        assert allowed
+        assert infos[0]["remaining"] == 0
+
+    def test_multiple_limits_are_all_or_nothing(self, store):
+        rules = [("rate_limit:{user:a}:api:60", 2, 60), ("rate_limit:{user:a}:api:3600", 10, 3600)]
+        assert store.hit(rules, now=1000)[0]
+        assert store.hit(rules, now=1001)[0]
+
+        allowed, infos = store.hit(rules, now=1002)
+        assert not allowed
+        assert infos[0]["retry_after"] == 58
+        # A requisição bloqueada não consome o limite por hora
+        assert infos[1]["remaining"] == 8
+
+    def test_keys_are_independent(self, store):
+        store.hit([("rate_limit:{ip:1}:login:60", 1, 60)], now=1000)
+        assert store.hit([("rate_limit:{ip:2}:login:60", 1, 60)], now=1000)[0]
+
+
+class TestTokenBucketStore:
+    """Fallback em memória: recomposição, limites combinados e memória limitada"""
+
+    def test_bucket_refills_over_window(self):
+        store = TokenBucketStore()
+        rules = [("rate_limit:{ip:1}:login:60", 2, 60)]
+        assert store.hit(rules, now=1000)[0]
+        assert store.hit(rules, now=1000)[0]
+
+        allowed, infos = store.hit(rules, now=1000)
+        assert not allowed
+        # Uma ficha a cada 30 s
+        assert infos[0]["retry_after"] == 30
+        assert store.hit(rules, now=1030)[0]
+
+    def test_multiple_limits_are_all_or_nothing(self):
+        store = TokenBucketStore()
+        rules = [("rate_limit:{user:a}:api:60", 1, 60), ("rate_limit:{user:a}:api:3600", 10, 3600)]
+        assert store.hit(rules, now=1000)[0]
+
+        allowed, infos = store.hit(rules, now=1001)
+        assert not allowed
+        assert infos[1]["remaining"] == 9
+
+    def test_full_buckets_expire_without_scan(self):
+        store = TokenBucketStore(shards=4)
+        for i in range(10):
+            store.hit([(f"rate_limit:{{ip:{i}}}:login:60", 5, 60)], now=1000)
+        assert len(store) == 10
+
+        # Uma ficha usada de 5 volta em 12 s
+        assert store.cleanup(now=1012) == 10
+        assert len(store) == 0
+
+    def test_entry_cap_evicts_least_recently_used(self):
+        store = TokenBucketStore(shards=1, max_entries=3)
+        for i in range(3):
+            store.hit([(f"rate_limit:{{ip:{i}}}:login:60", 1, 60)], now=1000)
+        # ip:0 usado de novo: ip:1 passa a ser o menos recente
+        store.hit([("rate_limit:{ip:0}:login:60", 1, 60)], now=1001)
+        store.hit([("rate_limit:{ip:3}:login:60", 1, 60)], now=1002)
+
+        assert len(store) == 3
+        assert store.hit([("rate_limit:{ip:1}:login:60", 1, 60)], now=1003)[0]
+        assert not store.hit([("rate_limit:{ip:0}:login:60", 1, 60)], now=1003)[0]
@@ -0,0 +1,95 @@
+"""
+Testes para o repositório com mapa de identidade por requisição
+"""
+import os
+import sys
+
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.repository import InMemoryBackend, Repository, get_repository, init_repository
+from utils.cache import get_cached_user, user_cache
+
+
+def make_backend():
+    return InMemoryBackend({
+        "users": {
+            "admin1": {"name": "Admin", "role": "admin", "password": "hash"},
+            "amb1": {"name": "Ana", "role": "embaixadora"},
+        },
+        "indications": {"ind1": {"client_name": "Cliente", "ambassadorId": "amb1"}},
+    })
+
+
+class TestRepository:
+    """Testes para o mapa de identidade"""
+
+    def test_document_is_read_once(self):
+        backend = make_backend()
+        repository = Repository(backend)
+
+        assert repository.get("indications", "ind1")["client_name"] == "Cliente"
+        assert repository.get("indications", "ind1")["client_name"] == "Cliente"
+        assert backend.calls == 1
+
+    def test_get_many_fetches_only_missing_ids(self):
+        backend = make_backend()
+        repository = Repository(backend)
+        repository.get("users", "amb1")
+
+        users = repository.get_many("users", ["amb1", "admin1", "amb1", "ghost"])
+
+        assert set(users) == {"amb1", "admin1"}
+        assert backend.calls == 2
+        # Documento inexistente também fica registrado
+        assert repository.get("users", "ghost") is None
+        assert backend.calls == 2
+
+    def test_returned_data_is_a_copy(self):
+        repository = Repository(make_backend())
+        repository.get("users", "amb1")["name"] = "Outro"
+        assert repository.get("users", "amb1")["name"] == "Ana"
+
+    def test_forget_after_write(self):
+        backend = make_backend()
+        repository = Repository(backend)
+        repository.get("users", "amb1")
+
+        backend.collections["users"]["amb1"]["name"] = "Ana Maria"
+        repository.forget("users", "amb1")
+
+        assert repository.get("users", "amb1")["name"] == "Ana Maria"
+        assert backend.calls == 2
+
+
+class TestRequestScope:
+    """O mapa vive durante uma requisição e é descartado ao final"""
+
+    def setup_method(self):
+        self.backend = make_backend()
+        self.app = Flask(__name__)
+        init_repository(self.app, self.backend)
+        user_cache.clear()
+
+    def teardown_method(self):
+        user_cache.clear()
+
+    def test_same_repository_within_request(self):
+        with self.app.test_request_context("/"):
+            assert get_repository() is get_repository()
+            get_repository().get("indications", "ind1")
+            get_repository().get("indications", "ind1")
+        with self.app.test_request_context("/"):
+            get_repository().get("indications", "ind1")
+
+        assert self.backend.calls == 2
+
+    def test_user_cache_shares_the_request_read(self):
+        with self.app.test_request_context("/"):
+            user = get_cached_user(None, "admin1")
+            target = get_repository().get("users", "admin1")
+
+        assert user == {"name": "Admin", "role": "admin", "id": "admin1"}
+        assert target["password"] == "hash"
+        assert self.backend.calls == 1
@@ -0,0 +1,100 @@
+"""
+Testes para o agendador de tarefas de manutenção
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.cloud.firestore")
+
+from scheduler import CronTrigger, IntervalTrigger, LocalLease, Scheduler
+
+
+class TestTriggers:
+    """Testes para os gatilhos de intervalo e cron"""
+
+    def test_interval_is_aligned_to_clock(self):
+        trigger = IntervalTrigger(300)
+        assert trigger.next_run(datetime(2025, 7, 1, 10, 2, 13)) == datetime(2025, 7, 1, 10, 5)
+        assert trigger.next_run(datetime(2025, 7, 1, 10, 5)) == datetime(2025, 7, 1, 10, 10)
+
+    def test_cron_every_30_minutes(self):
+        trigger = CronTrigger("*/30 * * * *")
+        assert trigger.next_run(datetime(2025, 7, 1, 10, 2)) == datetime(2025, 7, 1, 10, 30)
+        assert trigger.next_run(datetime(2025, 7, 1, 10, 30)) == datetime(2025, 7, 1, 11, 0)
+
+    def test_cron_daily_rolls_over_month_and_year(self):
+        trigger = CronTrigger("30 3 * * *")
+        assert trigger.next_run(datetime(2025, 12, 31, 4, 0)) == datetime(2026, 1, 1, 3, 30)
+
+    def test_cron_weekday_and_ranges(self):
+        # Segunda a sexta às 8h e 18h
+        trigger = CronTrigger("0 8,18 * * 1-5")
+        # 2025-07-05 é sábado
+        assert trigger.next_run(datetime(2025, 7, 4, 19, 0)) == datetime(2025, 7, 7, 8, 0)
+
+    def test_cron_rejects_invalid_expression(self):
+        with pytest.raises(ValueError):
+            CronTrigger("* * *")
+        with pytest.raises(ValueError):
+            CronTrigger("61 * * * *")
+
+
+class TestScheduler:
+    """Testes para execução, exclusividade entre workers e métricas"""
+
+    def test_shared_job_runs_once_across_workers(self):
+        lease = LocalLease()
+        calls = []
+        workers = [Scheduler(lease, owner=f"w{i}") for i in range(3)]
+        for worker in workers:
+            worker.add_job("sweep", lambda: calls.append(1), IntervalTrigger(60))
+
+        moment = IntervalTrigger(60).next_run(datetime.now())
+        executed = [worker.run_pending(moment) for worker in workers]
+
+        assert len(calls) == 1
+        assert sum(len(names) for names in executed) == 1
+        assert sum(worker.jobs["sweep"].metrics["skipped"] for worker in workers) == 2
+
+    def test_local_job_runs_in_every_worker(self):
+        lease = LocalLease()
+        calls = []
+        workers = [Scheduler(lease, owner=f"w{i}") for i in range(2)]
+        for worker in workers:
+            worker.add_job("trim", lambda: calls.append(1), IntervalTrigger(60), leader_only=False)
+
+        moment = IntervalTrigger(60).next_run(datetime.now())
+        for worker in workers:
+            worker.run_pending(moment)
+
+        assert len(calls) == 2
+
+    def test_failure_is_recorded_and_next_run_advances(self):
+        scheduler = Scheduler(owner="w0")
+
+        def failing():
+            raise RuntimeError("firestore indisponível")
+
+        job = scheduler.add_job("reconcile", failing, IntervalTrigger(60))
+        slot = job.next_run
+        scheduler.run_pending(slot)
+
+        stats = scheduler.stats()["jobs"]["reconcile"]
+        assert stats["failures"] == 1 and stats["runs"] == 0
+        assert stats["last_error"] == "firestore indisponível"
+        assert job.next_run > slot
+
+    def test_result_is_kept_in_metrics(self):
+        scheduler = Scheduler(owner="w0")
+        job = scheduler.add_job("overdue", lambda: {"updated": 3, "done": True}, IntervalTrigger(60))
+        scheduler.run_pending(job.next_run)
+
+        stats = scheduler.stats()["jobs"]["overdue"]
+        assert stats["runs"] == 1
+        assert stats["last_result"] == {"updated": 3, "done": True}
+        assert stats["last_duration"] is not None
@@ -0,0 +1,93 @@
+"""
+Testes para as respostas NDJSON em streaming
+"""
+import json
+import os
+import sys
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.streaming import wants_ndjson, ndjson_response
+
+
+def create_test_app(source):
+    app = Flask(__name__)
+    consumed = []
+
+    def items():
+        for item in source():
+            consumed.append(item["id"])
+            yield item
+
+    @app.route("/items")
+    def list_items():
+        if wants_ndjson():
+            return ndjson_response(items())
+        return jsonify(list(items()))
+
+    app.consumed = consumed
+    return app
+
+
+def rows():
+    return [{"id": "a", "createdAt": datetime(2025, 1, 31, 10, 0)}, {"id": "b"}]
+
+
+class TestNdjsonResponses:
+    """Testes para o modo de exportação em streaming"""
+
+    def test_stream_param_returns_one_document_per_line(self):
+        client = create_test_app(rows).test_client()
+        response = client.get("/items?stream=1")
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)["id"] for line in lines] == ["a", "b"]
+        assert json.loads(lines[0])["createdAt"] == "2025-01-31T10:00:00"
+
+    def test_accept_header_selects_ndjson(self):
+        client = create_test_app(rows).test_client()
+        response = client.get("/items", headers={"Accept": "application/x-ndjson"})
+        assert response.mimetype == "application/x-ndjson"
+
+        response = client.get("/items")
+        assert response.mimetype == "application/json"
+
+    def test_documents_are_consumed_lazily(self):
+        app = create_test_app(rows)
+        response = app.test_client().get("/items?stream=1", buffered=False)
+
+        # Apenas o primeiro item é lido antes do envio começar
+        assert app.consumed == ["a"]
+        chunks = list(response.response)
+        assert len(chunks) == 2
+        assert app.consumed == ["a", "b"]
+        response.close()
+
+    def test_empty_source_returns_empty_body(self):
+        client = create_test_app(lambda: []).test_client()
+        response = client.get("/items?stream=1")
+        assert response.status_code == 200
+        assert response.get_data() == b""
+
+    def test_error_after_first_item_becomes_last_line(self):
+        def failing():
+            yield {"id": "a"}
+            raise RuntimeError("consulta interrompida")
+
+        client = create_test_app(failing).test_client()
+        lines = client.get("/items?stream=1").get_data(as_text=True).splitlines()
+        assert json.loads(lines[-1]) == {"error": "consulta interrompida"}
+
+    def test_error_before_first_item_propagates(self):
+        def failing():
+            raise RuntimeError("índice ausente")
+            yield  # pragma: no cover
+
+        app = create_test_app(failing)
+        app.config["PROPAGATE_EXCEPTIONS"] = False
+        assert app.test_client().get("/items?stream=1").status_code == 500
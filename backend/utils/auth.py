@@ -4,9 +4,12 @@ Utilitários para autenticação e autorização
 import bcrypt
 from functools import wraps
 from flask import request
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from services.firestore_service import UserService
+from flask_jwt_extended import get_jwt_identity, get_jwt
+from utils.jwt_context import jwt_required
+from config.firebase import firebase_config
+from utils.cache import get_cached_user
 from utils.responses import forbidden_response, unauthorized_response
+from utils.serializers import serialize_firestore_data
 
 
 def hash_password(password: str) -> str:
@@ -30,8 +33,7 @@ def require_role(required_role: str):
         def decorated_function(*args, **kwargs):
             try:
                 current_user_id = get_jwt_identity()
-                user_service = UserService()
-                user = user_service.get_by_id(current_user_id)
+                user = get_cached_user(firebase_config.db, current_user_id)
                 
                 if not user:
                     return unauthorized_response("Usuário não encontrado")
@@ -61,8 +63,8 @@ def get_current_user():
     """Retorna o usuário atual autenticado"""
     try:
         current_user_id = get_jwt_identity()
-        user_service = UserService()
-        return user_service.get_by_id(current_user_id)
+        user = get_cached_user(firebase_config.db, current_user_id)
+        return serialize_firestore_data(user) if user else None
     except Exception:
         return None
 
@@ -0,0 +1,104 @@
+"""
+Cache em memória (por processo) com TTL e despejo LRU
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from services.repository import get_repository
+
+
+class TTLCache:
+    """Cache limitado em tamanho, com expiração por TTL e despejo do item menos usado"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retorna o valor em cache ou None se ausente/expirado"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Retorna do cache ou carrega com loader (resultados None não são guardados)"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Documento do usuário autenticado (sem senha), consultado em quase toda rota.
+# TTL curto: alterações feitas por outros processos aparecem em no máximo 30s.
+user_cache = TTLCache(maxsize=2048, ttl=30.0)
+
+
+def get_cached_user(db, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Busca o documento do usuário passando pelo cache
+
+    Args:
+        db: Cliente Firestore
+        user_id: ID do usuário
+
+    Returns:
+        Cópia dos dados do usuário (com "id" e sem "password") ou None se não existir
+    """
+    if not user_id:
+        return None
+
+    def load():
+        # Pelo mapa da requisição: a mesma leitura serve às demais buscas do usuário
+        user_data = get_repository(db).get("users", user_id)
+        if user_data is None:
+            return None
+        user_data.pop("password", None)
+        user_data["id"] = user_id
+        return user_data
+
+    user_data = user_cache.get_or_load(user_id, load)
+    return dict(user_data) if user_data is not None else None
+
+
+def invalidate_user(user_id: str) -> None:
+    """Remove o usuário do cache (e do mapa da requisição) após escrita no seu documento"""
+    user_cache.invalidate(user_id)
+    get_repository().forget("users", user_id)
@@ -0,0 +1,74 @@
+"""
+Codificação JSON das respostas em uma única passada
+
+Tipos do Firestore (DatetimeWithNanoseconds, GeoPoint, DocumentReference) e
+datetime são convertidos durante a própria codificação, sem percorrer os
+dados antes com serialize_firestore_data. Usa orjson quando instalado e o
+módulo json da biblioteca padrão como alternativa.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+try:
+    from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+except ImportError:  # pragma: no cover - depende do ambiente
+    DocumentReference = GeoPoint = None
+
+
+def encode_value(value: Any) -> Any:
+    """Converte tipos não nativos do JSON (chamado pelo codificador só quando necessário)"""
+    # Cobre DatetimeWithNanoseconds, que o orjson não reconhece por ser subclasse
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if GeoPoint is not None and isinstance(value, GeoPoint):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    if DocumentReference is not None and isinstance(value, DocumentReference):
+        return value.path
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Objeto do tipo {type(value).__name__} não é serializável em JSON")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any, indent: bool = False) -> str:
+        """Serializa para str JSON com chaves ordenadas (ETag estável)"""
+        options = (_ORJSON_OPTIONS | orjson.OPT_INDENT_2) if indent else _ORJSON_OPTIONS
+        return orjson.dumps(obj, default=encode_value, option=options).decode("utf-8")
+
+    def loads(data: Any) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any, indent: bool = False) -> str:
+        """Serializa para str JSON com chaves ordenadas (ETag estável)"""
+        return json.dumps(obj, default=encode_value, sort_keys=True, ensure_ascii=False,
+                          indent=2 if indent else None, separators=None if indent else (",", ":"))
+
+    def loads(data: Any) -> Any:
+        return json.loads(data)
+
+
+class FirestoreJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask que usa o codificador acima em jsonify e request.get_json"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj, indent=bool(kwargs.get("indent")))
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + "\n", mimetype=self.mimetype)
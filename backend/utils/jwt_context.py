@@ -0,0 +1,71 @@
+"""
+JWT verificado uma vez por requisição
+
+init_jwt_context(app) registra um before_request que decodifica e verifica o
+token (assinatura e expiração) e guarda identidade e claims em flask.g. O
+rate limiting, a auditoria e o decorador jwt_required deste módulo leem de lá,
+sem verificar o token de novo; get_jwt_identity() e get_jwt() do
+flask_jwt_extended continuam funcionando nas rotas.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.config import config
+
+
+def load_request_jwt() -> None:
+    """Verifica o JWT da requisição (se houver) e guarda o resultado em g"""
+    g.jwt_checked = True
+    g.jwt_identity = None
+    g.jwt_claims = {}
+    g.jwt_error = None
+    try:
+        result = verify_jwt_in_request(optional=True)
+    except Exception as e:
+        # Token inválido ou expirado: o erro só é levantado nas rotas que exigem JWT
+        g.jwt_error = e
+        return
+    if result:
+        g.jwt_claims = result[1]
+        g.jwt_identity = get_jwt_identity()
+
+
+def _ensure_loaded() -> None:
+    # Fora de apps com init_jwt_context (ex.: testes), verifica na primeira consulta
+    if not g.get('jwt_checked'):
+        load_request_jwt()
+
+
+def current_identity() -> Optional[str]:
+    """Identidade do JWT da requisição (None sem token válido)"""
+    _ensure_loaded()
+    return g.jwt_identity
+
+
+def current_claims() -> Dict[str, Any]:
+    """Claims do JWT da requisição ({} sem token válido)"""
+    _ensure_loaded()
+    return g.jwt_claims
+
+
+def jwt_required() -> Callable:
+    """Mesmo contrato de flask_jwt_extended.jwt_required(), usando a verificação já feita"""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            _ensure_loaded()
+            if g.jwt_error is not None:
+                raise g.jwt_error
+            if not g.jwt_claims and request.method not in config.exempt_methods:
+                # Sem token: a própria biblioteca levanta o erro (sem decodificar nada)
+                verify_jwt_in_request()
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def init_jwt_context(app) -> None:
+    """Registra a verificação do JWT no início de cada requisição"""
+    app.before_request(load_request_jwt)
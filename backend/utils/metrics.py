@@ -0,0 +1,336 @@
+"""
+Métricas por requisição: latência, leituras/escritas do Firestore e bytes enviados
+
+- InstrumentedFirestoreAPI envolve o cliente GAPIC do Firestore (ver
+  config/firebase.py) e conta documentos lidos, escritas, consultas e o tempo
+  gasto nas chamadas.
+- init_metrics(app) mede cada requisição, devolve o cabeçalho Server-Timing e
+  expõe GET /metrics no formato texto do Prometheus (histogramas por rota).
+  A rota só é registrada com METRICS_TOKEN definido e exige
+  "Authorization: Bearer <token>".
+
+As métricas ficam na memória do worker: com vários workers, cada scrape vê o
+worker que atendeu.
+"""
+import hmac
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestStats:
+    """Acumulado de uma requisição"""
+
+    __slots__ = ("started", "reads", "writes", "queries", "firestore_seconds", "response_bytes")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.firestore_seconds = 0.0
+        self.response_bytes = 0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Estatísticas da requisição em andamento (None fora de requisições)"""
+    return _current.get()
+
+
+# Registro (por processo)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotônico com rótulos"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = _format_labels(dict(zip(self.label_names, key)))
+                lines.append(f"{self.name}{labels} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Histograma cumulativo com rótulos"""
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float], label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.label_names = label_names
+        # rótulos -> [contagens por bucket, soma, total]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels) -> Optional[Dict[str, Any]]:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+            return {"count": series[2], "sum": series[1]}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = dict(zip(self.label_names, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels({**labels, "le": _format_number(bound)})
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_number(total)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas HTTP e do Firestore expostas em /metrics"""
+
+    def __init__(self):
+        route_labels = ("method", "endpoint")
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Tempo de resposta por rota",
+            LATENCY_BUCKETS, route_labels + ("status",))
+        self.response_size = Histogram(
+            "http_response_size_bytes", "Bytes enviados por resposta", SIZE_BUCKETS, route_labels)
+        self.request_reads = Histogram(
+            "firestore_reads_per_request", "Documentos lidos do Firestore por requisição",
+            COUNT_BUCKETS, route_labels)
+        self.request_writes = Histogram(
+            "firestore_writes_per_request", "Escritas no Firestore por requisição", COUNT_BUCKETS, route_labels)
+        self.request_queries = Histogram(
+            "firestore_queries_per_request", "Consultas ao Firestore por requisição", COUNT_BUCKETS, route_labels)
+        self.request_firestore_time = Histogram(
+            "firestore_time_per_request_seconds", "Tempo em chamadas ao Firestore por requisição",
+            LATENCY_BUCKETS, route_labels)
+        # Totais do processo, incluindo agendador e outbox (fora de requisições)
+        self.reads = Counter("firestore_reads_total", "Documentos lidos do Firestore")
+        self.writes = Counter("firestore_writes_total", "Escritas no Firestore")
+        self.queries = Counter("firestore_queries_total", "Consultas ao Firestore", ("kind",))
+
+    def observe_request(self, method: str, endpoint: str, status: int, stats: RequestStats,
+                        duration: float) -> None:
+        labels = {"method": method, "endpoint": endpoint}
+        self.request_duration.observe(duration, status=status, **labels)
+        self.response_size.observe(stats.response_bytes, **labels)
+        self.request_reads.observe(stats.reads, **labels)
+        self.request_writes.observe(stats.writes, **labels)
+        self.request_queries.observe(stats.queries, **labels)
+        self.request_firestore_time.observe(stats.firestore_seconds, **labels)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.request_duration, self.response_size, self.request_reads, self.request_writes,
+                       self.request_queries, self.request_firestore_time, self.reads, self.writes, self.queries):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def record_firestore(reads: int = 0, writes: int = 0, query: Optional[str] = None, seconds: float = 0.0) -> None:
+    """Soma uma chamada ao Firestore na requisição atual e nos totais do processo"""
+    if reads:
+        registry.reads.inc(reads)
+    if writes:
+        registry.writes.inc(writes)
+    if query:
+        registry.queries.inc(kind=query)
+
+    stats = _current.get()
+    if stats is not None:
+        stats.reads += reads
+        stats.writes += writes
+        stats.queries += 1 if query else 0
+        stats.firestore_seconds += seconds
+
+
+# Cliente Firestore instrumentado
+
+class _CountingStream:
+    """Iterador de respostas em stream que conta documentos e tempo de espera"""
+
+    def __init__(self, stream, is_read: Callable[[Any], bool]):
+        self._stream = stream
+        self._is_read = is_read
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            response = next(self._stream)
+        finally:
+            elapsed = time.perf_counter() - started
+        record_firestore(reads=1 if self._is_read(response) else 0, seconds=elapsed)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class InstrumentedFirestoreAPI:
+    """Repassa as chamadas ao cliente GAPIC do Firestore contando leituras, escritas e consultas"""
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def _stream(self, method, is_read, query, args, kwargs):
+        started = time.perf_counter()
+        stream = method(*args, **kwargs)
+        record_firestore(query=query, seconds=time.perf_counter() - started)
+        return _CountingStream(iter(stream), is_read)
+
+    def batch_get_documents(self, *args, **kwargs):
+        return self._stream(self._api.batch_get_documents, lambda response: "found" in response,
+                            None, args, kwargs)
+
+    def run_query(self, *args, **kwargs):
+        return self._stream(self._api.run_query, lambda response: "document" in response,
+                            "query", args, kwargs)
+
+    def run_aggregation_query(self, *args, **kwargs):
+        # Cobrada como uma leitura a cada 1000 entradas de índice: conta-se uma
+        return self._stream(self._api.run_aggregation_query, lambda response: "result" in response,
+                            "aggregation", args, kwargs)
+
+    def list_documents(self, *args, **kwargs):
+        started = time.perf_counter()
+        pager = self._api.list_documents(*args, **kwargs)
+        record_firestore(query="list", seconds=time.perf_counter() - started)
+        return _CountingStream(iter(pager), lambda document: True)
+
+    def commit(self, *args, **kwargs):
+        request = kwargs.get("request") or (args[0] if args else None) or {}
+        writes = request.get("writes") if isinstance(request, dict) else getattr(request, "writes", None)
+        started = time.perf_counter()
+        try:
+            return self._api.commit(*args, **kwargs)
+        finally:
+            record_firestore(writes=len(writes or ()), seconds=time.perf_counter() - started)
+
+
+# Middleware Flask
+
+def _endpoint_label(request) -> str:
+    # Rota com parâmetros (/users/<user_id>), não a URL: mantém a cardinalidade baixa
+    return request.url_rule.rule if request.url_rule is not None else "não mapeada"
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """Valor do cabeçalho Server-Timing (durações em ms)"""
+    return (f'app;dur={total * 1000:.1f}, '
+            f'firestore;dur={stats.firestore_seconds * 1000:.1f};'
+            f'desc="{stats.reads} leituras, {stats.writes} escritas, {stats.queries} consultas"')
+
+
+def _count_bytes(body: Iterable[bytes], stats: RequestStats):
+    for chunk in body:
+        stats.response_bytes += len(chunk)
+        yield chunk
+
+
+def init_metrics(app, metrics_registry: MetricsRegistry = None, token: Optional[str] = None) -> None:
+    """Registra a medição das requisições e, com token (ou METRICS_TOKEN), a rota GET /metrics"""
+    from flask import Response, request
+
+    metrics_registry = metrics_registry or registry
+    token = token or os.environ.get("METRICS_TOKEN")
+
+    @app.before_request
+    def _start_request_stats():
+        _current.set(RequestStats())
+
+    @app.after_request
+    def _finish_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+
+        method, endpoint, status = request.method, _endpoint_label(request), response.status_code
+
+        def observe():
+            _current.set(None)
+            metrics_registry.observe_request(method, endpoint, status, stats,
+                                             time.perf_counter() - stats.started)
+
+        if response.is_streamed:
+            # Leituras feitas durante o stream entram no histograma ao fechar a resposta
+            response.response = _count_bytes(response.response, stats)
+        else:
+            stats.response_bytes = response.content_length or 0
+        response.headers["Server-Timing"] = server_timing(stats, time.perf_counter() - stats.started)
+        response.call_on_close(observe)
+        return response
+
+    # Sem token a rota não existe: as métricas expõem rotas e volume de uso
+    if not token:
+        return
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response("Acesso negado\n", status=403, mimetype="text/plain")
+        return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,65 @@
+"""
+Respostas NDJSON (um documento JSON por linha) para exportações grandes
+
+Os documentos são codificados e enviados à medida que chegam de
+query.stream(), sem montar a lista completa em memória. O modo é pedido com
+?stream=1 ou com o header Accept: application/x-ndjson.
+"""
+from itertools import chain
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from flask import Response, request, stream_with_context
+
+from .json_provider import dumps
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def wants_ndjson() -> bool:
+    """Indica se a requisição atual pediu a resposta em streaming"""
+    if request.args.get("stream", "").lower() in ("1", "true"):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(items: Iterable[Any], transform: Optional[Callable[[Any], Any]] = None) -> Response:
+    """
+    Cria a resposta NDJSON a partir de um iterável (ex.: query.stream())
+
+    O primeiro item é lido antes de devolver a resposta, para que erros da
+    consulta (índice ausente, permissão) ainda virem um status de erro. Um
+    erro no meio do envio é reportado como última linha {"error": ...}.
+
+    Args:
+        items: Documentos ou dicionários, consumidos sob demanda
+        transform: Conversão aplicada a cada item antes de codificar
+
+    Returns:
+        Response em chunks com mimetype application/x-ndjson
+    """
+    iterator = iter(items)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return Response("", mimetype=NDJSON_MIMETYPE)
+
+    def generate() -> Iterator[str]:
+        try:
+            for item in chain((first,), iterator):
+                yield dumps(transform(item) if transform else item) + "\n"
+        except Exception as e:
+            print(f"Erro durante resposta em streaming: {str(e)}")
+            yield dumps({"error": str(e)}) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    # Evita que proxies (nginx) acumulem a resposta antes de repassar
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+
+def doc_to_item(doc) -> dict:
+    """Converte um snapshot em dicionário com "id" """
+    data = doc.to_dict()
+    data["id"] = doc.id
+    return data
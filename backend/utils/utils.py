@@ -1,5 +1,5 @@
 from datetime import datetime
-from flask import jsonify
+from flask import jsonify, request, has_request_context
 
 def serialize_firestore_data(data):
     """Serializa dados do Firestore para JSON"""
@@ -20,11 +20,27 @@ def serialize_firestore_data(data):
     else:
         return data
 
+def make_conditional_response(response):
+    """
+    Adiciona ETag forte (hash do corpo) e responde 304 se o If-None-Match bater
+
+    As respostas dependem do usuário do token, por isso o cache é privado e
+    sempre revalidado (no-cache); o 304 economiza o corpo, não a consulta.
+    """
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Authorization")
+    return response.make_conditional(request)
+
+
 def safe_jsonify(data, status_code=200):
     """Wrapper seguro para jsonify"""
     try:
         response = jsonify(data)
         response.status_code = status_code
+        # Apenas leituras bem-sucedidas podem ser revalidadas pelo cliente
+        if status_code == 200 and has_request_context() and request.method in ("GET", "HEAD"):
+            response = make_conditional_response(response)
         return response
     except Exception as e:
         error_response = jsonify({"error": f"Erro na serialização: {str(e)}"})
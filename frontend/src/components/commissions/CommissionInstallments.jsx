@@ -129,15 +129,22 @@ const CommissionInstallments = () => {
 
   const checkOverdueInstallments = async () => {
     try {
-      await axios.post(`${API_BASE_URL}/commission-installments/check-overdue`, {}, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      // A varredura devolve done=false quando para por tempo; repetir até terminar
+      let updated = 0;
+      let done = false;
+      while (!done) {
+        const response = await axios.post(`${API_BASE_URL}/commission-installments/check-overdue`, {}, {
+          headers: {
+            'Authorization': `Bearer ${localStorage.getItem('token')}`
+          }
+        });
+        updated += response.data.updated || 0;
+        done = response.data.done !== false;
+      }
       
       fetchInstallments();
       fetchSummary();
-      alert('Verificação de parcelas em atraso concluída');
+      alert(`Verificação de parcelas em atraso concluída: ${updated} parcelas marcadas como atrasadas`);
     } catch (error) {
       console.error('Erro ao verificar parcelas em atraso:', error);
       alert('Erro ao verificar parcelas em atraso');
@@ -1,99 +1,130 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
+import { subscribeToChanges } from '../services/changeFeed';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
 
-// Hook personalizado para sincronização em tempo real com Firestore
+// Endpoints de lista que recebem as alterações aplicadas localmente
+const DELTA_ENDPOINTS = {
+  indications: 'indications',
+  commissions: 'commissions',
+  users: 'users'
+};
+
+// Endpoints enriquecidos no servidor: documento novo precisa dos campos do join
+const JOINED_ENDPOINTS = new Set(['commissions']);
+
+// Espera antes de recarregar endpoints agregados (ex.: dashboards) após alterações
+const REFETCH_DEBOUNCE_MS = 1500;
+
+const applyChange = (items, change, allowInsert) => {
+  const index = items.findIndex((item) => item.id === change.id);
+
+  if (change.op === 'delete') {
+    return index === -1 ? items : items.filter((item) => item.id !== change.id);
+  }
+
+  if (index === -1) {
+    return allowInsert ? [...items, { ...change.data, id: change.id }] : items;
+  }
+
+  const next = [...items];
+  next[index] = { ...items[index], ...change.data, id: change.id };
+  return next;
+};
+
+// Hook personalizado para sincronização em tempo real com Firestore:
+// carrega o endpoint uma vez e depois aplica as alterações recebidas pelo feed SSE
 export const useFirestoreRealtime = (collection, filters = [], dependencies = []) => {
   const [data, setData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const refetchTimer = useRef(null);
 
-  useEffect(() => {
-    let intervalId;
-    
-    const fetchData = async () => {
-      try {
-        const token = localStorage.getItem('access_token');
-        if (!token) {
-          setError('Token de acesso não encontrado');
-          setLoading(false);
-          return;
-        }
+  const fetchData = useCallback(async () => {
+    try {
+      const token = localStorage.getItem('access_token');
+      if (!token) {
+        setError('Token de acesso não encontrado');
+        setLoading(false);
+        return;
+      }
 
-        const response = await fetch(`${API_BASE_URL}/${collection}`, {
-          method: 'GET',
-          headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
-          }
-        });
-
-        if (response.ok) {
-          const result = await response.json();
-          setData(result);
-          setError(null);
-        } else {
-          const errorData = await response.json();
-          setError(errorData.error || 'Erro ao buscar dados');
+      const response = await fetch(`${API_BASE_URL}/${collection}`, {
+        method: 'GET',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json'
         }
-      } catch (err) {
-        setError('Erro de conexão');
-        console.error('Erro ao buscar dados:', err);
-      } finally {
-        setLoading(false);
+      });
+
+      if (response.ok) {
+        const result = await response.json();
+        setData(result);
+        setError(null);
+      } else {
+        const errorData = await response.json();
+        setError(errorData.error || 'Erro ao buscar dados');
       }
-    };
+    } catch (err) {
+      setError('Erro de conexão');
+      console.error('Erro ao buscar dados:', err);
+    } finally {
+      setLoading(false);
+    }
+  }, [collection]);
+
+  const scheduleRefetch = useCallback(() => {
+    if (refetchTimer.current) return;
+    refetchTimer.current = setTimeout(() => {
+      refetchTimer.current = null;
+      fetchData();
+    }, REFETCH_DEBOUNCE_MS);
+  }, [fetchData]);
 
+  useEffect(() => {
     // Buscar dados inicialmente
     fetchData();
 
-    // Configurar polling para simular tempo real (a cada 5 segundos)
-    intervalId = setInterval(fetchData, 5000);
+    const deltaCollection = DELTA_ENDPOINTS[collection];
+
+    const unsubscribe = subscribeToChanges((event) => {
+      if (event.type === 'reset') {
+        fetchData();
+        return;
+      }
+      if (event.type !== 'change') return;
+
+      if (!deltaCollection) {
+        // Endpoint agregado: recarrega uma vez após uma rajada de alterações
+        scheduleRefetch();
+        return;
+      }
+      if (event.collection !== deltaCollection) return;
+
+      const allowInsert = !JOINED_ENDPOINTS.has(collection);
+      setData((current) => {
+        if (!Array.isArray(current)) return current;
+        if (!allowInsert && event.op === 'upsert' && !current.some((item) => item.id === event.id)) {
+          scheduleRefetch();
+          return current;
+        }
+        return applyChange(current, event, allowInsert);
+      });
+    });
 
     // Cleanup
     return () => {
-      if (intervalId) {
-        clearInterval(intervalId);
+      unsubscribe();
+      if (refetchTimer.current) {
+        clearTimeout(refetchTimer.current);
+        refetchTimer.current = null;
       }
     };
-  }, [...dependencies]);
+  }, [collection, fetchData, scheduleRefetch, ...dependencies]);
 
   const refetch = () => {
     setLoading(true);
     // Força uma nova busca imediatamente
-    const fetchData = async () => {
-      try {
-        const token = localStorage.getItem('access_token');
-        if (!token) {
-          setError('Token de acesso não encontrado');
-          setLoading(false);
-          return;
-        }
-
-        const response = await fetch(`${API_BASE_URL}/${collection}`, {
-          method: 'GET',
-          headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
-          }
-        });
-
-        if (response.ok) {
-          const result = await response.json();
-          setData(result);
-          setError(null);
-        } else {
-          const errorData = await response.json();
-          setError(errorData.error || 'Erro ao buscar dados');
-        }
-      } catch (err) {
-        setError('Erro de conexão');
-        console.error('Erro ao buscar dados:', err);
-      } finally {
-        setLoading(false);
-      }
-    };
-
     fetchData();
   };
 
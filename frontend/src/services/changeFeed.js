@@ -0,0 +1,112 @@
+const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
+
+// Conexão única (por aba) com o feed de alterações do backend via SSE.
+// Usa fetch com streaming em vez de EventSource para enviar o header Authorization.
+const listeners = new Set();
+let controller = null;
+let lastEventId = null;
+let retryDelay = 1000;
+let retryTimer = null;
+
+const MAX_RETRY_DELAY = 30000;
+
+const emit = (event) => {
+  listeners.forEach((listener) => listener(event));
+};
+
+const parseEvent = (block) => {
+  const event = { type: 'message', id: null, data: '' };
+  block.split('\n').forEach((line) => {
+    if (!line || line.startsWith(':')) return;
+    const separator = line.indexOf(':');
+    const field = separator === -1 ? line : line.slice(0, separator);
+    const value = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+    if (field === 'event') event.type = value;
+    if (field === 'id') event.id = value;
+    if (field === 'data') event.data += value;
+  });
+  return event;
+};
+
+const scheduleReconnect = () => {
+  if (listeners.size === 0 || retryTimer) return;
+  retryTimer = setTimeout(() => {
+    retryTimer = null;
+    connect();
+  }, retryDelay);
+  retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+};
+
+const connect = async () => {
+  const token = localStorage.getItem('access_token');
+  if (!token || controller) return;
+
+  controller = new AbortController();
+  const headers = { Authorization: `Bearer ${token}` };
+  if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+  try {
+    const response = await fetch(`${API_BASE_URL}/changes/stream`, {
+      headers,
+      signal: controller.signal
+    });
+    if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const event = parseEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        if (event.type === 'ready') {
+          retryDelay = 1000;
+          emit({ type: 'ready' });
+        } else if (event.type === 'reset') {
+          // Histórico perdido no servidor: quem escuta deve recarregar os dados
+          lastEventId = null;
+          emit({ type: 'reset' });
+        } else if (event.type === 'change') {
+          lastEventId = event.id;
+          emit({ type: 'change', ...JSON.parse(event.data) });
+        }
+      }
+    }
+  } catch (err) {
+    if (err.name !== 'AbortError') {
+      console.error('Feed de alterações desconectado:', err);
+    }
+  } finally {
+    controller = null;
+    scheduleReconnect();
+  }
+};
+
+const disconnect = () => {
+  if (retryTimer) {
+    clearTimeout(retryTimer);
+    retryTimer = null;
+  }
+  if (controller) {
+    controller.abort();
+  }
+};
+
+// Registra um listener; a conexão abre no primeiro e fecha no último
+export const subscribeToChanges = (listener) => {
+  listeners.add(listener);
+  if (listeners.size === 1) connect();
+
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size === 0) disconnect();
+  };
+};